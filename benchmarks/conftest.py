@@ -0,0 +1,3 @@
+from tests.conftest import lsp_client, lsp_server, lsp_server_port, make_request
+
+__all__ = ['lsp_client', 'lsp_server', 'lsp_server_port', 'make_request']
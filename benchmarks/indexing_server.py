@@ -0,0 +1,58 @@
+"""
+Language server for the scheduler benchmark: indexes forever from ``initialized``, in a plain task that yields
+every 50 units of work (``task``), or as a scheduled background job (``scheduled``).
+"""
+import asyncio
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any
+
+from lsp import LanguageServer
+from lsp.lsp.messages import InitializedParams, InitializeParams, InitializeResult
+from lsp.scheduler import checkpoint
+
+
+def work() -> None:
+    # one file's worth of indexing
+    end = time.perf_counter() + 0.001
+    while time.perf_counter() < end:
+        pass
+
+
+@dataclass
+class IndexingServer(LanguageServer):
+    mode: str = 'scheduled'
+    _index_task: 'asyncio.Task[None] | None' = None
+
+    async def initialize(self, params: InitializeParams) -> InitializeResult:
+        return InitializeResult(capabilities={})
+
+    async def initialized(self, params: InitializedParams) -> None:
+        if self.mode == 'task':
+            self._index_task = asyncio.create_task(self.chunked())
+        else:
+            self.schedule(self.scheduled())
+
+    async def echo(self, params: dict[str, Any]) -> dict[str, Any]:
+        return params
+
+    async def chunked(self) -> None:
+        while True:
+            for _ in range(50):
+                work()
+            await asyncio.sleep(0)
+
+    async def scheduled(self) -> None:
+        while True:
+            work()
+            await checkpoint()
+
+
+async def amain(mode: str) -> None:
+    async with IndexingServer(mode=mode).serve(port=None) as server:
+        await server.wait()
+
+
+if __name__ == '__main__':
+    asyncio.run(amain(sys.argv[1]))
@@ -0,0 +1,68 @@
+"""
+Client side receive throughput: server output arriving on a subprocess pipe, read back one message at a time. And
+the cost of a short job against a server started for it, compared to one taken from a warm pool.
+"""
+from __future__ import annotations
+
+import asyncio
+import sys
+from typing import Any
+
+import pytest
+from pytest_benchmark.fixture import BenchmarkFixture
+
+from lsp.client import Client, ClientPool, LspProtocolSubprocess
+from lsp.protocol import JsonRpcResponse, Message
+
+
+def responses(size: int, count: int) -> bytes:
+    return b''.join(
+        bytes(Message(content=JsonRpcResponse(jsonrpc='2.0', id=i, result={'text': 'x' * size}))) for i in range(count))
+
+
+@pytest.mark.parametrize('size, count', [(64, 1000), (16 * 1024, 1000), (4 * 1024 * 1024, 1)],
+                         ids=['small', 'large', 'huge'])
+def test_receive(benchmark: BenchmarkFixture, event_loop: asyncio.AbstractEventLoop, size: int, count: int) -> None:
+    data = responses(size, count)
+
+    async def run() -> int:
+        protocol: LspProtocolSubprocess[Any] = LspProtocolSubprocess()
+        # pipes deliver at most this much at a time
+        for i in range(0, len(data), 1 << 16):
+            protocol.pipe_data_received(1, data[i:i + (1 << 16)])
+        for _ in range(count):
+            await protocol.read_message()
+        return len(asyncio.all_tasks())
+
+    # reading doesn't leave tasks behind
+    assert benchmark(lambda: event_loop.run_until_complete(run())) == 1
+
+
+SERVER = [sys.executable, '-m', 'tests.client_server']
+
+
+async def job(client: Client) -> None:
+    assert await client.request('echo', {'job': True}) == {'job': True}
+
+
+def test_job_cold(benchmark: BenchmarkFixture, event_loop: asyncio.AbstractEventLoop) -> None:
+
+    async def run() -> None:
+        async with Client().run(SERVER, timeout=10) as client:
+            await job(client)
+
+    benchmark.pedantic(lambda: event_loop.run_until_complete(run()), rounds=10, warmup_rounds=1)
+
+
+def test_job_pooled(benchmark: BenchmarkFixture, event_loop: asyncio.AbstractEventLoop) -> None:
+    pool = ClientPool(size=1, timeout=10)
+    event_loop.run_until_complete(pool.warm(SERVER))
+
+    async def run() -> None:
+        async with pool.acquire(SERVER) as client:
+            await job(client)
+
+    try:
+        benchmark.pedantic(lambda: event_loop.run_until_complete(run()), rounds=10, warmup_rounds=1)
+    finally:
+        event_loop.run_until_complete(pool.close())
@@ -0,0 +1,62 @@
+"""
+What compressing message content costs and saves: the time to frame and parse a message with each encoding, with
+its size on the wire and how long that takes to send at a few link speeds in ``extra_info``.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any
+
+import pytest
+from pytest_benchmark.fixture import BenchmarkFixture
+
+from lsp.compression import codecs
+from lsp.protocol import JsonRpcRequest, JsonRpcResponse, Message
+
+SOURCE = (Path(__file__).parent.parent / 'lsp' / 'session.py').read_text()
+
+PAYLOADS: dict[str, JsonRpcRequest[Any] | JsonRpcResponse[Any]] = {
+    'didOpen':
+    JsonRpcRequest(
+        jsonrpc='2.0',
+        method='textDocument/didOpen',
+        params={'textDocument': {
+            'uri': 'file:///session.py',
+            'languageId': 'python',
+            'version': 1,
+            'text': SOURCE
+        }}),
+    'completion':
+    JsonRpcResponse(jsonrpc='2.0',
+                    id=1,
+                    result={
+                        'isIncomplete':
+                        False,
+                        'items': [{
+                            'label': f'completion_{i}',
+                            'kind': 3,
+                            'detail': f'def completion_{i}(self, params: Any) -> None',
+                            'sortText': f'{i:05d}',
+                        } for i in range(2000)]
+                    }),
+}
+
+#: link speeds, in megabits a second
+LINKS = [10, 100, 1000]
+
+
+@pytest.mark.parametrize('encoding', [None, *codecs()], ids=lambda encoding: encoding or 'identity')
+@pytest.mark.parametrize('payload', list(PAYLOADS))
+def test_frame(benchmark: BenchmarkFixture, payload: str, encoding: str | None) -> None:
+    content = PAYLOADS[payload]
+
+    def round_trip() -> int:
+        data = bytes(Message(content=content, content_encoding=encoding))
+        Message.parse(data)
+        return len(data)
+
+    size = benchmark(round_trip)
+    benchmark.extra_info['content_bytes'] = Message(content=content).content_len
+    benchmark.extra_info['wire_bytes'] = size
+    for mbit in LINKS:
+        benchmark.extra_info[f'transfer_ms_{mbit}mbit'] = size * 8 / (mbit * 1000)
@@ -0,0 +1,75 @@
+"""
+A thousand edits to a 10k line document: a rename's ``TextEdit[]`` applied in one pass, and the same edits as the
+``contentChanges`` of one ``didChange``, bottom up (as multi-cursor edits are sent, applied in one pass) and top
+down (each applied to the text the previous one left). And the edits a formatter makes to a 50k line file, and those
+for rewriting or reordering all its lines.
+"""
+from __future__ import annotations
+
+import random
+
+import pytest
+from pytest_benchmark.fixture import BenchmarkFixture
+
+from lsp.documents import TextDocument
+from lsp.edits import apply_text_edits, diff_edits
+from lsp.lsp.common import DocumentUri, Position, Range
+from lsp.lsp.server import TextDocumentContentChangeEvent, TextDocumentContentChangeEventRange, TextEdit
+
+DOCUMENT = TextDocument(uri=DocumentUri('file:///big.py'),
+                        language_id='python',
+                        version=1,
+                        text='def generated_function(x: int) -> str:\n' * 10_000)
+# every tenth line's name
+RANGES = [
+    Range(start=Position(line=line, character=4), end=Position(line=line, character=22))
+    for line in range(0, 10_000, 10)
+]
+
+
+def test_text_edits(benchmark: BenchmarkFixture) -> None:
+    edits = [TextEdit(range=range_, newText='renamed') for range_ in reversed(RANGES)]
+    text = benchmark(apply_text_edits, DOCUMENT, edits)
+    assert text.count('renamed') == len(RANGES)
+
+
+@pytest.mark.parametrize('order', ['bottom_up', 'top_down'])
+def test_content_changes(benchmark: BenchmarkFixture, order: str) -> None:
+    # the same length as what they replace, so top down positions don't shift
+    changes: list[TextDocumentContentChangeEvent] = [
+        TextDocumentContentChangeEventRange(range=range_, text='renamed_function__')
+        for range_ in (reversed(RANGES) if order == 'bottom_up' else RANGES)
+    ]
+    doc = benchmark(DOCUMENT.apply_changes, changes, 2)
+    assert doc.text.count('renamed_function__') == len(RANGES)
+
+
+def formatted(text: str) -> str:
+    rng = random.Random(0)
+    lines = []
+    for line in text.splitlines(keepends=True):
+        # respacing some lines, adding the odd blank line
+        lines.append(line.replace('x,y ,  ', 'x, y, ') if rng.random() < .05 else line)
+        if rng.random() < .01:
+            lines.append('\n')
+    return ''.join(lines)
+
+
+def reordered(text: str) -> str:
+    lines = text.splitlines(keepends=True)
+    random.Random(0).shuffle(lines)
+    return ''.join(lines)
+
+
+@pytest.mark.parametrize('change', ['formatted', 'rewritten', 'reordered'])
+def test_diff_edits(benchmark: BenchmarkFixture, change: str) -> None:
+    doc = TextDocument(uri=DocumentUri('file:///big.py'),
+                       language_id='python',
+                       version=1,
+                       text=''.join(f"{'    ' * (i % 4)}value_{i % 997} = compute(x,y ,  {i})\n" if i % 7 else '\n'
+                                    for i in range(50_000)))
+    new_text = {'formatted': formatted, 'rewritten': str.upper, 'reordered': reordered}[change](doc.text)
+    edits = benchmark(diff_edits, doc, new_text)
+    assert apply_text_edits(doc, edits) == new_text
+    benchmark.extra_info['edits'] = len(edits)
+    benchmark.extra_info['sent_bytes'] = sum(len(edit['newText']) for edit in edits)
@@ -0,0 +1,68 @@
+"""
+Request round trips over TCP against the example servers.
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import TYPE_CHECKING, Any, Type
+
+import pytest
+from pytest_benchmark.fixture import BenchmarkFixture
+
+from examples.fibb_lsp import Fib
+from examples.never_gonna_lsp import NeverGonna
+from examples.spongebob_text_lsp import Spongebob
+from lsp import LanguageServer
+from lsp.lsp.common import DocumentUri, MessageData, Position, Range
+from lsp.lsp.server import (CodeActionContext, CodeActionParams, CompletionParams, DidOpenTextDocumentParams,
+                            TextDocumentIdentifier, TextDocumentItem)
+from lsp.protocol import LspProtocol
+
+if TYPE_CHECKING:
+    from tests.conftest import RequstFn
+
+URI = DocumentUri('file:///doc.txt')
+TEXT = 'this is some text for the document\n' * 100
+
+CODE_ACTION = ('textDocument/codeAction',
+               CodeActionParams(textDocument=TextDocumentIdentifier(uri=URI),
+                                range=Range(start=Position(line=3, character=5), end=Position(line=3, character=20)),
+                                context=CodeActionContext(diagnostics=[])))
+COMPLETION = ('textDocument/completion',
+              CompletionParams(textDocument=TextDocumentIdentifier(uri=URI), position=Position(line=0, character=0)))
+
+REQUESTS: dict[type[LanguageServer], tuple[str, MessageData]] = {
+    Fib: CODE_ACTION,
+    Spongebob: CODE_ACTION,
+    NeverGonna: COMPLETION,
+}
+
+
+@pytest.fixture(params=list(REQUESTS), ids=lambda cls: cls.__name__)
+def lsp_class(request: pytest.FixtureRequest) -> Type[LanguageServer]:
+    cls: Type[LanguageServer] = request.param
+    return cls
+
+
+@pytest.fixture
+async def opened(lsp_client: LspProtocol[Any], make_request: RequstFn[MessageData]) -> LspProtocol[Any]:
+    lsp_client.write_message(
+        make_request(
+            'textDocument/didOpen',
+            DidOpenTextDocumentParams(textDocument=TextDocumentItem(uri=URI, languageId='text', version=1, text=TEXT))))
+    return lsp_client
+
+
+@pytest.mark.parametrize('pipelined', [1, 10])
+def test_round_trip(benchmark: BenchmarkFixture, event_loop: asyncio.AbstractEventLoop, lsp_class: type[LanguageServer],
+                    opened: LspProtocol[Any], make_request: RequstFn[MessageData], pipelined: int) -> None:
+    method, params = REQUESTS[lsp_class]
+
+    async def round_trip() -> None:
+        for _ in range(pipelined):
+            opened.write_message(make_request(method, params))
+        for _ in range(pipelined):
+            response = await opened.read_message()
+            assert 'result' in response.content
+
+    benchmark(lambda: event_loop.run_until_complete(round_trip()))
@@ -0,0 +1,36 @@
+"""
+Start up cost of the library and the example servers: a fresh interpreter importing each module, timed as a
+whole, with the module's own cumulative ``python -X importtime`` figure (in microseconds) in ``extra_info``.
+"""
+from __future__ import annotations
+
+import statistics
+import subprocess
+import sys
+
+import pytest
+from pytest_benchmark.fixture import BenchmarkFixture
+
+MODULES = ['lsp', 'lsp.client', 'examples.fibb_lsp', 'examples.never_gonna_lsp', 'examples.spongebob_text_lsp']
+
+
+def import_time(module: str) -> int:
+    """
+    Cumulative microseconds spent importing ``module`` in a new interpreter.
+    """
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True,
+                            text=True,
+                            check=True).stderr
+    for line in reversed(stderr.splitlines()):
+        _, cumulative, name = line.split('|')
+        if name.strip() == module:
+            return int(cumulative)
+    raise AssertionError(f"{module} missing from -X importtime output")
+
+
+@pytest.mark.parametrize('module', MODULES)
+def test_import(benchmark: BenchmarkFixture, module: str) -> None:
+    times: list[int] = []
+    benchmark.pedantic(lambda: times.append(import_time(module)), rounds=10, warmup_rounds=1)
+    benchmark.extra_info['importtime_us'] = statistics.median(times)
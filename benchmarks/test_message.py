@@ -0,0 +1,52 @@
+"""
+Encoding and decoding single :py:class:`lsp.protocol.Message` s.
+"""
+from __future__ import annotations
+
+from typing import Any
+
+import pytest
+from pytest_benchmark.fixture import BenchmarkFixture
+
+from lsp.protocol import JsonRpcRequest, Message
+
+
+def did_change(size: int) -> JsonRpcRequest[Any]:
+    return JsonRpcRequest(jsonrpc='2.0',
+                          id=1,
+                          method='textDocument/didChange',
+                          params={
+                              'textDocument': {
+                                  'uri': 'file:///src/module.py',
+                                  'version': 2
+                              },
+                              'contentChanges': [{
+                                  'text': 'x' * size
+                              }]
+                          })
+
+
+SIZES = pytest.mark.parametrize('size', [64, 64 * 1024], ids=['small', 'large'])
+
+
+@SIZES
+def test_parse(benchmark: BenchmarkFixture, size: int) -> None:
+    data = bytes(Message(content=did_change(size)))
+    read, msg = benchmark(Message.parse, data)
+    assert read == len(data)
+
+
+@SIZES
+def test_parse_with_trailing_data(benchmark: BenchmarkFixture, size: int) -> None:
+    # a message followed by the start of the next, as in a coalesced read
+    data = bytes(Message(content=did_change(size)))
+    read, msg = benchmark(Message.parse, data + data[:len(data) // 2])
+    assert read == len(data)
+
+
+@SIZES
+def test_bytes(benchmark: BenchmarkFixture, size: int) -> None:
+    content = did_change(size)
+    # content bytes are cached on the message, so serialize a new one every time
+    data = benchmark(lambda: bytes(Message(content=content)))
+    assert data.startswith(b'Content-Length: ')
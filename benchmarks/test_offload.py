@@ -0,0 +1,81 @@
+"""
+Hover latency while a slow request is being handled, with the slow handler on the loop vs in a worker process.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import TYPE_CHECKING, Any, Type
+
+import pytest
+from pytest_benchmark.fixture import BenchmarkFixture
+
+from lsp import LanguageServer
+from lsp.documents import TextDocument
+from lsp.executors import in_process
+from lsp.lsp.common import DocumentUri, Position
+from lsp.lsp.messages import InitializeParams, InitializeResult
+from lsp.lsp.server import Hover, HoverParams, TextDocumentIdentifier
+from lsp.protocol import LspProtocol
+
+if TYPE_CHECKING:
+    from tests.conftest import RequstFn
+
+SLOW_SECONDS = 0.2
+
+
+def busy(seconds: float) -> str:
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+    return 'done'
+
+
+class InlineServer(LanguageServer):
+
+    async def initialize(self, params: InitializeParams) -> InitializeResult:
+        return InitializeResult(capabilities={})
+
+    async def slow(self, params: None) -> str:
+        return busy(SLOW_SECONDS)
+
+    async def text_document__hover(self, params: HoverParams) -> Hover | None:
+        return Hover(contents='hover')
+
+
+class OffloadedServer(InlineServer):
+
+    @in_process
+    def slow(params: None, document: TextDocument | None) -> str:
+        return busy(SLOW_SECONDS)
+
+
+@pytest.fixture(params=[InlineServer, OffloadedServer], ids=['inline', 'in_process'])
+def lsp_class(request: pytest.FixtureRequest) -> Type[LanguageServer]:
+    cls: Type[LanguageServer] = request.param
+    return cls
+
+
+def test_hover_during_slow_request(benchmark: BenchmarkFixture, event_loop: asyncio.AbstractEventLoop,
+                                   lsp_client: LspProtocol[Any], make_request: RequstFn[Any]) -> None:
+    hover = HoverParams(textDocument=TextDocumentIdentifier(uri=DocumentUri('')),
+                        position=Position(line=0, character=0))
+    pending: set[int] = set()
+
+    async def hover_round_trip() -> None:
+        slow = make_request('slow', None)
+        pending.add(slow.content['id'])
+        lsp_client.write_message(slow)
+        request = make_request('textDocument/hover', hover)
+        lsp_client.write_message(request)
+        while (resp := await lsp_client.read_message()).content['id'] != request.content['id']:
+            pending.discard(resp.content['id'])
+
+    async def drain() -> None:
+        while pending:
+            pending.discard((await lsp_client.read_message()).content['id'])
+
+    benchmark.pedantic(lambda: event_loop.run_until_complete(hover_round_trip()),
+                       teardown=lambda: event_loop.run_until_complete(drain()),
+                       rounds=5,
+                       warmup_rounds=1)
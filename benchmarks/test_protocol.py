@@ -0,0 +1,98 @@
+"""
+Framing incoming data with :py:class:`lsp.protocol.LspProtocol` and dispatching it to handlers, without a real
+transport in the way.
+"""
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Iterator
+from typing import Any
+
+import pytest
+from pytest_benchmark.fixture import BenchmarkFixture
+
+from lsp import LanguageServer
+from lsp.lsp.messages import InitializeParams, InitializeResult
+from lsp.protocol import JsonRpcRequest, LspProtocol, Message
+from lsp.session import Session
+
+MESSAGES = 100
+
+
+def stream(size: int, count: int = MESSAGES) -> bytes:
+    return b''.join(
+        bytes(Message(content=JsonRpcRequest(jsonrpc='2.0', id=i, method='echo', params={'text': 'x' * size})))
+        for i in range(count))
+
+
+def feed(protocol: LspProtocol[Any], data: bytes, chunk_size: int) -> None:
+    """
+    Feed ``data`` the way a socket transport would, reading at most ``chunk_size`` bytes at a time.
+    """
+    view = memoryview(data)
+    while view:
+        buf = protocol.get_buffer(-1)
+        read = min(len(buf), len(view), chunk_size)
+        buf[:read] = view[:read]
+        view = view[read:]
+        protocol.buffer_updated(read)
+
+
+@pytest.mark.parametrize('size, chunk_size', [
+    (64, 1 << 20),
+    (64, 16),
+    (64 * 1024, 1 << 20),
+    (64 * 1024, 4096),
+],
+                         ids=['small-coalesced', 'small-fragmented', 'large-coalesced', 'large-fragmented'])
+def test_buffer_updated(benchmark: BenchmarkFixture, size: int, chunk_size: int) -> None:
+    data = stream(size)
+
+    def run() -> LspProtocol[Any]:
+        protocol: LspProtocol[Any] = LspProtocol()
+        feed(protocol, data, chunk_size)
+        return protocol
+
+    protocol = benchmark(run)
+    assert protocol.out_queue.qsize() == MESSAGES
+
+
+class EchoServer(LanguageServer):
+
+    async def initialize(self, params: InitializeParams) -> InitializeResult:
+        return InitializeResult(capabilities={})
+
+    async def echo(self, params: dict[str, str]) -> dict[str, str]:
+        return params
+
+
+class CountingTransport(asyncio.WriteTransport):
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.writes = 0
+        self.done: asyncio.Event = asyncio.Event()
+
+    def write(self, data: bytes | bytearray | memoryview) -> None:
+        self.writes += 1
+        if self.writes == MESSAGES:
+            self.done.set()
+
+
+@pytest.fixture
+def session(event_loop: asyncio.AbstractEventLoop) -> Iterator[Session]:
+    session = Session(EchoServer())
+    task = event_loop.create_task(session._handle_messages())
+    yield session
+    task.cancel()
+
+
+def test_dispatch(benchmark: BenchmarkFixture, event_loop: asyncio.AbstractEventLoop, session: Session) -> None:
+    data = stream(64)
+
+    async def run() -> None:
+        transport = session.protocol.transport = CountingTransport()
+        feed(session.protocol, data, 1 << 20)
+        await transport.done.wait()
+
+    benchmark(lambda: event_loop.run_until_complete(run()))
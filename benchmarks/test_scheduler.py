@@ -0,0 +1,30 @@
+"""
+Request latency while the server indexes in the background, in a plain task that yields every 50 units of work,
+and as a scheduled job that gives way to requests.
+"""
+from __future__ import annotations
+
+import asyncio
+import sys
+from collections.abc import Iterator
+
+import pytest
+from pytest_benchmark.fixture import BenchmarkFixture
+
+from lsp.client import Client
+
+
+@pytest.fixture(params=['task', 'scheduled'])
+def client(request: pytest.FixtureRequest, event_loop: asyncio.AbstractEventLoop) -> Iterator[Client]:
+    context = Client().run([sys.executable, '-m', 'benchmarks.indexing_server', request.param], timeout=10)
+    client = event_loop.run_until_complete(context.__aenter__())
+    yield client
+    event_loop.run_until_complete(context.__aexit__(None, None, None))
+
+
+def test_latency(benchmark: BenchmarkFixture, event_loop: asyncio.AbstractEventLoop, client: Client) -> None:
+
+    async def echo() -> None:
+        assert await client.request('echo', {'ok': True}) == {'ok': True}
+
+    benchmark.pedantic(lambda: event_loop.run_until_complete(echo()), rounds=50, warmup_rounds=2)
@@ -0,0 +1,33 @@
+"""
+A large document sent to a local server and echoed back, inline and through shared memory.
+"""
+from __future__ import annotations
+
+import asyncio
+import sys
+from collections.abc import Iterator
+
+import pytest
+from pytest_benchmark.fixture import BenchmarkFixture
+
+from lsp.client import Client
+
+SERVER = [sys.executable, '-m', 'tests.client_server']
+TEXT = 'def generated_function_{}(x: int) -> "str":\n    return f"\\t{{x}}"\n' * 250_000
+
+
+@pytest.fixture(params=[None, 1 << 16], ids=['inline', 'shared'])
+def client(request: pytest.FixtureRequest, event_loop: asyncio.AbstractEventLoop) -> Iterator[Client]:
+    context = Client(shared_memory_threshold=request.param).run(SERVER, timeout=10)
+    client = event_loop.run_until_complete(context.__aenter__())
+    yield client
+    event_loop.run_until_complete(context.__aexit__(None, None, None))
+
+
+def test_echo(benchmark: BenchmarkFixture, event_loop: asyncio.AbstractEventLoop, client: Client) -> None:
+
+    async def echo() -> None:
+        assert (await client.request('echo', {'text': TEXT}))['text'] == TEXT
+
+    benchmark.extra_info['text_bytes'] = len(TEXT)
+    benchmark.pedantic(lambda: event_loop.run_until_complete(echo()), rounds=5, warmup_rounds=1)
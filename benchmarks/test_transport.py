@@ -0,0 +1,62 @@
+"""
+Request latency over TCP loopback compared to a Unix domain socket, for small and large responses.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+from collections.abc import AsyncIterable
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+import pytest
+from pytest_benchmark.fixture import BenchmarkFixture
+
+from lsp import LanguageServer
+from lsp.lsp.messages import InitializeParams, InitializeResult
+from lsp.protocol import LspProtocol
+
+if TYPE_CHECKING:
+    from tests.conftest import RequstFn
+
+
+class EchoLanguageServer(LanguageServer):
+
+    async def initialize(self, params: InitializeParams) -> InitializeResult:
+        return InitializeResult(capabilities={})
+
+    async def echo(self, params: dict[str, Any]) -> dict[str, Any]:
+        return params
+
+
+@pytest.fixture(params=['tcp', 'unix'])
+async def connection(request: pytest.FixtureRequest, tmp_path: Path,
+                     make_request: RequstFn[Any]) -> AsyncIterable[LspProtocol[Any]]:
+    loop = asyncio.get_running_loop()
+    protocol: LspProtocol[Any] = LspProtocol()
+    path = str(tmp_path / 'lsp.sock')
+    async with EchoLanguageServer().serve(std=False,
+                                          port=0 if request.param == 'tcp' else None,
+                                          path=path if request.param == 'unix' else None) as server:
+        if request.param == 'tcp':
+            assert server._listening_on is not None
+            transport, _ = await loop.create_connection(lambda: protocol, port=server._listening_on)
+        else:
+            transport, _ = await loop.create_unix_connection(lambda: protocol, path)
+        protocol.write_message(
+            make_request('initialize', InitializeParams(rootUri=None, processId=os.getpid(), capabilities={})))
+        await protocol.read_message()
+        yield protocol
+        transport.close()
+
+
+@pytest.mark.parametrize('size', [16, 64 * 1024], ids=['small', 'large'])
+def test_latency(benchmark: BenchmarkFixture, event_loop: asyncio.AbstractEventLoop, connection: LspProtocol[Any],
+                 make_request: RequstFn[Any], size: int) -> None:
+    params = {'text': 'x' * size}
+
+    async def round_trip() -> None:
+        connection.write_message(make_request('echo', params))
+        assert 'result' in (await connection.read_message()).content
+
+    benchmark(lambda: event_loop.run_until_complete(round_trip()))
@@ -1,83 +1,260 @@
 from __future__ import annotations
 
 import asyncio
+import importlib
 import logging
+import os
+import sys
 from abc import ABC, abstractmethod
-from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack, asynccontextmanager, suppress
 from dataclasses import dataclass, field
-from typing import Any, AsyncIterator, Awaitable, Callable, Literal, Self
-
-from lsp.lsp.common import Location, LocationLink, MessageData
-from lsp.lsp.messages import (InitializedParams, InitializeParams, InitializeResult)
-from lsp.lsp.server import (
-    CallHierarchyIncomingCall, CallHierarchyIncomingCallsParams, CallHierarchyItem, CallHierarchyOutgoingCall,
-    CallHierarchyOutgoingCallsParams, CallHierarchyPrepareParams, CodeAction, CodeActionParams, CodeLens,
-    CodeLensParams, ColorInformation, ColorPresentation, ColorPresentationParams, Command, CompletionItem,
-    CompletionList, CompletionParams, CreateFilesParams, DeclarationParams, DefinitionParams, DeleteFilesParams,
-    DidChangeConfigurationParams, DidChangeTextDocumentParams, DidChangeWatchedFilesParams,
-    DidChangeWorkspaceFoldersParams, DidCloseTextDocumentParams, DidOpenTextDocumentParams, DidSaveTextDocumentParams,
-    DocumentColorParams, DocumentFormattingParams, DocumentHighlight, DocumentHighlightParams, DocumentLink,
-    DocumentLinkParams, DocumentOnTypeFormattingParams, DocumentRangeFormattingParams, DocumentSymbol,
-    DocumentSymbolParam, ExecuteCommandParams, FoldingRange, FoldingRangeParams, Hover, HoverParams,
-    ImplementationParams, InlayHint, InlayHintParams, InlineValue, InlineValueParams, LinkedEditingRangeParams,
-    LinkedEditingRanges, Moniker, MonikerParams, PrepareRenameParams, PrepareRenameResponse, ReferenceParams,
-    RenameFilesParams, RenameParams, SelectionRange, SelectionRangeParams, SemanticTokens, SemanticTokensDelta,
-    SemanticTokensDeltaParams, SemanticTokensParams, SemanticTokensRangeParams, SignatureHelp, SignatureHelpParams,
-    SymbolInformation, TextEdit, TypeDefinitionParams, TypeHierarchyItem, TypeHierarchyPrepareParams,
-    TypeHierarchySubtypesParams, TypeHierarchySupertypesParams, WillSaveTextDocumentParams, WorkspaceEdit,
-    WorkspaceSymbol, WorkspaceSymbolParams)
-from lsp.protocol import (JsonRpcError, JsonRpcRequest, JsonRpcResponse, LspProtocol, Message)
+from typing import (TYPE_CHECKING, Any, AsyncIterator, Callable, ClassVar, Coroutine, Iterable, Literal, Self,
+                    TypeAlias, TypeVar, overload)
+
+from lsp import compression
+from lsp.documents import DocumentStore
+from lsp.memory import MemoryParams, MemoryTracker
+from lsp.metrics import Metrics
+from lsp.profiling import ProfileParams, Profiler, make_profiler, profile_path
+from lsp.protocol import JsonRpcException, JsonRpcRequest, LspProtocol
+from lsp.queries import Database
+from lsp.scheduler import Scheduler
+from lsp.session import Session, current_session
+from lsp.tracing import Tracer
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+    from lsp.lsp.common import Location, LocationLink
+    from lsp.lsp.messages import (InitializedParams, InitializeParams, InitializeResult)
+    from lsp.lsp.server import (
+        CallHierarchyIncomingCall, CallHierarchyIncomingCallsParams, CallHierarchyItem, CallHierarchyOutgoingCall,
+        CallHierarchyOutgoingCallsParams, CallHierarchyPrepareParams, CodeAction, CodeActionParams, CodeLens,
+        CodeLensParams, ColorInformation, ColorPresentation, ColorPresentationParams, Command, CompletionItem,
+        CompletionList, CompletionParams, CreateFilesParams, DeclarationParams, DefinitionParams, DeleteFilesParams,
+        DidChangeConfigurationParams, DidChangeTextDocumentParams, DidChangeWatchedFilesParams,
+        DidChangeWorkspaceFoldersParams, DidCloseTextDocumentParams, DidOpenTextDocumentParams,
+        DidSaveTextDocumentParams, DocumentColorParams, DocumentFormattingParams, DocumentHighlight,
+        DocumentHighlightParams, DocumentLink, DocumentLinkParams, DocumentOnTypeFormattingParams,
+        DocumentRangeFormattingParams, DocumentSymbol, DocumentSymbolParam, ExecuteCommandParams, FoldingRange,
+        FoldingRangeParams, Hover, HoverParams, ImplementationParams, InlayHint, InlayHintParams, InlineValue,
+        InlineValueParams, LinkedEditingRangeParams, LinkedEditingRanges, Moniker, MonikerParams, PrepareRenameParams,
+        PrepareRenameResponse, ReferenceParams, RenameFilesParams, RenameParams, SelectionRange, SelectionRangeParams,
+        SemanticTokens, SemanticTokensDelta, SemanticTokensDeltaParams, SemanticTokensParams, SemanticTokensRangeParams,
+        SignatureHelp, SignatureHelpParams, SymbolInformation, TextEdit, TypeDefinitionParams, TypeHierarchyItem,
+        TypeHierarchyPrepareParams, TypeHierarchySubtypesParams, TypeHierarchySupertypesParams,
+        WillSaveTextDocumentParams, WorkspaceEdit, WorkspaceSymbol, WorkspaceSymbolParams)
+
+    LocationResponse: TypeAlias = Location | list[Location] | list[LocationLink] | None
 
 JSONRPC_VERSION: Literal["2.0"] = "2.0"
 
-LocationResponse = Location | list[Location] | list[LocationLink] | None
+#: protocol types that can still be imported from here, on first use, see :py:func:`__getattr__`
+_REEXPORTS = {
+    'lsp.lsp.common': ('Location', 'LocationLink'),
+    'lsp.lsp.messages': ('InitializedParams', 'InitializeParams', 'InitializeResult'),
+    'lsp.lsp.server':
+    ('CallHierarchyIncomingCall', 'CallHierarchyIncomingCallsParams', 'CallHierarchyItem', 'CallHierarchyOutgoingCall',
+     'CallHierarchyOutgoingCallsParams', 'CallHierarchyPrepareParams', 'CodeAction', 'CodeActionParams', 'CodeLens',
+     'CodeLensParams', 'ColorInformation', 'ColorPresentation', 'ColorPresentationParams', 'Command', 'CompletionItem',
+     'CompletionList', 'CompletionParams', 'CreateFilesParams', 'DeclarationParams', 'DefinitionParams',
+     'DeleteFilesParams', 'DidChangeConfigurationParams', 'DidChangeTextDocumentParams', 'DidChangeWatchedFilesParams',
+     'DidChangeWorkspaceFoldersParams', 'DidCloseTextDocumentParams', 'DidOpenTextDocumentParams',
+     'DidSaveTextDocumentParams', 'DocumentColorParams', 'DocumentFormattingParams', 'DocumentHighlight',
+     'DocumentHighlightParams', 'DocumentLink', 'DocumentLinkParams', 'DocumentOnTypeFormattingParams',
+     'DocumentRangeFormattingParams', 'DocumentSymbol', 'DocumentSymbolParam', 'ExecuteCommandParams', 'FoldingRange',
+     'FoldingRangeParams', 'Hover', 'HoverParams', 'ImplementationParams', 'InlayHint', 'InlayHintParams',
+     'InlineValue', 'InlineValueParams', 'LinkedEditingRangeParams', 'LinkedEditingRanges', 'Moniker', 'MonikerParams',
+     'PrepareRenameParams', 'PrepareRenameResponse', 'ReferenceParams', 'RenameFilesParams', 'RenameParams',
+     'SelectionRange', 'SelectionRangeParams', 'SemanticTokens', 'SemanticTokensDelta', 'SemanticTokensDeltaParams',
+     'SemanticTokensParams', 'SemanticTokensRangeParams', 'SignatureHelp', 'SignatureHelpParams', 'SymbolInformation',
+     'TextEdit', 'TypeDefinitionParams', 'TypeHierarchyItem', 'TypeHierarchyPrepareParams',
+     'TypeHierarchySubtypesParams', 'TypeHierarchySupertypesParams', 'WillSaveTextDocumentParams', 'WorkspaceEdit',
+     'WorkspaceSymbol', 'WorkspaceSymbolParams'),
+}
 
 log = logging.getLogger(__name__)
 
+T = TypeVar('T')
+
+
+def __getattr__(name: str) -> Any:
+    """
+    Import the protocol types this module used to import eagerly, and ``LocationResponse``, when first used.
+    """
+    if name == 'LocationResponse':
+        from lsp.lsp.common import Location, LocationLink
+        value: Any = Location | list[Location] | list[LocationLink] | None
+    else:
+        module = next((module for module, names in _REEXPORTS.items() if name in names), None)
+        if module is None:
+            raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+        value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
 
 def camel_to_snake(s: str) -> str:
     return ''.join(['_' + c.lower() if c.isupper() else c for c in s]).lstrip('_')
 
 
+def _remove_socket(path: str) -> None:
+    with suppress(FileNotFoundError):
+        os.unlink(path)
+
+
 @dataclass
 class LanguageServer(ABC):
-    protocol: LspProtocol[JsonRpcRequest[Any]] = field(default_factory=LspProtocol)
     _serve_task: asyncio.Task[None] | None = None
-    _netcat_task: asyncio.Task[None] | None = None
+    _stdio_task: asyncio.Task[None] | None = None
     _listening_on: int | None = None
-    _shutdown_received: bool = False
+    sessions: set[Session] = field(default_factory=set)
+    process_workers: int | None = None
+    _process_pool: ProcessPoolExecutor | None = None
+    thread_workers: int | None = None
+    _thread_pool: ThreadPoolExecutor | None = None
+    _limits: dict[str, asyncio.Semaphore] = field(default_factory=dict)
+    _scheduler: Scheduler | None = None
+    metrics: Metrics = field(default_factory=Metrics)
+    #: write :py:attr:`metrics` to this file in the Prometheus text format every :py:attr:`metrics_interval` seconds
+    metrics_file: str | None = None
+    metrics_interval: float = 60
+    #: record a trace of every message handled, see :py:mod:`lsp.tracing`
+    tracer: Tracer | None = None
+    #: where ``$/profile/stop`` writes profiles, the system's temporary directory by default
+    profile_dir: str | None = None
+    _profiler: Profiler | None = None
+    memory: MemoryTracker = field(default_factory=MemoryTracker)
+    #: log :py:meth:`lsp.memory.MemoryTracker.summary` every this many seconds
+    memory_log_interval: float | None = None
+    #: encodings clients may ask for content to be compressed with, see :py:mod:`lsp.compression`
+    content_encodings: list[str] = field(default_factory=lambda: list(compression.codecs()))
+    #: compress content of at least this many bytes, once a client has asked for it
+    compression_threshold: int = 4096
+    #: move strings of at least this many characters to shared memory, for clients on the same host that ask for
+    #: it; off by default, see :py:mod:`lsp.shared_memory`
+    shared_memory_threshold: int | None = None
+
+    #: handlers for methods outside the usual naming scheme, such as this library's own ``$/`` requests
+    extension_methods: ClassVar[dict[str, str]] = {
+        '$/metrics': 'report_metrics',
+        '$/profile/start': 'start_profile',
+        '$/profile/stop': 'stop_profile',
+        '$/memory': 'report_memory',
+    }
 
     def transform_method(self, method: str) -> str:
         parts = method.split('/')
         return '__'.join(camel_to_snake(p) for p in parts)
 
-    async def _handle_messages(self) -> None:
-        while True:
-            msg = await self.protocol.read_message()
-            msg_id = msg.content.get('id')
-            cb: Callable[[MessageData | None], Awaitable[MessageData]] | None = getattr(
-                self, self.transform_method(msg.content['method']), None)
-            log.debug("Found cb %s for method %s", cb, self.transform_method(msg.content['method']))
-            if cb is None:
-                if msg_id is not None:
-                    self.protocol.write_message(
-                        Message(content=JsonRpcResponse(
-                            jsonrpc=JSONRPC_VERSION,
-                            id=msg_id,
-                            error=JsonRpcError(code=-32601, message=f"Method {msg.content['method']!r} not found"))))
-                continue
-            try:
-                result = await cb(msg.content.get('params'))
-                if msg_id is not None and result:
-                    # otherwise, it's a notification and no response required
-                    self.protocol.write_message(
-                        Message(content=JsonRpcResponse(jsonrpc=JSONRPC_VERSION, id=msg_id, result=result)))
-            except (Exception, NotImplementedError, AssertionError) as e:
-                log.exception("Something happened in %s", msg.content['method'])
-                if msg_id is not None:
-                    self.protocol.write_message(
-                        Message(content=JsonRpcResponse(
-                            jsonrpc=JSONRPC_VERSION, id=msg_id, error=JsonRpcError(code=-32603, message=str(e)))))
+    def find_handler(self, method: str, notification: bool = False) -> Callable[[Any], Any] | None:
+        """
+        The handler for ``method``; by default the method named by :py:meth:`transform_method`.
+        """
+        _ = notification
+        if (name := self.extension_methods.get(method)) is not None:
+            return getattr(self, name, None)
+        return getattr(self, self.transform_method(method), None)
+
+    @property
+    def session(self) -> Session:
+        """
+        The :py:class:`lsp.session.Session` (client connection) the message currently being handled arrived on.
+        Outside of a handler, that's the only connected session if there's exactly one, as for a stdio server;
+        otherwise there's no telling which one is meant and a :py:class:`RuntimeError` is raised.
+        """
+        if (session := current_session.get(None)) is not None:
+            return session
+        if len(self.sessions) == 1:
+            return next(iter(self.sessions))
+        raise RuntimeError(f"No current session outside of a handler, with {len(self.sessions)} clients connected")
+
+    @property
+    def protocol(self) -> LspProtocol[JsonRpcRequest[Any]]:
+        """
+        The current session's protocol. This used to be a field holding the server's only protocol; like
+        :py:attr:`documents` and :py:attr:`queries`, it now follows :py:attr:`session`, so it's only available
+        while a client is connected.
+        """
+        return self.session.protocol
+
+    @property
+    def documents(self) -> DocumentStore:
+        """
+        The documents the current session's client has open.
+        """
+        return self.session.documents
+
+    @property
+    def queries(self) -> Database:
+        """
+        The current session's incremental query results, see :py:mod:`lsp.queries`.
+        """
+        return self.session.queries
+
+    @property
+    def process_pool(self) -> ProcessPoolExecutor:
+        """
+        Pool used to run :py:func:`lsp.executors.in_process` handlers, started on first use.
+        """
+        if self._process_pool is None:
+            # importing multiprocessing is slow, and most servers never need it
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            self._process_pool = ProcessPoolExecutor(self.process_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+        return self._process_pool
+
+    @property
+    def thread_pool(self) -> ThreadPoolExecutor:
+        """
+        Pool used to run handlers defined with a plain ``def`` rather than ``async def``, started on first use.
+        Use this for handlers that block on I/O (subprocesses, files, databases); requests run concurrently with
+        each other and with the event loop, and can be capped per method with :py:func:`lsp.executors.max_concurrency`.
+        Notifications still hold up the messages behind them, so they're handled in order.
+        """
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(self.thread_workers, thread_name_prefix='lsp-handler')
+        return self._thread_pool
+
+    @property
+    def scheduler(self) -> Scheduler:
+        """
+        Runs background jobs from :py:meth:`schedule` while the server isn't :py:meth:`busy`, see
+        :py:mod:`lsp.scheduler`.
+        """
+        if self._scheduler is None:
+            self._scheduler = Scheduler(self.busy)
+        return self._scheduler
+
+    def busy(self) -> bool:
+        """
+        Whether any session has messages waiting to be read.
+        """
+        return any(session.busy for session in self.sessions)
+
+    @overload
+    def schedule(self, job: Coroutine[Any, Any, T], priority: int = 0, name: str | None = None) -> asyncio.Task[T]:
+        ...
+
+    @overload
+    def schedule(self, job: Iterable[object], priority: int = 0, name: str | None = None) -> asyncio.Task[None]:
+        ...
+
+    def schedule(self,
+                 job: Coroutine[Any, Any, Any] | Iterable[object],
+                 priority: int = 0,
+                 name: str | None = None) -> asyncio.Task[Any]:
+        """
+        Run ``job`` in the background whenever the server has no messages waiting; jobs with a higher
+        ``priority`` go first. Jobs scheduled while handling a message are cancelled when its session closes.
+        """
+        task = self.scheduler.schedule(job, priority, name)
+        if (session := current_session.get(None)) is not None:
+            session._background.add(task)
+            task.add_done_callback(session._background.discard)
+        return task
 
     async def wait(self) -> None:
         if self._serve_task is None:
@@ -85,23 +262,121 @@ class LanguageServer(ABC):
         await self._serve_task
 
     @asynccontextmanager
-    async def serve(self, std: bool = True, port: int = 0) -> AsyncIterator[Self]:
-        async with await asyncio.get_event_loop().create_server(lambda: self.protocol, port=port,
-                                                                host='localhost') as server, asyncio.TaskGroup() as tg:
-            self._serve_task = tg.create_task(server.serve_forever())
-            self._listening_on = server.sockets[0].getsockname()[1]
-            assert self._listening_on is not None
-            if std:
-                self._netcat_task = tg.create_task(self._netcat(self._listening_on))
-            handle = tg.create_task(self._handle_messages())
-            yield self
-            self._serve_task.cancel()
-            if self._netcat_task:
-                self._netcat_task.cancel()
-            handle.cancel()
-
-    async def _netcat(self, port: int) -> None:
-        await asyncio.create_subprocess_exec('nc', 'localhost', str(port))
+    async def serve(self, std: bool = True, port: int | None = 0, path: str | None = None) -> AsyncIterator[Self]:
+        """
+        Listen for clients on ``port`` (any free port by default, ``None`` to not listen), each connection getting
+        its own :py:class:`lsp.session.Session`. With ``path``, also listen on a Unix domain socket there, which
+        saves a co-located client the TCP stack. With ``std``, stdin/stdout are also served as a client.
+        """
+        async with asyncio.TaskGroup() as tg:
+            session_tasks: set[asyncio.Task[None]] = set()
+
+            def start_session() -> Session:
+                session = Session(self)
+                task = tg.create_task(session.run())
+                session_tasks.add(task)
+                task.add_done_callback(session_tasks.discard)
+                return session
+
+            async with AsyncExitStack() as stack:
+                if port is not None:
+                    server = await stack.enter_async_context(await asyncio.get_event_loop().create_server(
+                        lambda: start_session().protocol, port=port, host='localhost'))
+                    self._serve_task = tg.create_task(server.serve_forever())
+                    self._listening_on = server.sockets[0].getsockname()[1]
+                    assert self._listening_on is not None
+                if path is not None:
+                    # asyncio replaces a stale socket file when listening, but doesn't remove it afterwards
+                    stack.callback(_remove_socket, path)
+                    unix_server = await stack.enter_async_context(await asyncio.get_event_loop().create_unix_server(
+                        lambda: start_session().protocol, path=path))
+                    unix_task = tg.create_task(unix_server.serve_forever())
+                    if self._serve_task is None:
+                        self._serve_task = unix_task
+                    else:
+                        session_tasks.add(unix_task)
+                if std:
+                    self._stdio_task = tg.create_task(self._serve_stdio(start_session()))
+                    if self._serve_task is None:
+                        self._serve_task = self._stdio_task
+                if self.metrics_file is not None:
+                    session_tasks.add(tg.create_task(self._write_metrics(self.metrics_file)))
+                if self.memory_log_interval is not None:
+                    session_tasks.add(tg.create_task(self._log_memory(self.memory_log_interval)))
+                yield self
+                if self._serve_task:
+                    self._serve_task.cancel()
+                if self._stdio_task:
+                    self._stdio_task.cancel()
+                for task in list(session_tasks):
+                    task.cancel()
+                if self._process_pool is not None:
+                    self._process_pool.shutdown(wait=False, cancel_futures=True)
+                    self._process_pool = None
+                if self._thread_pool is not None:
+                    self._thread_pool.shutdown(wait=False, cancel_futures=True)
+                    self._thread_pool = None
+                if self._scheduler is not None:
+                    self._scheduler.cancel()
+                if self.tracer is not None:
+                    self.tracer.flush()
+
+    async def _write_metrics(self, path: str) -> None:
+        while True:
+            await asyncio.sleep(self.metrics_interval)
+            self.metrics.write_prometheus(path)
+
+    async def _log_memory(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            log.info("memory: %s", self.memory.summary(self.sessions))
+
+    async def report_memory(self, params: MemoryParams | None) -> dict[str, Any]:
+        """
+        ``$/memory``: the server's memory use, see :py:mod:`lsp.memory`.
+        """
+        params = params or {}
+        if params.get('trace') is True:
+            self.memory.start_tracing()
+        elif params.get('trace') is False:
+            self.memory.stop_tracing()
+        return self.memory.report(self.sessions, params.get('top', 10))
+
+    async def report_metrics(self, params: None) -> dict[str, Any]:
+        """
+        ``$/metrics``: the :py:class:`lsp.metrics.Metrics` collected so far, durations in milliseconds.
+        """
+        return self.metrics.as_dict()
+
+    async def start_profile(self, params: ProfileParams | None) -> dict[str, Any]:
+        """
+        ``$/profile/start``: start profiling the server process, see :py:mod:`lsp.profiling`.
+        """
+        if self._profiler is not None:
+            raise JsonRpcException(-32803, f"Already profiling ({self._profiler.mode})")
+        profiler = make_profiler(params or {})
+        profiler.start()
+        self._profiler = profiler
+        return {'mode': profiler.mode}
+
+    async def stop_profile(self, params: None) -> dict[str, Any]:
+        """
+        ``$/profile/stop``: stop profiling and write the profile to :py:attr:`profile_dir`, responding with its path.
+        """
+        if self._profiler is None:
+            raise JsonRpcException(-32803, "Not profiling")
+        profiler, self._profiler = self._profiler, None
+        path = profile_path(self.profile_dir, profiler)
+        profiler.stop(path)
+        log.info("Wrote %s profile to %s", profiler.mode, path)
+        return {'path': str(path)}
+
+    async def _serve_stdio(self, session: Session) -> None:
+        loop = asyncio.get_running_loop()
+        write_transport, _ = await loop.connect_write_pipe(asyncio.Protocol, sys.stdout)
+        session.protocol.transport = write_transport
+        await loop.connect_read_pipe(lambda: session.protocol, sys.stdin)
+        await session.protocol.closed.wait()
 
     @abstractmethod
     async def initialize(self, params: InitializeParams) -> InitializeResult:
@@ -125,7 +400,7 @@ class LanguageServer(ABC):
         Clients should also wait with sending the exit notification until they have received a response from the shutdown request.
         """  # noqa: E501
 
-        self._shutdown_received = True
+        self.session.shutdown_received = True
 
     async def exit(self, params: None) -> None:
         """
@@ -133,10 +408,12 @@ class LanguageServer(ABC):
         The server should exit with success code 0 if the shutdown request has been received before; otherwise with error code 1.
         """  # noqa: E501
 
-        if self._shutdown_received:
-            exit(0)
-        else:
-            exit(1)
+        session = self.session
+        last = self.sessions <= {session}
+        session.close()
+        if last:
+            # no other clients connected, so the process goes too
+            exit(0 if session.shutdown_received else 1)
 
     async def text_document__declaration(self, params: DeclarationParams) -> LocationResponse:
         """
@@ -249,6 +526,11 @@ class LanguageServer(ABC):
         raise NotImplementedError
 
     async def text_document__formatting(self, params: DocumentFormattingParams) -> list[TextEdit] | None:
+        """
+        Given a formatter's output, respond with :py:func:`lsp.edits.diff_edits` rather than one edit replacing the
+        whole document, which would move the client's cursors and markers. The same goes for
+        :py:meth:`text_document__range_formatting` (with its range) and :py:meth:`text_document__will_save_wait_until`.
+        """
         pass
 
     async def workspace__execute_command(self, params: ExecuteCommandParams) -> Any | None:
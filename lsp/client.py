@@ -2,18 +2,25 @@
 Interactive client, mainly for testing/debugging purposes
 """
 import asyncio
+import inspect
 import logging
 import os
-from collections.abc import AsyncIterator
+from collections.abc import AsyncIterator, Callable
 from contextlib import asynccontextmanager
 from dataclasses import dataclass, field
-from typing import Any, Self
+from typing import Any, Self, TypeAlias, cast
 
-from lsp import JSONRPC_VERSION
-from lsp.lsp.client import ClientCapabilities
-from lsp.lsp.common import MessageData
-from lsp.lsp.messages import InitializedParams, InitializeParams
-from lsp.protocol import (JsonRpcRequest, JsonRpcResponse, LspProtocol, Message, T_Content)
+from lsp import JSONRPC_VERSION, compression, shared_memory
+from lsp.documents import DocumentStore
+from lsp.edits import EditError, apply_workspace_edit
+from lsp.lsp.client import ClientCapabilities, ClientWorkspaceCapabilities, WorkspaceEditClientCapabilities
+from lsp.lsp.common import DocumentUri, MessageData
+from lsp.lsp.messages import InitializedParams, InitializeParams, InitializeResult
+from lsp.lsp.server import (ApplyWorkspaceEditParams, ApplyWorkspaceEditResult, DidChangeTextDocumentParams,
+                            TextDocumentContentChangeEventSimple, VersionedTextDocumentIdentifier)
+from lsp.memory import rss
+from lsp.protocol import (JsonRpcContent, JsonRpcError, JsonRpcException, JsonRpcRequest, JsonRpcResponse, LspProtocol,
+                          Message, T_Content)
 
 log = logging.getLogger('client')
 log_send = logging.getLogger('client.send')
@@ -24,6 +31,10 @@ class ExitedError(Exception):
     pass
 
 
+#: queued after the last message from a server that has exited
+_EXITED: Message[Any] = Message(content=JsonRpcContent(jsonrpc=JSONRPC_VERSION))
+
+
 class LspProtocolSubprocess(asyncio.SubprocessProtocol, LspProtocol[T_Content]):
 
     def __init__(self) -> None:
@@ -32,25 +43,20 @@ class LspProtocolSubprocess(asyncio.SubprocessProtocol, LspProtocol[T_Content]):
         self.exited_event: asyncio.Event = asyncio.Event()
 
     def pipe_data_received(self, fd: int, data: bytes) -> None:
-
-        remaining = len(data)
-        while remaining:
-            buf = self.get_buffer(remaining)
-            buflen = len(buf)
-            write = min(buflen, remaining)
-            buf[:write] = data[:write]
-            remaining -= write
-            data = data[write:]
-            self.buffer_updated(write)
+        self.data_received(data)
 
     def pipe_connection_lost(self, fd: int, exc: Exception | None) -> None:
         self.proctransport.kill()
 
     def process_exited(self) -> None:
         logging.info("exited")
-        self.eof_received()
         self.exited_event.set()
 
+    def connection_lost(self, exc: Exception | None) -> None:
+        # unlike process_exited, only called once the pipes are closed, so after the last of the server's output
+        super().connection_lost(exc)
+        self.out_queue.put_nowait(cast(Message[T_Content], _EXITED))
+
     def connection_made(self, transport: asyncio.BaseTransport) -> None:
         assert isinstance(transport, asyncio.SubprocessTransport)
         writeable = transport.get_pipe_transport(0)
@@ -59,40 +65,379 @@ class LspProtocolSubprocess(asyncio.SubprocessProtocol, LspProtocol[T_Content]):
         self.proctransport = transport
 
     async def read_message(self) -> Message[T_Content]:
-        done, _ = await asyncio.wait(
-            [asyncio.create_task(super().read_message()),
-             asyncio.create_task(self.exited_event.wait())],
-            return_when=asyncio.FIRST_COMPLETED)
-        if True in [d.result() for d in done]:
-            # exited
+        """
+        The next message from the server. Messages that arrived before the server exited are still returned, then
+        :py:class:`ExitedError` is raised.
+        """
+        msg = await self.out_queue.get()
+        if msg is _EXITED:
+            # leave it for the next reader
+            self.out_queue.put_nowait(msg)
             raise ExitedError
-        msg = next(d.result() for d in done)
-        assert isinstance(msg, Message)
         log_recv.info("Received: %s", msg.content)
         return msg
 
 
 @dataclass
 class Client:
+    """
+    Drives a language server subprocess. Requests are matched to their responses by id, so any number can be in
+    flight at once. Notifications from the server go to the callbacks registered with :py:meth:`subscribe`, and
+    its requests to the handlers set with :py:meth:`on_request` (answered with ``null`` otherwise, except for
+    ``workspace/applyEdit``, see :py:meth:`apply_edit`).
+    """
     protocol: LspProtocolSubprocess[JsonRpcResponse[Any]] = field(default_factory=LspProtocolSubprocess)
     _server: asyncio.subprocess.Process | None = None
     cur_id: int = 1
+    initialize_result: InitializeResult | None = None
+    #: set once the server has exited; requests fail with :py:class:`ExitedError` from then on
+    exited: bool = False
+    _pending: dict[int, asyncio.Future[Any]] = field(default_factory=dict)
+    _subscribers: dict[str, list[Callable[[Any], None]]] = field(default_factory=dict)
+    _request_handlers: dict[str, Callable[[Any], Any]] = field(default_factory=dict)
+    _background: set[asyncio.Task[None]] = field(default_factory=set)
+    _reader: asyncio.Task[None] | None = None
+    #: encodings to offer the server for compressing content, see :py:mod:`lsp.compression`
+    content_encodings: list[str] = field(default_factory=list)
+    #: compress content of at least this many bytes, if the server agreed to an encoding
+    compression_threshold: int = 4096
+    #: offer the server to move strings of at least this many characters to shared memory, see
+    #: :py:mod:`lsp.shared_memory`
+    shared_memory_threshold: int | None = None
+    #: the documents opened with ``textDocument/didOpen`` notifications, kept up to date with the ``didChange`` and
+    #: ``didClose`` ones
+    documents: DocumentStore = field(default_factory=DocumentStore)
 
     @asynccontextmanager
-    async def run(self, cmd: list[str]) -> AsyncIterator[Self]:
-        loop = asyncio.get_event_loop()
-        transport, _ = await loop.subprocess_exec(lambda: self.protocol, *cmd, stderr=None)
-        self.write_request('initialize',
-                           InitializeParams(processId=os.getpid(), rootUri=None, capabilities=ClientCapabilities()))
-        await self.protocol.read_message()
-        self.write_request('initialized', InitializedParams(), notification=True)
-        yield self
-        transport.kill()
-
-    def write_request(self, method: str, params: MessageData, notification: bool = False) -> None:
+    async def run(self,
+                  cmd: list[str],
+                  timeout: float | None = None,
+                  root_uri: DocumentUri | None = None) -> AsyncIterator[Self]:
+        """
+        Start the server and initialize it, waiting up to ``timeout`` seconds for it to respond.
+        """
+        await self.start(cmd, timeout, root_uri)
+        try:
+            yield self
+        finally:
+            await self.close()
+
+    async def start(self, cmd: list[str], timeout: float | None = None, root_uri: DocumentUri | None = None) -> Self:
+        """
+        Start the server and initialize it, like :py:meth:`run`, but leaving it to the caller to
+        :py:meth:`close` it.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.subprocess_exec(lambda: self.protocol, *cmd, stderr=None)
+        self._reader = asyncio.create_task(self._read())
+        try:
+            capabilities = compression.advertise(
+                ClientCapabilities(workspace=ClientWorkspaceCapabilities(
+                    applyEdit=True, workspaceEdit=WorkspaceEditClientCapabilities(documentChanges=True))),
+                self.content_encodings)
+            # the server compresses (and offloads) what it sends from its result on, which can arrive along with it
+            self.protocol.accepted_encodings = frozenset(self.content_encodings)
+            if self.shared_memory_threshold is not None:
+                self.protocol.shared_memory_prefix = shared_memory.new_prefix()
+                capabilities = shared_memory.offer(capabilities, self.protocol.shared_memory_prefix)
+            self.initialize_result = await self.request('initialize',
+                                                        InitializeParams(processId=os.getpid(),
+                                                                         rootUri=root_uri,
+                                                                         capabilities=capabilities),
+                                                        timeout=timeout)
+        except BaseException:
+            await self.close()
+            raise
+        encoding = compression.agreed(self.initialize_result['capabilities'], self.content_encodings)
+        self.protocol.accepted_encodings = frozenset() if encoding is None else frozenset({encoding})
+        if encoding is not None:
+            self.protocol.content_encoding = encoding
+            self.protocol.compression_threshold = self.compression_threshold
+        prefix = self.protocol.shared_memory_prefix
+        if prefix is not None and shared_memory.accepts(self.initialize_result['capabilities']) == prefix:
+            self.protocol.shared_memory_threshold = self.shared_memory_threshold
+        else:
+            self.protocol.shared_memory_prefix = None
+        self.notify('initialized', InitializedParams())
+        return self
+
+    async def close(self) -> None:
+        """
+        Kill the server, if it's still running, and wait for it to exit.
+        """
+        if self._reader is not None:
+            self._reader.cancel()
+        for task in list(self._background):
+            task.cancel()
+        transport = self.protocol.proctransport
+        if transport.get_returncode() is None:
+            transport.kill()
+        await self.protocol.exited_event.wait()
+        transport.close()
+
+    @property
+    def pid(self) -> int:
+        return self.protocol.proctransport.get_pid()
+
+    def write_request(self, method: str, params: MessageData, notification: bool = False) -> int | None:
+        """
+        Write a request (or notification), returning its id.
+        """
         request = JsonRpcRequest(jsonrpc=JSONRPC_VERSION, method=method, params=params)
         if not notification:
             request['id'] = self.cur_id
             self.cur_id += 1
+        else:
+            self.documents.update(method, params)
         log_send.info("Sent: %s", request)
         self.protocol.write_message(Message(content=request))
+        return request.get('id')
+
+    async def request(self, method: str, params: Any, timeout: float | None = None) -> Any:
+        """
+        Send a request and wait for its result. Error responses are raised as
+        :py:class:`lsp.protocol.JsonRpcException`. If there's no response within ``timeout`` seconds the
+        request is cancelled (with ``$/cancelRequest``) and :py:class:`TimeoutError` raised.
+        """
+        if self.exited:
+            raise ExitedError
+        request_id = self.write_request(method, params)
+        assert request_id is not None
+        future = self._pending[request_id] = asyncio.get_running_loop().create_future()
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except TimeoutError:
+            if not self.exited:
+                self.notify('$/cancelRequest', {'id': request_id})
+            raise
+        finally:
+            self._pending.pop(request_id, None)
+
+    def notify(self, method: str, params: Any) -> None:
+        self.write_request(method, params, notification=True)
+
+    def subscribe(self, method: str, callback: Callable[[Any], None]) -> Callable[[], None]:
+        """
+        Call ``callback`` with the params of every ``method`` notification from the server. Returns a function
+        that unsubscribes it.
+        """
+        self._subscribers.setdefault(method, []).append(callback)
+        return lambda: self._subscribers[method].remove(callback)
+
+    def on_request(self, method: str, handler: Callable[[Any], Any]) -> None:
+        """
+        Answer the server's ``method`` requests with ``handler`` (a function or coroutine function of the
+        params). Raise :py:class:`lsp.protocol.JsonRpcException` from it to respond with an error.
+        """
+        self._request_handlers[method] = handler
+
+    def apply_edit(self, params: ApplyWorkspaceEditParams) -> ApplyWorkspaceEditResult:
+        """
+        Answer ``workspace/applyEdit``: apply the edit to the open :py:attr:`documents`, all of it or none of it, and
+        send the server their new text.
+        """
+        try:
+            edited = apply_workspace_edit(self.documents.documents, params['edit'])
+        except EditError as e:
+            return ApplyWorkspaceEditResult(applied=False, failureReason=str(e))
+        for uri, document in edited.items():
+            identifier = VersionedTextDocumentIdentifier(uri=uri, version=document.version)
+            self.notify(
+                'textDocument/didChange',
+                DidChangeTextDocumentParams(textDocument=identifier,
+                                            contentChanges=[TextDocumentContentChangeEventSimple(text=document.text)]))
+        return ApplyWorkspaceEditResult(applied=True)
+
+    async def _read(self) -> None:
+        try:
+            while True:
+                content: dict[str, Any] = dict((await self.protocol.read_message()).content)
+                if 'method' not in content:
+                    future = self._pending.get(content.get('id', -1))
+                    if future is None or future.done():
+                        log.debug("Response to unknown request %s", content.get('id'))
+                    elif 'error' in content:
+                        error = content['error']
+                        future.set_exception(JsonRpcException(error['code'], error['message'], error.get('data')))
+                    else:
+                        future.set_result(content.get('result'))
+                elif 'id' in content:
+                    task = asyncio.create_task(self._answer(content['id'], content['method'], content.get('params')))
+                    self._background.add(task)
+                    task.add_done_callback(self._background.discard)
+                else:
+                    for callback in list(self._subscribers.get(content['method'], ())):
+                        try:
+                            callback(content.get('params'))
+                        except Exception:
+                            log.exception("Subscriber to %s failed", content['method'])
+        except ExitedError:
+            self.exited = True
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ExitedError())
+
+    async def _answer(self, request_id: int, method: str, params: Any) -> None:
+        response: JsonRpcResponse[Any] = JsonRpcResponse(jsonrpc=JSONRPC_VERSION, id=request_id, result=None)
+        handler = self._request_handlers.get(method)
+        if handler is None and method == 'workspace/applyEdit':
+            handler = self.apply_edit
+        if handler is not None:
+            try:
+                result = handler(params)
+                response['result'] = await result if inspect.isawaitable(result) else result
+            except JsonRpcException as e:
+                response = JsonRpcResponse(jsonrpc=JSONRPC_VERSION, id=request_id, error=e.error)
+            except Exception as e:
+                log.exception("Handler for %s failed", method)
+                response = JsonRpcResponse(jsonrpc=JSONRPC_VERSION,
+                                           id=request_id,
+                                           error=JsonRpcError(code=-32603, message=str(e)))
+        if not self.exited:
+            self.protocol.write_message(Message(content=response))
+
+
+#: what a pool's servers are shared by: the command that starts them and the root they're initialized with
+PoolKey: TypeAlias = tuple[tuple[str, ...], DocumentUri | None]
+
+
+@dataclass
+class _Pooled:
+    client: Client
+    uses: int = 0
+
+
+@dataclass
+class ClientPool:
+    """
+    Initialized servers kept warm for reuse, so that jobs don't each pay for starting and initializing one.
+    Servers are shared between jobs with the same command and root URI, up to :py:attr:`size` of them running for
+    each; once that many are busy, :py:meth:`acquire` waits for one to be released. A server is replaced (in the
+    background, so the next job doesn't wait for it) once it has exited, served :py:attr:`max_uses` jobs or grown
+    past :py:attr:`max_rss`.
+
+    Servers aren't reset between jobs, so a job should close the documents it opens.
+    """
+    #: most servers running for each command and root URI
+    size: int = 4
+    #: how long to wait for a server to initialize
+    timeout: float | None = None
+    #: replace servers after this many jobs
+    max_uses: int | None = None
+    #: replace servers once their resident set is larger than this many bytes, where that can be read
+    max_rss: int | None = None
+    #: each key's idle servers, and a ``None`` for each server that can still be started
+    _slots: dict[PoolKey, asyncio.Queue[_Pooled | None]] = field(default_factory=dict)
+    _background: set[asyncio.Task[None]] = field(default_factory=set)
+    _closed: bool = False
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.close()
+
+    def _queue(self, key: PoolKey) -> asyncio.Queue[_Pooled | None]:
+        if self._closed:
+            raise RuntimeError("Pool is closed")
+        if key not in self._slots:
+            self._slots[key] = asyncio.Queue()
+            for _ in range(self.size):
+                self._slots[key].put_nowait(None)
+        return self._slots[key]
+
+    async def _start(self, key: PoolKey) -> _Pooled:
+        cmd, root_uri = key
+        return _Pooled(await Client().start(list(cmd), self.timeout, root_uri))
+
+    def _spent(self, pooled: _Pooled) -> bool:
+        if pooled.client.protocol.exited_event.is_set() or (self.max_uses is not None and pooled.uses >= self.max_uses):
+            return True
+        return self.max_rss is not None and (rss(pooled.client.pid) or 0) > self.max_rss
+
+    async def warm(self, cmd: list[str], root_uri: DocumentUri | None = None, count: int | None = None) -> None:
+        """
+        Start servers for ``cmd`` and ``root_uri``, concurrently, until ``count`` of them (by default
+        :py:attr:`size`) are running.
+        """
+        key = (tuple(cmd), root_uri)
+        queue = self._queue(key)
+        slots = [queue.get_nowait() for _ in range(queue.qsize())]
+        free = slots.count(None)
+        starting = max(0, min(free, (self.size if count is None else count) - (self.size - free)))
+        for slot in [slot for slot in slots if slot is not None] + [None] * (free - starting):
+            queue.put_nowait(slot)
+        started = await asyncio.gather(*(self._start(key) for _ in range(starting)), return_exceptions=True)
+        for result in started:
+            queue.put_nowait(result if isinstance(result, _Pooled) else None)
+        for result in started:
+            if isinstance(result, BaseException):
+                raise result
+
+    @asynccontextmanager
+    async def acquire(self, cmd: list[str], root_uri: DocumentUri | None = None) -> AsyncIterator[Client]:
+        """
+        An initialized server for ``cmd`` and ``root_uri``: an idle one if there is one, otherwise a new one if
+        fewer than :py:attr:`size` are running, otherwise the next one released.
+        """
+        key = (tuple(cmd), root_uri)
+        queue = self._queue(key)
+        pooled = await queue.get()
+        if self._closed:
+            # pass it on to the next waiter
+            queue.put_nowait(None)
+            raise RuntimeError("Pool is closed")
+        if pooled is not None and pooled.client.protocol.exited_event.is_set():
+            await pooled.client.close()
+            pooled = None
+        if pooled is None:
+            try:
+                pooled = await self._start(key)
+            except BaseException:
+                queue.put_nowait(None)
+                raise
+        try:
+            yield pooled.client
+        finally:
+            pooled.uses += 1
+            if self._closed:
+                await pooled.client.close()
+            elif self._spent(pooled):
+                self._replace(key, pooled)
+            else:
+                queue.put_nowait(pooled)
+
+    def _replace(self, key: PoolKey, pooled: _Pooled) -> None:
+
+        async def replace() -> None:
+            replacement: _Pooled | None = None
+            try:
+                await pooled.client.close()
+                replacement = await self._start(key)
+            except Exception:
+                log.exception("Failed to replace %s", key[0])
+            finally:
+                if self._closed and replacement is not None:
+                    await replacement.client.close()
+                elif not self._closed:
+                    self._slots[key].put_nowait(replacement)
+
+        log.info("Replacing server %s, used %s times", pooled.client.pid, pooled.uses)
+        task = asyncio.create_task(replace())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def close(self) -> None:
+        """
+        Shut down the idle servers. Servers still in use are shut down as they're released.
+        """
+        self._closed = True
+        for task in list(self._background):
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+        for queue in self._slots.values():
+            while not queue.empty():
+                if (pooled := queue.get_nowait()) is not None:
+                    await pooled.client.close()
+            # wakes anything waiting in acquire
+            queue.put_nowait(None)
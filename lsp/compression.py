@@ -0,0 +1,148 @@
+"""
+Compressed message content, for connections over a network, where large ``didOpen`` notifications and completion
+lists are otherwise bound by bandwidth.
+
+The base protocol has no ``Content-Encoding`` header, so its use is negotiated through experimental capabilities:
+the client lists the encodings it accepts, most preferred first, as ``contentEncodings`` in its ``experimental``
+capabilities, and the server answers with the one it picked as ``contentEncoding`` in its own. From then on each
+side compresses content larger than its threshold; the client once it has the ``initialize`` result, the server
+once it's sent it. Each side only decompresses content in the encodings it has offered or agreed to, and only up
+to a limit, so a peer can't have it inflate an arbitrarily large message.
+
+``zlib`` is always available, and ``zstd`` is too with Python 3.14's :py:mod:`compression.zstd` or the
+``zstandard`` package.
+"""
+from __future__ import annotations
+
+import importlib
+import zlib
+from collections.abc import Callable, Iterable
+from functools import cache, partial
+from typing import Any, NamedTuple
+
+#: client ``experimental`` capability: the encodings it accepts
+ACCEPTED = 'contentEncodings'
+#: server ``experimental`` capability: the encoding picked
+AGREED = 'contentEncoding'
+
+
+class Codec(NamedTuple):
+    compress: Callable[[bytes], bytes]
+    #: decompress at most the given number of bytes, raising :py:class:`ValueError` if there are more
+    decompress: Callable[[bytes, int], bytes]
+
+
+def _checked(content: bytes, limit: int, complete: bool) -> bytes:
+    if len(content) > limit:
+        raise ValueError(f"Decompressed content exceeds {limit} bytes")
+    if not complete:
+        raise ValueError("Truncated compressed content")
+    return content
+
+
+def _zlib_decompress(data: bytes, limit: int) -> bytes:
+    decompressor = zlib.decompressobj()
+    # one byte more than the limit is enough to know it's too much, without inflating the rest
+    content = decompressor.decompress(data, limit + 1)
+    return _checked(content, limit, decompressor.eof)
+
+
+def _zstd() -> Codec | None:
+    # neither has stubs everywhere, so they're imported by name
+    try:
+        zstd = importlib.import_module('compression.zstd')
+    except ImportError:
+        pass
+    else:
+
+        def decompress(data: bytes, limit: int) -> bytes:
+            decompressor = zstd.ZstdDecompressor()
+            content = decompressor.decompress(data, limit + 1)
+            return _checked(content, limit, decompressor.eof)
+
+        return Codec(zstd.compress, decompress)
+    try:
+        zstandard = importlib.import_module('zstandard')
+    except ImportError:
+        return None
+
+    def stream(data: bytes, limit: int) -> bytes:
+        # a frame can claim any content size, so it's read in pieces rather than trusting it
+        chunks: list[bytes] = []
+        size = 0
+        with zstandard.ZstdDecompressor().stream_reader(data) as reader:
+            while size <= limit and (chunk := reader.read(limit + 1 - size)):
+                chunks.append(chunk)
+                size += len(chunk)
+        return _checked(b''.join(chunks), limit, True)
+
+    return Codec(zstandard.ZstdCompressor().compress, stream)
+
+
+@cache
+def codecs() -> dict[str, Codec]:
+    """
+    The available encodings, most preferred first.
+    """
+    available: dict[str, Codec] = {}
+    if (zstd := _zstd()) is not None:
+        available['zstd'] = zstd
+    # the fastest level; the content is mostly json, which compresses well regardless
+    available['zlib'] = Codec(partial(zlib.compress, level=1), _zlib_decompress)
+    return available
+
+
+def compress(encoding: str, data: bytes) -> bytes:
+    return codecs()[encoding].compress(data)
+
+
+def decompress(encoding: str, data: bytes, limit: int) -> bytes:
+    """
+    ``data`` decompressed, raising :py:class:`ValueError` if it's invalid or more than ``limit`` bytes.
+    """
+    if encoding not in codecs():
+        raise ValueError(f"Unsupported Content-Encoding {encoding!r}")
+    try:
+        return codecs()[encoding].decompress(data, limit)
+    except ValueError:
+        raise
+    except Exception as e:
+        # zlib.error, and the zstd modules' own errors
+        raise ValueError(f"Invalid {encoding} content: {e}") from e
+
+
+def _experimental(capabilities: Any) -> dict[str, Any]:
+    experimental = capabilities.get('experimental') if isinstance(capabilities, dict) else None
+    return experimental if isinstance(experimental, dict) else {}
+
+
+def advertise(capabilities: Any, encodings: Iterable[str]) -> Any:
+    """
+    A copy of client ``capabilities`` accepting ``encodings`` (or without the capability, if there are none).
+    """
+    experimental = {key: value for key, value in _experimental(capabilities).items() if key != ACCEPTED}
+    if encodings := [encoding for encoding in encodings if encoding in codecs()]:
+        experimental[ACCEPTED] = encodings
+    capabilities = {key: value for key, value in capabilities.items() if key != 'experimental'}
+    if experimental:
+        capabilities['experimental'] = experimental
+    return capabilities
+
+
+def negotiate(client_capabilities: Any, supported: Iterable[str]) -> str | None:
+    """
+    The client's most preferred encoding that is ``supported``, if any.
+    """
+    offered = _experimental(client_capabilities).get(ACCEPTED)
+    if not isinstance(offered, list):
+        return None
+    supported = set(supported) & set(codecs())
+    return next((encoding for encoding in offered if encoding in supported), None)
+
+
+def agreed(server_capabilities: Any, accepted: Iterable[str]) -> str | None:
+    """
+    The encoding the server picked, if it's one of those ``accepted``.
+    """
+    encoding = _experimental(server_capabilities).get(AGREED)
+    return encoding if encoding in set(accepted) & set(codecs()) else None
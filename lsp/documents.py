@@ -0,0 +1,174 @@
+"""
+Server side mirror of the text documents the client has open.
+"""
+from __future__ import annotations
+
+import re
+from bisect import bisect_right
+from collections.abc import Iterator
+from dataclasses import dataclass, field, fields, replace
+from functools import cached_property
+from typing import TYPE_CHECKING, Any, cast
+
+from lsp.edits import replace_ranges
+
+if TYPE_CHECKING:
+    from lsp.lsp.common import DocumentUri, Position
+    from lsp.lsp.server import (DidChangeTextDocumentParams, DidCloseTextDocumentParams, DidOpenTextDocumentParams,
+                                TextDocumentContentChangeEvent, TextDocumentContentChangeEventRange)
+
+_LINE_BREAK = re.compile(r'\r\n|\r|\n')
+
+
+def utf16_to_index(line: str, character: int) -> int:
+    """
+    Convert a utf-16 code unit offset into ``line`` (the LSP default position encoding) into a python str index.
+    """
+    if line.isascii() or max(line) < '\U00010000':
+        return min(character, len(line))
+    units = 0
+    for i, c in enumerate(line):
+        if units >= character:
+            return i
+        units += 2 if c >= '\U00010000' else 1
+    return len(line)
+
+
+@dataclass(frozen=True)
+class TextDocument:
+    """
+    An immutable snapshot of an open document. Every change produces a new snapshot, so a reference held by a
+    handler (or shipped to another process) never changes under it.
+    """
+    uri: DocumentUri
+    language_id: str
+    version: int
+    text: str
+
+    def __getstate__(self) -> dict[str, Any]:
+        # don't ship cached line offsets to other processes
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+    @cached_property
+    def line_offsets(self) -> list[int]:
+        """
+        The offset of the start of every line in :py:attr:`text`.
+        """
+        return [0, *(m.end() for m in _LINE_BREAK.finditer(self.text))]
+
+    def offset_at(self, position: Position) -> int:
+        """
+        Convert a :py:class:`lsp.lsp.common.Position` into an offset into :py:attr:`text`.
+        Positions past the end of a line or the document are clamped.
+        """
+        offsets = self.line_offsets
+        if position['line'] >= len(offsets):
+            return len(self.text)
+        start = offsets[position['line']]
+        end = offsets[position['line'] + 1] if position['line'] + 1 < len(offsets) else len(self.text)
+        line = self.text[start:end].rstrip('\r\n')
+        return start + utf16_to_index(line, position['character'])
+
+    def position_at(self, offset: int) -> Position:
+        """
+        Convert an offset into :py:attr:`text` into a :py:class:`lsp.lsp.common.Position`, the inverse of
+        :py:meth:`offset_at`.
+        """
+        line = bisect_right(self.line_offsets, offset) - 1
+        prefix = self.text[self.line_offsets[line]:offset]
+        # utf-16 code units
+        return {'line': line, 'character': len(prefix) if prefix.isascii() else len(prefix.encode('utf-16-le')) // 2}
+
+    def apply_changes(self, changes: list[TextDocumentContentChangeEvent], version: int) -> TextDocument:
+        """
+        Apply the ``contentChanges`` of a ``didChange``, each to the document as the ones before it left it.
+        """
+        doc = self
+        # consecutive changes that each end before the previous one starts (as multi-cursor edits are usually sent)
+        # don't affect each other's positions, so they're applied together in one pass
+        run: list[TextDocumentContentChangeEventRange] = []
+        for change in changes:
+            if 'range' not in change:
+                doc, run = replace(doc, text=change['text']), []
+                continue
+            change = cast('TextDocumentContentChangeEventRange', change)
+            if run and _position_key(change['range']['end']) > _position_key(run[-1]['range']['start']):
+                doc, run = doc._apply_run(run), []
+            run.append(change)
+        if run:
+            doc = doc._apply_run(run)
+        return replace(doc, version=version)
+
+    def _apply_run(self, run: list[TextDocumentContentChangeEventRange]) -> TextDocument:
+        # reversed, so that inserts at the same position end up in the order they were made in
+        return replace(self, text=replace_ranges(self, ((change['range'], change['text']) for change in reversed(run))))
+
+
+def _position_key(position: Position) -> tuple[int, int]:
+    return position['line'], position['character']
+
+
+@dataclass
+class DocumentStore:
+    """
+    Tracks the text of every open document from ``textDocument/didOpen``, ``didChange`` and ``didClose``.
+    :py:class:`lsp.LanguageServer` keeps it up to date before the corresponding handler is called.
+    """
+    documents: dict[DocumentUri, TextDocument] = field(default_factory=dict)
+
+    def __getitem__(self, uri: DocumentUri) -> TextDocument:
+        return self.documents[uri]
+
+    def __contains__(self, uri: object) -> bool:
+        return uri in self.documents
+
+    def __iter__(self) -> Iterator[DocumentUri]:
+        return iter(self.documents)
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def get(self, uri: DocumentUri) -> TextDocument | None:
+        return self.documents.get(uri)
+
+    def for_params(self, params: Any) -> TextDocument | None:
+        """
+        The document referenced by ``params['textDocument']``, if any.
+        """
+        if not isinstance(params, dict) or not isinstance(params.get('textDocument'), dict):
+            return None
+        return self.documents.get(params['textDocument'].get('uri'))
+
+    def did_open(self, params: DidOpenTextDocumentParams) -> TextDocument:
+        item = params['textDocument']
+        doc = self.documents[item['uri']] = TextDocument(uri=item['uri'],
+                                                         language_id=item['languageId'],
+                                                         version=item['version'],
+                                                         text=item['text'])
+        return doc
+
+    def did_change(self, params: DidChangeTextDocumentParams) -> TextDocument | None:
+        identifier = params['textDocument']
+        if (doc := self.documents.get(identifier['uri'])) is None:
+            return None
+        doc = self.documents[identifier['uri']] = doc.apply_changes(params['contentChanges'], identifier['version'])
+        return doc
+
+    def did_close(self, params: DidCloseTextDocumentParams) -> None:
+        self.documents.pop(params['textDocument']['uri'], None)
+
+    def update(self, method: str, params: Any) -> DocumentUri | None:
+        """
+        Apply a document synchronization notification, returning the uri of the document it was for. Other methods
+        are ignored.
+        """
+        if method == 'textDocument/didOpen':
+            self.did_open(params)
+        elif method == 'textDocument/didChange':
+            self.did_change(params)
+        elif method == 'textDocument/didClose':
+            self.did_close(params)
+        else:
+            return None
+        uri: DocumentUri = params['textDocument']['uri']
+        return uri
@@ -0,0 +1,307 @@
+"""
+Applying :py:class:`lsp.lsp.server.TextEdit`\\ s and :py:class:`lsp.lsp.server.WorkspaceEdit`\\ s to
+:py:class:`lsp.documents.TextDocument`\\ s.
+
+The edits of one ``TextEdit[]`` all refer to the document as it was before any of them, so they're applied
+together rather than one after the other: their positions are converted to offsets, they're sorted (edits at the
+same position keep their order, so several inserts can go in one place) and checked for overlaps, and the new text
+is put together from the unchanged spans between them and their new texts in one pass over the document.
+
+Going the other way, :py:func:`diff_edits` turns a formatter's output into the smallest edits that produce it.
+"""
+from __future__ import annotations
+
+import re
+from bisect import bisect_left
+from collections import Counter
+from collections.abc import Iterable, Mapping, Sequence
+from itertools import accumulate
+from dataclasses import replace
+from operator import itemgetter
+from typing import TYPE_CHECKING, Any, TypeAlias, cast
+
+if TYPE_CHECKING:
+    from lsp.documents import TextDocument
+    from lsp.lsp.common import DocumentUri, Range
+    from lsp.lsp.server import (AnnotatedTextEdit, CreateFile, DeleteFile, RenameFile, TextEdit, WorkspaceEdit)
+
+#: the lines ``a[a_start:a_end]`` are replaced by ``b[b_start:b_end]``
+Hunk: TypeAlias = tuple[int, int, int, int]
+
+_LINE = re.compile(r'[^\r\n]*(?:\r\n|\r|\n)|[^\r\n]+$')
+#: line breaks to str.splitlines, but not to LSP
+_OTHER_BREAKS = re.compile('[\v\f\x1c\x1d\x1e\x85\u2028\u2029]')
+#: give up on finding the smallest diff of lines (characters) past this many insertions and deletions, and replace
+#: what's left in one piece
+_MAX_LINE_COST = 1000
+_MAX_CHAR_COST = 200
+#: Myers' algorithm costs about the square of the insertions and deletions it finds; past this much in all, what's
+#: left of a diff is replaced in one piece
+_MAX_LINE_WORK = 2_000_000
+#: diffed with Myers' algorithm right away, which finds the smallest diff
+_SMALL = 64
+#: the most characters changed lines can have for their characters to be diffed, when lines were inserted or deleted
+#: among them
+_MAX_CHARS = 4096
+#: diffing characters costs about the square of how many changed; past this much, the remaining changed lines are
+#: replaced whole
+_MAX_CHAR_WORK = 1_000_000
+
+
+class EditError(ValueError):
+    """
+    Edits that can't be applied: overlapping, to a document that isn't open or is at another version than they
+    were made for, or file operations.
+    """
+
+
+def _position(range_: Range) -> str:
+    return f"{range_['start']['line']}:{range_['start']['character']}"
+
+
+def replace_ranges(document: TextDocument, replacements: Iterable[tuple[Range, str]]) -> str:
+    """
+    The text of ``document`` with each range replaced by its text, all ranges referring to ``document`` as it is.
+    """
+    spans: list[tuple[int, int, str, Range]] = []
+    for range_, new_text in replacements:
+        start, end = document.offset_at(range_['start']), document.offset_at(range_['end'])
+        if end < start:
+            raise EditError(f"Edit at {_position(range_)} ends before it starts")
+        spans.append((start, end, new_text, range_))
+    # stable, and linear for edits that are already in order (or in reverse)
+    spans.sort(key=itemgetter(0))
+    text = document.text
+    parts = []
+    position = 0
+    for start, end, new_text, range_ in spans:
+        if start < position:
+            raise EditError(f"Edit at {_position(range_)} overlaps the one before it")
+        parts.append(text[position:start])
+        parts.append(new_text)
+        position = end
+    parts.append(text[position:])
+    return ''.join(parts)
+
+
+def apply_text_edits(document: TextDocument, edits: Iterable[TextEdit | AnnotatedTextEdit]) -> str:
+    """
+    The text of ``document`` with ``edits`` applied.
+    """
+    return replace_ranges(document, ((edit['range'], edit['newText']) for edit in edits))
+
+
+def apply_workspace_edit(documents: Mapping[DocumentUri, TextDocument],
+                         edit: WorkspaceEdit) -> dict[DocumentUri, TextDocument]:
+    """
+    The documents ``edit`` changes, with its edits applied and their versions incremented. Nothing is applied unless
+    all of it can be: :py:class:`EditError` is raised instead.
+    """
+    edited: dict[DocumentUri, TextDocument] = {}
+
+    def apply(uri: DocumentUri, version: int | None, edits: list[TextEdit | AnnotatedTextEdit]) -> None:
+        if (original := documents.get(uri)) is None:
+            raise EditError(f"{uri} isn't open")
+        if version is not None and version != original.version:
+            raise EditError(f"{uri} is at version {original.version}, not {version}")
+        document = edited.get(uri, original)
+        edited[uri] = replace(document, text=apply_text_edits(document, edits))
+
+    if 'documentChanges' in edit:
+        # preferred over changes by clients that support them
+        for change in edit['documentChanges']:
+            if 'kind' in change:
+                raise EditError(f"Can't {cast('CreateFile | RenameFile | DeleteFile', change)['kind']} files")
+            apply(change['textDocument']['uri'], change['textDocument']['version'], change['edits'])
+    else:
+        for uri, text_edits in edit.get('changes', {}).items():
+            apply(uri, None, list(text_edits))
+    return {uri: replace(document, version=documents[uri].version + 1) for uri, document in edited.items()}
+
+
+def _unique_matches(a: Sequence[Any], a_start: int, a_end: int, b: Sequence[Any], b_start: int,
+                    b_end: int) -> list[tuple[int, int]]:
+    # patience diff: the longest common subsequence of the items that occur exactly once on each side
+    a_counts, b_counts = Counter(a[a_start:a_end]), Counter(b[b_start:b_end])
+    a_index = {a[i]: i for i in range(a_start, a_end) if a_counts[a[i]] == 1}
+    matches = [(a_index[b[j]], j) for j in range(b_start, b_end) if b_counts[b[j]] == 1 and b[j] in a_index]
+    # patience sorting: the top of each pile, and the match below it on the pile to its left
+    tops: list[int] = []
+    top_matches: list[int] = []
+    previous: list[int] = []
+    for n, (i, _) in enumerate(matches):
+        pile = bisect_left(tops, i)
+        previous.append(top_matches[pile - 1] if pile else -1)
+        if pile == len(tops):
+            tops.append(i)
+            top_matches.append(n)
+        else:
+            tops[pile] = i
+            top_matches[pile] = n
+    sequence = []
+    n = top_matches[-1] if top_matches else -1
+    while n >= 0:
+        sequence.append(matches[n])
+        n = previous[n]
+    return sequence[::-1]
+
+
+def _myers(a: Sequence[Any], a_start: int, a_end: int, b: Sequence[Any], b_start: int, b_end: int,
+           max_cost: int) -> list[Hunk]:
+    n, m = a_end - a_start, b_end - b_start
+    # furthest x reached on each diagonal k = x - y, after each number of insertions and deletions
+    v = {1: 0}
+    trace = []
+    for d in range(min(n + m, max_cost) + 1):
+        trace.append(v.copy())
+        for k in range(-d, d + 1, 2):
+            x = v[k + 1] if k == -d or (k != d and v[k - 1] < v[k + 1]) else v[k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[a_start + x] == b[b_start + y]:
+                x += 1
+                y += 1
+            v[k] = x
+            if x >= n and y >= m:
+                return _hunks(_snakes(trace, n, m), n, m, a_start, b_start)
+    return [(a_start, a_end, b_start, b_end)]
+
+
+def _snakes(trace: list[dict[int, int]], x: int, y: int) -> list[tuple[int, int, int]]:
+    # the runs of matching items on the way back from the end, as (x, y, length)
+    snakes = []
+    for d in range(len(trace) - 1, -1, -1):
+        v = trace[d]
+        k = x - y
+        previous_k = k + 1 if k == -d or (k != d and v[k - 1] < v[k + 1]) else k - 1
+        previous_x = v[previous_k]
+        # one insertion or deletion, then the snake
+        snake_x = previous_x if previous_k == k + 1 else previous_x + 1
+        if x > snake_x:
+            snakes.append((snake_x, snake_x - k, x - snake_x))
+        x, y = previous_x, previous_x - previous_k
+    return snakes[::-1]
+
+
+def _hunks(snakes: list[tuple[int, int, int]], n: int, m: int, a_start: int, b_start: int) -> list[Hunk]:
+    hunks = []
+    x = y = 0
+    for snake_x, snake_y, length in snakes:
+        if snake_x > x or snake_y > y:
+            hunks.append((a_start + x, a_start + snake_x, b_start + y, b_start + snake_y))
+        x, y = snake_x + length, snake_y + length
+    if x < n or y < m:
+        hunks.append((a_start + x, a_start + n, b_start + y, b_start + m))
+    return hunks
+
+
+def diff(a: Sequence[Any],
+         b: Sequence[Any],
+         max_cost: int = _MAX_LINE_COST,
+         max_work: int = _MAX_LINE_WORK) -> list[Hunk]:
+    """
+    The parts of ``a`` to replace with parts of ``b`` to turn it into ``b``, in order: common prefixes and suffixes
+    are skipped, what's left is split at the items that occur once on each side (patience diff), and the parts in
+    between (and small ones) are diffed with Myers' algorithm, up to ``max_cost`` insertions and deletions each.
+    Once about ``max_work`` has gone into that, everything from the first part not yet diffed to the last is
+    replaced in one piece.
+    """
+    hunks = []
+    segments = [(0, len(a), 0, len(b))]
+    work = 0
+    while segments:
+        a_start, a_end, b_start, b_end = segments.pop()
+        while a_start < a_end and b_start < b_end and a[a_start] == b[b_start]:
+            a_start += 1
+            b_start += 1
+        while a_start < a_end and b_start < b_end and a[a_end - 1] == b[b_end - 1]:
+            a_end -= 1
+            b_end -= 1
+        size = a_end - a_start + b_end - b_start
+        if a_start == a_end or b_start == b_end:
+            if size:
+                hunks.append((a_start, a_end, b_start, b_end))
+        elif work > max_work:
+            segments.append((a_start, a_end, b_start, b_end))
+            break
+        elif size > _SMALL and (matches := _unique_matches(a, a_start, a_end, b, b_start, b_end)):
+            for i, j in matches:
+                if i > a_start or j > b_start:
+                    segments.append((a_start, i, b_start, j))
+                a_start, b_start = i + 1, j + 1
+            segments.append((a_start, a_end, b_start, b_end))
+        else:
+            found = _myers(a, a_start, a_end, b, b_start, b_end, max_cost)
+            cost = min(sum(hunk[1] - hunk[0] + hunk[3] - hunk[2] for hunk in found), max_cost)
+            work += cost * cost
+            hunks.extend(found)
+    if segments:
+        # they're diffed from the last, so what's left comes before every hunk found, in the order it was split
+        hunks.append((segments[0][0], segments[-1][1], segments[0][2], segments[-1][3]))
+    hunks.sort()
+    return hunks
+
+
+def _lines(text: str) -> list[str]:
+    # much faster, when it splits the same
+    if _OTHER_BREAKS.search(text) is None:
+        return text.splitlines(keepends=True)
+    lines: list[str] = _LINE.findall(text)
+    return lines
+
+
+def diff_edits(document: TextDocument, new_text: str, range_: Range | None = None) -> list[TextEdit]:
+    """
+    The smallest edits that turn ``document`` into ``new_text``, or just its ``range_`` for range formatting.
+    Unlike one edit replacing everything, they leave the client's cursors and markers outside the changes where
+    they were, and send only what changed: changed lines are found first (see :py:func:`diff`), then the changed
+    characters in them.
+    """
+    text = document.text
+    start, end = (0, len(text)) if range_ is None else (document.offset_at(range_['start']),
+                                                        document.offset_at(range_['end']))
+    old_lines, new_lines = _lines(text[start:end]), _lines(new_text)
+    old_offsets = list(accumulate(map(len, old_lines), initial=0))
+    new_offsets = list(accumulate(map(len, new_lines), initial=0))
+    # as offsets into text, and the new text
+    replacements: list[tuple[int, int, str]] = []
+    budget = _MAX_CHAR_WORK
+
+    def refine(old_start: int, old: str, new: str) -> None:
+        nonlocal budget
+        hunks = diff(old, new, _MAX_CHAR_COST)
+        changed = sum(a_end - a_start + b_end - b_start for a_start, a_end, b_start, b_end in hunks)
+        budget -= changed * changed
+        for a_start, a_end, b_start, b_end in hunks:
+            replacements.append((old_start + a_start, old_start + a_end, new[b_start:b_end]))
+
+    for a_start, a_end, b_start, b_end in diff(old_lines, new_lines):
+        old_start, old_end = start + old_offsets[a_start], start + old_offsets[a_end]
+        size = old_end - old_start + new_offsets[b_end] - new_offsets[b_start]
+        if a_end - a_start == b_end - b_start:
+            # most likely the same lines, changed
+            for i in range(a_end - a_start):
+                if budget <= 0:
+                    replacements.append(
+                        (start + old_offsets[a_start + i], old_end, ''.join(new_lines[b_start + i:b_end])))
+                    break
+                refine(start + old_offsets[a_start + i], old_lines[a_start + i], new_lines[b_start + i])
+        elif budget <= 0 or a_start == a_end or b_start == b_end or size > _MAX_CHARS:
+            replacements.append((old_start, old_end, ''.join(new_lines[b_start:b_end])))
+        else:
+            refine(old_start, text[old_start:old_end], ''.join(new_lines[b_start:b_end]))
+
+    edits: list[TextEdit] = []
+    for old_start, old_end, new in replacements:
+        # positions can't be between the \r and \n of a line break
+        if old_start > 0 and text.startswith('\r\n', old_start - 1):
+            old_start, new = old_start - 1, '\r' + new
+        if old_end > 0 and text.startswith('\r\n', old_end - 1):
+            old_end, new = old_end + 1, new + '\n'
+        edits.append({
+            'range': {
+                'start': document.position_at(old_start),
+                'end': document.position_at(old_end)
+            },
+            'newText': new
+        })
+    return edits
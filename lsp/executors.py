@@ -0,0 +1,151 @@
+"""
+Run :py:class:`lsp.LanguageServer` handlers outside of the event loop.
+"""
+from __future__ import annotations
+
+import asyncio
+import inspect
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Generic, Self, TypeVar, overload
+
+from lsp.documents import TextDocument
+
+if TYPE_CHECKING:
+    from lsp import LanguageServer
+
+T_Params = TypeVar('T_Params')
+T_Result = TypeVar('T_Result')
+T_Handler = TypeVar('T_Handler')
+
+_MAX_CONCURRENCY = '__lsp_max_concurrency__'
+_CONCURRENT = '__lsp_concurrent__'
+
+
+def _invoke(owner: type, name: str, params: Any, document: TextDocument | None) -> Any:
+    # runs in the worker process; the handler is looked up again by name since the function itself
+    # isn't picklable by reference once it's been wrapped
+    handler = inspect.getattr_static(owner, name)
+    assert isinstance(handler, ProcessHandler)
+    return handler.func(params, document)
+
+
+class ProcessHandler(Generic[T_Params, T_Result]):
+    """
+    A handler that runs in the server's :py:attr:`lsp.LanguageServer.process_pool`. See :py:func:`in_process`.
+    """
+
+    def __init__(self, func: Callable[[T_Params, TextDocument | None], T_Result]) -> None:
+        self.func = func
+        self.owner: type | None = None
+        self.name = func.__name__
+        self.__doc__ = func.__doc__
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self.owner = owner
+        self.name = name
+
+    @overload
+    def __get__(self, instance: None, owner: type | None = None) -> Self:
+        ...
+
+    @overload
+    def __get__(self, instance: LanguageServer, owner: type | None = None) -> BoundProcessHandler[T_Params, T_Result]:
+        ...
+
+    def __get__(self,
+                instance: LanguageServer | None,
+                owner: type | None = None) -> Self | BoundProcessHandler[T_Params, T_Result]:
+        if instance is None:
+            return self
+        return BoundProcessHandler(self, instance)
+
+
+@dataclass
+class BoundProcessHandler(Generic[T_Params, T_Result]):
+    handler: ProcessHandler[T_Params, T_Result]
+    server: LanguageServer
+
+    async def __call__(self, params: T_Params) -> T_Result:
+        assert self.handler.owner is not None, "in_process handlers must be defined in a class body"
+        document = self.server.documents.for_params(params)
+        result: T_Result = await asyncio.get_running_loop().run_in_executor(self.server.process_pool, _invoke,
+                                                                            self.handler.owner, self.handler.name,
+                                                                            params, document)
+        return result
+
+
+def in_process(func: Callable[[T_Params, TextDocument | None], T_Result]) -> ProcessHandler[T_Params, T_Result]:
+    """
+    Run a CPU bound handler in a worker process instead of on the event loop, so other messages keep being
+    handled while it runs.
+
+    The decorated function is a plain (non-async) function, without ``self``, that receives the request params
+    and a snapshot of the :py:class:`lsp.documents.TextDocument` referenced by ``params['textDocument']``
+    (or ``None``). Both are pickled over to the worker, as is the result on the way back.
+
+    Requests running in the pool are answered out of order, and can be cancelled by the client with
+    ``$/cancelRequest``; a cancelled request that has already started is abandoned rather than killed.
+
+    .. code-block:: python
+
+        class MyServer(LanguageServer):
+
+            @in_process
+            def text_document__semantic_tokens__full(params: SemanticTokensParams,
+                                                     document: TextDocument | None) -> SemanticTokens | None:
+                ...
+    """
+    return ProcessHandler(func)
+
+
+def max_concurrency(limit: int) -> Callable[[T_Handler], T_Handler]:
+    """
+    Cap how many messages for a handler run at once. Applies to handlers run off the loop: plain ``def``
+    handlers (see :py:attr:`lsp.LanguageServer.thread_pool`) and :py:func:`in_process` handlers. Messages over
+    the limit wait their turn without holding up other methods.
+
+    .. code-block:: python
+
+        class MyServer(LanguageServer):
+
+            @max_concurrency(2)
+            def workspace__symbol(self, params: WorkspaceSymbolParams) -> list[WorkspaceSymbol] | None:
+                return query_sqlite(params['query'])
+    """
+
+    def decorator(handler: T_Handler) -> T_Handler:
+        setattr(handler, _MAX_CONCURRENCY, limit)
+        return handler
+
+    return decorator
+
+
+def concurrency_limit(handler: Callable[..., Any]) -> int | None:
+    """
+    The :py:func:`max_concurrency` of a (bound) handler, if any.
+    """
+    if isinstance(handler, BoundProcessHandler):
+        return getattr(handler.handler, _MAX_CONCURRENCY, None)
+    return getattr(handler, _MAX_CONCURRENCY, None)
+
+
+def concurrent(handler: T_Handler) -> T_Handler:
+    """
+    Answer an event loop handler's requests out of order, rather than holding up the messages behind it until
+    it returns. The handler is still called in message order, so anything it does before its first ``await``
+    (or, for a plain function returning an awaitable, before returning) happens in order.
+    """
+    setattr(handler, _CONCURRENT, True)
+    return handler
+
+
+def is_concurrent(handler: Callable[..., Any]) -> bool:
+    return getattr(handler, _CONCURRENT, False)
+
+
+def runs_in_thread(handler: Callable[..., Any]) -> bool:
+    """
+    Whether a handler is a plain function, run on :py:attr:`lsp.LanguageServer.thread_pool`, rather than a
+    coroutine function or a decorator wrapping one.
+    """
+    return not (inspect.iscoroutinefunction(handler) or inspect.iscoroutinefunction(inspect.unwrap(handler)))
@@ -0,0 +1,265 @@
+"""
+Matching for LSP glob patterns (:py:class:`lsp.lsp.server.FileOperationPattern` and
+:py:class:`lsp.lsp.server.DocumentFilter`).
+
+Every pattern in a :py:class:`GlobSet` is compiled into a single combined regular expression, and paths are
+first checked against an index of the literal file extensions the patterns end with, so a batch of paths that
+no pattern could match is rejected without running any regex at all.
+
+A :py:class:`lsp.session.Session` uses them to leave out the files of ``workspace/*Files`` messages that the
+server didn't register for, and to answer requests about documents outside of a provider's registered
+``documentSelector`` without calling the handler.
+"""
+from __future__ import annotations
+
+import posixpath
+import re
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Mapping, TypeVar
+from urllib.parse import unquote, urlsplit
+
+if TYPE_CHECKING:
+    from lsp.lsp.common import FileOperationPatternKind
+    from lsp.lsp.server import DocumentFilter, FileOperationFilter
+
+T_File = TypeVar('T_File', bound=Mapping[str, Any])
+
+_LITERAL_EXTENSION = re.compile(r'\.([^./*?\[\]{}]+)$')
+_LITERAL_EXTENSIONS = re.compile(r'\.\{([^/*?\[\]{}]+)\}$')
+_CLASS_SPECIAL = re.compile(r'[\\\[\]^]')
+
+
+def translate(pattern: str) -> str:
+    """
+    Translate an LSP glob pattern into a regular expression matching a whole ``/`` separated path.
+
+    * ``*`` matches any number of characters within a path segment, ``?`` matches one
+    * ``**`` as a whole segment matches any number of segments, including none
+    * ``{a,b}`` matches either alternative (and may nest)
+    * ``[0-9]`` / ``[!0-9]`` match one character in / not in the range
+
+    Patterns not starting with ``/`` may match any trailing part of the path, so ``*.py`` matches every
+    python file and ``src/*.py`` matches the python files of every ``src`` directory.
+    """
+    out = [] if pattern.startswith('/') else ['(?:.*/)?']
+    depth = 0
+    i = 0
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == '*':
+            if pattern.startswith('**', i):
+                end = i + 2
+                if (i == 0 or pattern[i - 1] == '/') and (end == n or pattern[end] == '/'):
+                    if end < n:
+                        out.append('(?:[^/]*/)*')
+                        i = end + 1
+                    else:
+                        out.append('.*')
+                        i = end
+                    continue
+                i = end
+            else:
+                i += 1
+            out.append('[^/]*')
+            continue
+        if c == '?':
+            out.append('[^/]')
+        elif c == '[':
+            negate = pattern.startswith('[!', i)
+            start = i + 2 if negate else i + 1
+            # a ``]`` straight after the opening bracket is part of the set
+            close = pattern.find(']', start + 1)
+            if close == -1:
+                out.append(re.escape(c))
+            else:
+                body = _CLASS_SPECIAL.sub(r'\\\g<0>', pattern[start:close])
+                out.append(f'[^/{body}]' if negate else f'[{body}]')
+                i = close + 1
+                continue
+        elif c == '{':
+            depth += 1
+            out.append('(?:')
+        elif c == ',' and depth:
+            out.append('|')
+        elif c == '}' and depth:
+            depth -= 1
+            out.append(')')
+        else:
+            out.append(re.escape(c))
+        i += 1
+    out.append(')' * depth)
+    return ''.join(out)
+
+
+def extensions(pattern: str) -> set[str] | None:
+    """
+    The (lowercased) file extensions every path matched by ``pattern`` must have, or ``None`` if it isn't
+    limited to particular extensions.
+    """
+    last = pattern.rsplit('/', 1)[-1]
+    if (m := _LITERAL_EXTENSION.search(last)) is not None:
+        return {m[1].lower()}
+    if (m := _LITERAL_EXTENSIONS.search(last)) is not None and '.' not in m[1]:
+        return {ext.lower() for ext in m[1].split(',')}
+    return None
+
+
+def extension(path: str) -> str:
+    return posixpath.basename(path).rpartition('.')[2].lower()
+
+
+@dataclass
+class GlobSet:
+    """
+    A set of glob patterns matched together.
+    """
+    patterns: list[tuple[str, bool]] = field(default_factory=list)
+    _regex: re.Pattern[str] | None = None
+    _regexes: list[re.Pattern[str]] = field(default_factory=list)
+    _by_extension: dict[str, list[int]] = field(default_factory=dict)
+    _any_extension: list[int] = field(default_factory=list)
+
+    def add(self, pattern: str, ignore_case: bool = False) -> int:
+        """
+        Add a pattern, returning its index.
+        """
+        self.patterns.append((pattern, ignore_case))
+        self._regex = None
+        return len(self.patterns) - 1
+
+    def _compile(self) -> re.Pattern[str]:
+        self._regexes = []
+        self._by_extension = {}
+        self._any_extension = []
+        parts = []
+        for i, (pattern, ignore_case) in enumerate(self.patterns):
+            source = translate(pattern)
+            if ignore_case:
+                source = f'(?i:{source})'
+            parts.append(source)
+            self._regexes.append(re.compile(source))
+            if (exts := extensions(pattern)) is None:
+                self._any_extension.append(i)
+            else:
+                for ext in exts:
+                    self._by_extension.setdefault(ext, []).append(i)
+        # each pattern is a capturing group, so a match's lastindex is the first pattern that matched; an empty
+        # set matches nothing
+        self._regex = re.compile('|'.join(f'({p})' for p in parts) or '(?!)')
+        return self._regex
+
+    def _candidates(self, path: str) -> list[int]:
+        by_extension = self._by_extension.get(extension(path))
+        if by_extension is None:
+            return self._any_extension
+        if not self._any_extension:
+            return by_extension
+        return sorted({*by_extension, *self._any_extension})
+
+    def first(self, path: str) -> int | None:
+        """
+        The index of the first pattern that matches ``path``, found in a single pass of the combined regex.
+        """
+        regex = self._regex or self._compile()
+        if not self._any_extension and extension(path) not in self._by_extension:
+            return None
+        if (m := regex.fullmatch(path)) is None:
+            return None
+        assert m.lastindex is not None
+        return m.lastindex - 1
+
+    def match(self, path: str) -> bool:
+        """
+        Whether any pattern matches ``path``.
+        """
+        return self.first(path) is not None
+
+    def matching(self, path: str) -> list[int]:
+        """
+        The indices of every pattern that matches ``path``.
+        """
+        if self._regex is None:
+            self._compile()
+        return [i for i in self._candidates(path) if self._regexes[i].fullmatch(path)]
+
+
+def uri_path(uri: str) -> tuple[str, str]:
+    """
+    Split a uri into its scheme and (unquoted) path.
+    """
+    parts = urlsplit(uri)
+    return parts.scheme, unquote(parts.path)
+
+
+class FileOperationMatcher:
+    """
+    Matches uris against the :py:class:`lsp.lsp.server.FileOperationFilter` s a server registered for a file
+    operation.
+    """
+
+    def __init__(self, filters: Iterable[FileOperationFilter]) -> None:
+        self.filters = list(filters)
+        self.globs = GlobSet()
+        for f in self.filters:
+            self.globs.add(f['pattern']['glob'], f['pattern'].get('options', {}).get('ignoreCase', False))
+
+    def matches(self, uri: str, kind: FileOperationPatternKind | None = None) -> bool:
+        """
+        Whether any filter matches ``uri``. If the ``kind`` of the file isn't known, filters restricted to
+        files or folders are assumed to match it.
+        """
+        scheme, path = uri_path(uri)
+        if (first := self.globs.first(path)) is None:
+            return False
+        if self._accepts(first, scheme, kind):
+            return True
+        # only when the first filter matching the path is for another scheme or kind are the rest tried one by one
+        return any(self._accepts(i, scheme, kind) for i in self.globs.matching(path) if i > first)
+
+    def _accepts(self, i: int, scheme: str, kind: FileOperationPatternKind | None) -> bool:
+        f = self.filters[i]
+        if 'scheme' in f and f['scheme'] != scheme:
+            return False
+        return kind is None or f['pattern'].get('matches', kind) == kind
+
+    def filter(self, files: list[T_File]) -> list[T_File]:
+        """
+        The :py:class:`lsp.lsp.server.FileCreate`, ``FileRename`` or ``FileDelete`` s matching any filter. Renames
+        match on either their old or new uri.
+        """
+        return [f for f in files if any(self.matches(f[key]) for key in ('uri', 'oldUri', 'newUri') if key in f)]
+
+
+class DocumentSelectorMatcher:
+    """
+    Matches documents against a :py:data:`lsp.lsp.server.DocumentSelector`.
+    """
+
+    def __init__(self, selector: Iterable[DocumentFilter]) -> None:
+        self.filters = list(selector)
+        self.globs = GlobSet()
+        self._globs: dict[int, int] = {}
+        for i, f in enumerate(self.filters):
+            if 'pattern' in f:
+                self._globs[i] = self.globs.add(f['pattern'])
+
+    def matches(self, uri: str, language_id: str | None = None) -> bool:
+        """
+        Whether any filter matches the document. If its language isn't known, filters restricted to a language
+        are assumed to match it.
+        """
+        scheme, path = uri_path(uri)
+        patterns = set()
+        for i, f in enumerate(self.filters):
+            if language_id is not None and 'language' in f and f['language'] != language_id:
+                continue
+            if 'scheme' in f and f['scheme'] != scheme:
+                continue
+            if i not in self._globs:
+                return True
+            patterns.add(self._globs[i])
+        if not patterns or (first := self.globs.first(path)) is None:
+            return False
+        return first in patterns or any(i in patterns for i in self.globs.matching(path) if i > first)
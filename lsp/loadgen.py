@@ -0,0 +1,297 @@
+"""
+Load generator: replays simulated editing sessions against a language server subprocess and reports latency
+percentiles and throughput per method.
+
+.. code-block:: console
+
+    $ python -m lsp.loadgen --concurrency 8 --duration 30 --file big_module.py -- python -m my_server
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import string
+import sys
+import time
+from contextlib import AsyncExitStack
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from lsp.client import Client, ExitedError
+from lsp.lsp.common import DocumentUri, Position, Range
+from lsp.lsp.server import (CompletionParams, DidChangeTextDocumentParams, DidCloseTextDocumentParams,
+                            DidOpenTextDocumentParams, HoverParams, SemanticTokensParams,
+                            TextDocumentContentChangeEvent, TextDocumentContentChangeEventRange,
+                            TextDocumentContentChangeEventSimple, TextDocumentIdentifier, TextDocumentItem,
+                            VersionedTextDocumentIdentifier)
+from lsp.protocol import JsonRpcException
+
+COMPLETION = 'textDocument/completion'
+HOVER = 'textDocument/hover'
+SEMANTIC_TOKENS = 'textDocument/semanticTokens/full'
+
+SAMPLE = ''.join(f'def function_{i}(argument: int) -> int:\n    return argument * {i}\n\n\n' for i in range(200))
+
+
+@dataclass
+class LoadProfile:
+    """
+    The shape of the simulated load. Every editor opens its own copy of the document, then repeatedly types a
+    burst of characters at the end of a random line (one incremental ``didChange`` per keystroke, with a
+    completion request every few keystrokes), hovers somewhere, requests semantic tokens, and pauses.
+    Only methods the server advertises in its capabilities are requested.
+    """
+    #: simultaneous editing sessions
+    concurrency: int = 4
+    #: server processes the editors are spread over
+    processes: int = 1
+    #: seconds to generate load for
+    duration: float = 10
+    #: keystrokes per burst of typing
+    burst: int = 8
+    #: request completion every this many keystrokes
+    completion_every: int = 2
+    #: seconds between keystrokes
+    keystroke_interval: float = 0.05
+    #: seconds to pause between bursts
+    think_time: float = 0.25
+    #: seconds to wait for a response before counting the request as unanswered
+    timeout: float = 5
+    seed: int = 0
+
+
+@dataclass
+class MethodStats:
+    #: response latencies, in nanoseconds
+    latencies: list[int] = field(default_factory=list)
+    errors: int = 0
+    timeouts: int = 0
+
+    @property
+    def count(self) -> int:
+        return len(self.latencies) + self.timeouts
+
+    def percentile(self, q: float) -> float:
+        """
+        The ``q`` th percentile latency in milliseconds (nearest rank).
+        """
+        if not self.latencies:
+            return math.nan
+        ordered = sorted(self.latencies)
+        return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)] / 1e6
+
+
+@dataclass
+class Report:
+    methods: dict[str, MethodStats] = field(default_factory=dict)
+    notifications: int = 0
+    #: seconds the load ran for
+    elapsed: float = 0
+
+    def stats(self, method: str) -> MethodStats:
+        if (stats := self.methods.get(method)) is None:
+            stats = self.methods[method] = MethodStats()
+        return stats
+
+    def throughput(self, method: str | None = None) -> float:
+        """
+        Responses per second, for one method or overall.
+        """
+        methods = self.methods.values() if method is None else [self.stats(method)]
+        return sum(len(s.latencies) for s in methods) / self.elapsed if self.elapsed else 0
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            'elapsed': self.elapsed,
+            'notifications': self.notifications,
+            'throughput': self.throughput(),
+            'methods': {
+                method: {
+                    'count': stats.count,
+                    'errors': stats.errors,
+                    'timeouts': stats.timeouts,
+                    'p50': stats.percentile(50),
+                    'p95': stats.percentile(95),
+                    'p99': stats.percentile(99),
+                    'throughput': self.throughput(method),
+                }
+                for method, stats in sorted(self.methods.items())
+            },
+        }
+
+    def format(self) -> str:
+        rows = [
+            f"{'method':<36} {'count':>7} {'errors':>7} {'timeouts':>8} "
+            f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9}"
+        ]
+        for method, stats in sorted(self.methods.items()):
+            rows.append(f'{method:<36} {stats.count:>7} {stats.errors:>7} {stats.timeouts:>8} '
+                        f'{stats.percentile(50):>9.2f} {stats.percentile(95):>9.2f} {stats.percentile(99):>9.2f} '
+                        f'{self.throughput(method):>9.1f}')
+        rows.append(f'{self.notifications} notifications, {self.throughput():.1f} responses/s over {self.elapsed:.1f}s')
+        return '\n'.join(rows)
+
+
+@dataclass
+class Connection:
+    """
+    One server process, shared by several editors.
+    """
+    client: Client
+    report: Report
+    timeout: float
+
+    @property
+    def exited(self) -> bool:
+        return self.client.exited
+
+    @property
+    def capabilities(self) -> dict[str, Any]:
+        return dict(self.client.initialize_result['capabilities']) if self.client.initialize_result else {}
+
+    def notify(self, method: str, params: Any) -> None:
+        if not self.exited:
+            self.client.notify(method, params)
+            self.report.notifications += 1
+
+    async def request(self, method: str, params: Any) -> None:
+        """
+        Send a request and record how long it took to be answered.
+        """
+        if self.exited:
+            return
+        stats = self.report.stats(method)
+        start = time.perf_counter_ns()
+        try:
+            await self.client.request(method, params, timeout=self.timeout)
+        except TimeoutError:
+            stats.timeouts += 1
+            return
+        except (JsonRpcException, ExitedError):
+            stats.errors += 1
+        stats.latencies.append(time.perf_counter_ns() - start)
+
+
+def _change_kind(capabilities: dict[str, Any]) -> int:
+    sync = capabilities.get('textDocumentSync', 2)
+    return sync if isinstance(sync, int) else sync.get('change', 2)
+
+
+async def _edit(connection: Connection, profile: LoadProfile, editor: int, text: str, name: str, language_id: str,
+                deadline: float) -> None:
+    rng = random.Random(f'{profile.seed}-{editor}')
+    capabilities = connection.capabilities
+    incremental = _change_kind(capabilities) != 1
+    uri = DocumentUri(f'file:///loadgen/{editor}/{name}')
+    document = TextDocumentIdentifier(uri=uri)
+    lines = text.split('\n')
+    version = 1
+    connection.notify(
+        'textDocument/didOpen',
+        DidOpenTextDocumentParams(
+            textDocument=TextDocumentItem(uri=uri, languageId=language_id, version=version, text=text)))
+    while time.monotonic() < deadline and not connection.exited:
+        line = rng.randrange(len(lines))
+        pending = []
+        for keystroke in range(1, profile.burst + 1):
+            typed = rng.choice(string.ascii_lowercase + ' ')
+            at = Position(line=line, character=len(lines[line]))
+            lines[line] += typed
+            version += 1
+            change: TextDocumentContentChangeEvent
+            if incremental:
+                change = TextDocumentContentChangeEventRange(range=Range(start=at, end=at), text=typed)
+            else:
+                change = TextDocumentContentChangeEventSimple(text='\n'.join(lines))
+            connection.notify(
+                'textDocument/didChange',
+                DidChangeTextDocumentParams(textDocument=VersionedTextDocumentIdentifier(uri=uri, version=version),
+                                            contentChanges=[change]))
+            if 'completionProvider' in capabilities and keystroke % profile.completion_every == 0:
+                position = Position(line=line, character=len(lines[line]))
+                pending.append(
+                    asyncio.create_task(
+                        connection.request(COMPLETION, CompletionParams(textDocument=document, position=position))))
+            await asyncio.sleep(profile.keystroke_interval)
+        if capabilities.get('hoverProvider'):
+            hover_line = rng.randrange(len(lines))
+            position = Position(line=hover_line, character=rng.randint(0, len(lines[hover_line])))
+            pending.append(
+                asyncio.create_task(connection.request(HOVER, HoverParams(textDocument=document, position=position))))
+        if 'semanticTokensProvider' in capabilities:
+            pending.append(
+                asyncio.create_task(connection.request(SEMANTIC_TOKENS, SemanticTokensParams(textDocument=document))))
+        await asyncio.gather(*pending)
+        await asyncio.sleep(profile.think_time)
+    connection.notify('textDocument/didClose', DidCloseTextDocumentParams(textDocument=document))
+
+
+async def run_load(command: list[str],
+                   profile: LoadProfile | None = None,
+                   text: str = SAMPLE,
+                   name: str = 'loadgen.py',
+                   language_id: str = 'python') -> Report:
+    """
+    Run :py:class:`LoadProfile` against ``command``, a language server speaking over stdio.
+    Raises :py:class:`lsp.client.ExitedError` if a server process exits early.
+    """
+    profile = profile or LoadProfile()
+    report = Report()
+    async with AsyncExitStack() as stack:
+        connections = []
+        for _ in range(profile.processes):
+            client = await stack.enter_async_context(Client().run(command))
+            connections.append(Connection(client, report, profile.timeout))
+        start = time.monotonic()
+        await asyncio.gather(*(_edit(connections[editor %
+                                                 len(connections)], profile, editor, text, name, language_id, start +
+                                     profile.duration) for editor in range(profile.concurrency)))
+        report.elapsed = time.monotonic() - start
+    if any(connection.exited for connection in connections):
+        raise ExitedError
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog='python -m lsp.loadgen', description=__doc__.strip().splitlines()[0])
+    defaults = LoadProfile()
+    parser.add_argument('--concurrency', type=int, default=defaults.concurrency, help="simultaneous editors")
+    parser.add_argument('--processes', type=int, default=defaults.processes, help="server processes")
+    parser.add_argument('--duration', type=float, default=defaults.duration, help="seconds to run for")
+    parser.add_argument('--burst', type=int, default=defaults.burst, help="keystrokes per burst")
+    parser.add_argument('--completion-every', type=int, default=defaults.completion_every)
+    parser.add_argument('--keystroke-interval', type=float, default=defaults.keystroke_interval)
+    parser.add_argument('--think-time', type=float, default=defaults.think_time)
+    parser.add_argument('--timeout', type=float, default=defaults.timeout)
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+    parser.add_argument('--file', type=Path, help="document to edit, instead of a generated one")
+    parser.add_argument('--language-id', default='python')
+    parser.add_argument('--json', action='store_true', help="print the report as json")
+    parser.add_argument('command', nargs=argparse.REMAINDER, help="server command")
+    args = parser.parse_args()
+    command = args.command[1:] if args.command[:1] == ['--'] else args.command
+    if not command:
+        parser.error("a server command is required")
+    profile = LoadProfile(concurrency=args.concurrency,
+                          processes=args.processes,
+                          duration=args.duration,
+                          burst=args.burst,
+                          completion_every=args.completion_every,
+                          keystroke_interval=args.keystroke_interval,
+                          think_time=args.think_time,
+                          timeout=args.timeout,
+                          seed=args.seed)
+    text, name = (args.file.read_text(), args.file.name) if args.file else (SAMPLE, 'loadgen.py')
+    try:
+        report = asyncio.run(run_load(command, profile, text, name, args.language_id))
+    except ExitedError:
+        sys.exit("server exited during the run")
+    print(json.dumps(report.as_dict(), indent=2) if args.json else report.format())
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,18 @@
-from lsp.lsp import client, common, messages, server
+"""
+The protocol's types. The submodules are only imported when first used, since defining every ``TypedDict`` in
+them takes a noticeable part of a server's startup time, and most of them are only needed for annotations.
+"""
+import importlib
+from types import ModuleType
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from lsp.lsp import client, common, messages, server
 
 __all__ = ['client', 'common', 'messages', 'server']
+
+
+def __getattr__(name: str) -> ModuleType:
+    if name in __all__:
+        return importlib.import_module(f'{__name__}.{name}')
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -2844,6 +2844,42 @@ class WorkspaceEdit(MessageData):
     changeAnnotations: NotRequired[dict[ChangeAnnotationIdentifier, ChangeAnnotation]]
 
 
+class ApplyWorkspaceEditParams(MessageData):
+    #
+    # An optional label of the workspace edit. This label is
+    # presented in the user interface for example on an undo
+    # stack to undo the workspace edit.
+    #
+    label: NotRequired[str]
+
+    #
+    # The edits to apply.
+    #
+    edit: WorkspaceEdit
+
+
+class ApplyWorkspaceEditResult(MessageData):
+    #
+    # Indicates whether the edit was applied or not.
+    #
+    applied: bool
+
+    #
+    # An optional textual description for why the edit was not applied.
+    # This may be used by the server for diagnostic logging or to provide
+    # a suitable error for a request that triggered the edit.
+    #
+    failureReason: NotRequired[str]
+
+    #
+    # Depending on the client's failure handling strategy `failedChange`
+    # might contain the index of the change that failed. This property is
+    # only available if the client signals a `failureHandling` strategy
+    # in its client capabilities.
+    #
+    failedChange: NotRequired[int]
+
+
 class CodeActionDisabled(MessageData):
 
     #
@@ -0,0 +1,197 @@
+"""
+Where a server's memory goes: explicit accounting of each session's buffers, queues and documents and of the
+caches registered with :py:meth:`MemoryTracker.register`, plus optional :py:mod:`tracemalloc` snapshots.
+
+The ``$/memory`` request responds with :py:meth:`MemoryTracker.report`. It takes ``{"top": n, "trace": bool}``
+(both optional): ``"trace": true`` starts :py:mod:`tracemalloc` (which slows allocation down noticeably, so it's
+off until asked for) and ``"trace": false`` stops it. While tracing, each report includes the ``top`` allocation
+sites and how much each grew since the previous report, which is usually enough to find a leak: request a
+report, repeat whatever seems to leak, and request another.
+
+With :py:attr:`lsp.LanguageServer.memory_log_interval` set, :py:meth:`MemoryTracker.summary` is also logged
+periodically.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import tracemalloc
+from collections.abc import Iterable
+from dataclasses import dataclass, field, fields, is_dataclass
+from functools import partial
+from types import FunctionType, MethodType, ModuleType
+from typing import TYPE_CHECKING, Any, Callable, NotRequired, TypedDict
+
+if TYPE_CHECKING:
+    from lsp.session import Session
+
+
+class MemoryParams(TypedDict):
+    #: how many allocation sites to report
+    top: NotRequired[int]
+    #: start or stop tracemalloc
+    trace: NotRequired[bool]
+
+
+def deep_sizeof(obj: Any) -> int:
+    """
+    The size of ``obj`` and everything it refers to through containers, dataclass fields and instance
+    dictionaries, each object counted once.
+    """
+    seen: set[int] = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, (str, bytes, bytearray, int, float, type, ModuleType, FunctionType, MethodType)):
+            continue
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif is_dataclass(obj) and hasattr(obj, '__slots__'):
+            stack.extend(getattr(obj, f.name) for f in fields(obj))
+        elif hasattr(obj, '__dict__'):
+            stack.append(vars(obj))
+    return size
+
+
+def rss(pid: int | None = None) -> int | None:
+    """
+    The resident set size in bytes of this process (or ``pid``), where it can be read (Linux).
+    """
+    try:
+        with open(f'/proc/{pid or "self"}/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def session_memory(session: Session) -> dict[str, int]:
+    """
+    Bytes held by a session's read buffer, unhandled messages, unsent output and open documents.
+    """
+    protocol = session.protocol
+    # the queue's own storage; asyncio.Queue has no public way to look at what's waiting
+    queued = getattr(protocol.out_queue, '_queue', ())
+    transport = getattr(protocol, 'transport', None)
+    return {
+        'readBuffer': protocol.buf_size,
+        'buffered': protocol.cursor,
+        'queuedMessages': len(queued),
+        'queuedBytes': sum(msg.content_len for msg in queued),
+        'writeBuffer': transport.get_write_buffer_size() if transport is not None else 0,
+        'documents': len(session.documents),
+        'documentBytes': sum(sys.getsizeof(session.documents[uri].text) for uri in session.documents),
+        'inFlight': len(session._in_flight),
+    }
+
+
+def _site(stat: tracemalloc.Statistic | tracemalloc.StatisticDiff) -> str:
+    frame = stat.traceback[0]
+    return f'{frame.filename}:{frame.lineno}'
+
+
+_IGNORED_TRACES = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<unknown>'),
+]
+
+
+@dataclass
+class MemoryTracker:
+    """
+    Memory accounting for a :py:class:`lsp.LanguageServer`, across all its sessions.
+    """
+    #: sizes of the caches registered with :py:meth:`register`, by name
+    caches: dict[str, Callable[[], int]] = field(default_factory=dict)
+    _snapshot: tracemalloc.Snapshot | None = None
+    _last_traced: int = 0
+
+    def register(self, name: str, cache: Any, size: Callable[[Any], int] = deep_sizeof) -> None:
+        """
+        Include ``cache`` (measured with ``size``) in reports. Caches are held onto for as long as they're
+        registered.
+        """
+        self.caches[name] = partial(size, cache)
+
+    def unregister(self, name: str) -> None:
+        self.caches.pop(name, None)
+
+    def start_tracing(self, frames: int = 1) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            self._snapshot = None
+
+    def stop_tracing(self) -> None:
+        tracemalloc.stop()
+        self._snapshot = None
+
+    def snapshot(self, top: int = 10) -> dict[str, Any] | None:
+        """
+        The ``top`` allocation sites by size, and by growth since the previous snapshot, if tracing.
+        """
+        if not tracemalloc.is_tracing():
+            return None
+        snapshot = tracemalloc.take_snapshot().filter_traces(_IGNORED_TRACES)
+        current, peak = tracemalloc.get_traced_memory()
+        report: dict[str, Any] = {
+            'current': current,
+            'peak': peak,
+            'top': [{
+                'site': _site(stat),
+                'size': stat.size,
+                'count': stat.count
+            } for stat in snapshot.statistics('lineno')[:top]],
+        }
+        if self._snapshot is not None:
+            report['growth'] = [{
+                'site': _site(stat),
+                'size': stat.size,
+                'sizeDiff': stat.size_diff,
+                'countDiff': stat.count_diff
+            } for stat in snapshot.compare_to(self._snapshot, 'lineno')[:top] if stat.size_diff > 0]
+        self._snapshot = snapshot
+        return report
+
+    def report(self, sessions: Iterable[Session], top: int = 10) -> dict[str, Any]:
+        """
+        The ``$/memory`` response. Sizes are in bytes.
+        """
+        report: dict[str, Any] = {
+            'rss': rss(),
+            'sessions': [session_memory(session) for session in sessions],
+            'caches': {name: size() for name, size in sorted(self.caches.items())},
+        }
+        if (snapshot := self.snapshot(top)) is not None:
+            report['tracemalloc'] = snapshot
+        return report
+
+    def summary(self, sessions: Iterable[Session]) -> str:
+        """
+        A one line summary, cheap enough to log regularly.
+        """
+        totals: dict[str, int] = {}
+        for session in sessions:
+            for key, value in session_memory(session).items():
+                totals[key] = totals.get(key, 0) + value
+        parts = [f"rss={_mb(size)}" if (size := rss()) is not None else "rss=?"]
+        parts.append(f"buffers={_mb(totals.get('readBuffer', 0) + totals.get('writeBuffer', 0))}")
+        parts.append(f"queued={totals.get('queuedMessages', 0)}/{_mb(totals.get('queuedBytes', 0))}")
+        parts.append(f"documents={totals.get('documents', 0)}/{_mb(totals.get('documentBytes', 0))}")
+        parts.extend(f"{name}={_mb(size())}" for name, size in sorted(self.caches.items()))
+        if tracemalloc.is_tracing():
+            traced, _ = tracemalloc.get_traced_memory()
+            parts.append(f"traced={_mb(traced)} ({traced - self._last_traced:+,d}B)")
+            self._last_traced = traced
+        return ' '.join(parts)
+
+
+def _mb(size: int) -> str:
+    return f'{size / 2**20:.1f}MB'
@@ -0,0 +1,167 @@
+"""
+Per-method request metrics, collected by :py:class:`lsp.session.Session` as it dispatches messages.
+
+Reported to clients by the ``$/metrics`` request, and written in the Prometheus text format to
+:py:attr:`lsp.LanguageServer.metrics_file` every :py:attr:`lsp.LanguageServer.metrics_interval` seconds
+if it's set.
+"""
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+# values are bucketed by their top _SUB_BITS + 1 significant bits, so every bucket is within ~6% of its values
+_SUB_BITS = 4
+_SUB_COUNT = 1 << _SUB_BITS
+
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+def _bucket(value: int) -> int:
+    if value < 2 * _SUB_COUNT:
+        return max(value, 0)
+    exponent = value.bit_length() - 1
+    return _SUB_COUNT * (exponent - _SUB_BITS) + (value >> (exponent - _SUB_BITS))
+
+
+def _bucket_upper(bucket: int) -> int:
+    """
+    The largest value in ``bucket``.
+    """
+    if bucket < 2 * _SUB_COUNT:
+        return bucket
+    shift, sub = divmod(bucket, _SUB_COUNT)
+    return ((_SUB_COUNT + sub + 1) << (shift - 1)) - 1
+
+
+@dataclass
+class Histogram:
+    """
+    A log-linear (HDR style) histogram of nanosecond durations: constant time to record, bounded relative error,
+    and a few hundred buckets at most however wide the range of values.
+    """
+    counts: dict[int, int] = field(default_factory=dict)
+    count: int = 0
+    total: int = 0
+    max: int = 0
+
+    def record(self, value: int) -> None:
+        bucket = _bucket(value)
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> int:
+        """
+        An upper bound for the ``q`` quantile (``0 <= q <= 1``), in nanoseconds.
+        """
+        if not self.count:
+            return 0
+        rank = max(1, round(q * self.count))
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return min(_bucket_upper(bucket), self.max)
+        return self.max
+
+    def summary(self) -> dict[str, float]:
+        """
+        Mean, max and :py:data:`QUANTILES`, in milliseconds.
+        """
+        summary = {f'p{round(q * 100)}': self.quantile(q) / 1e6 for q in QUANTILES}
+        summary['mean'] = self.total / self.count / 1e6 if self.count else 0
+        summary['max'] = self.max / 1e6
+        return summary
+
+
+@dataclass
+class MethodMetrics:
+    count: int = 0
+    errors: int = 0
+    #: time between a message being read and it being dispatched
+    queue_wait: Histogram = field(default_factory=Histogram)
+    #: time from dispatch until the handler returns
+    handler: Histogram = field(default_factory=Histogram)
+    #: content bytes of the messages received and sent for this method
+    bytes_in: int = 0
+    bytes_out: int = 0
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'bytesIn': self.bytes_in,
+            'bytesOut': self.bytes_out,
+            'queueWait': self.queue_wait.summary(),
+            'handler': self.handler.summary(),
+        }
+
+
+def _escape(label: str) -> str:
+    return label.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+@dataclass
+class Metrics:
+    """
+    Metrics for every method handled by a :py:class:`lsp.LanguageServer`, across all its sessions.
+    """
+    methods: dict[str, MethodMetrics] = field(default_factory=dict)
+
+    def method(self, method: str) -> MethodMetrics:
+        if (metrics := self.methods.get(method)) is None:
+            metrics = self.methods[method] = MethodMetrics()
+        return metrics
+
+    def as_dict(self) -> dict[str, Any]:
+        """
+        The ``$/metrics`` response. Durations are in milliseconds.
+        """
+        return {'methods': {method: metrics.as_dict() for method, metrics in sorted(self.methods.items())}}
+
+    def prometheus(self, prefix: str = 'lsp') -> str:
+        """
+        Render in the Prometheus text exposition format. Durations are summaries in seconds.
+        """
+        lines = []
+        methods = sorted(self.methods.items())
+        for name, description, attr in [('requests_total', "Messages handled", 'count'),
+                                        ('errors_total', "Messages answered with an error", 'errors'),
+                                        ('received_bytes_total', "Content bytes received", 'bytes_in'),
+                                        ('sent_bytes_total', "Content bytes sent", 'bytes_out')]:
+            lines.append(f'# HELP {prefix}_{name} {description}')
+            lines.append(f'# TYPE {prefix}_{name} counter')
+            lines.extend(f'{prefix}_{name}{{method="{_escape(method)}"}} {getattr(metrics, attr)}'
+                         for method, metrics in methods)
+        for name, description, attr in [('queue_wait_seconds', "Time messages waited to be dispatched", 'queue_wait'),
+                                        ('handler_seconds', "Time spent handling messages", 'handler')]:
+            lines.append(f'# HELP {prefix}_{name} {description}')
+            lines.append(f'# TYPE {prefix}_{name} summary')
+            for method, metrics in methods:
+                histogram: Histogram = getattr(metrics, attr)
+                label = f'method="{_escape(method)}"'
+                lines.extend(f'{prefix}_{name}{{{label},quantile="{q}"}} {histogram.quantile(q) / 1e9}'
+                             for q in QUANTILES)
+                lines.append(f'{prefix}_{name}_sum{{{label}}} {histogram.total / 1e9}')
+                lines.append(f'{prefix}_{name}_count{{{label}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path: str | Path) -> None:
+        """
+        Atomically replace ``path`` with :py:meth:`prometheus`, eg. for node_exporter's textfile collector.
+        """
+        import tempfile
+        path = Path(path)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(self.prometheus())
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
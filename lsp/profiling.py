@@ -0,0 +1,142 @@
+"""
+Profile a running server from its client, with the ``$/profile/start`` and ``$/profile/stop`` requests.
+
+``$/profile/start`` takes ``{"mode": "sampling" | "cprofile", "interval": seconds}`` (all optional):
+
+* ``sampling`` (the default) starts a thread that records the stack of every other thread every ``interval``
+  seconds (5ms by default), and writes them in the collapsed stack format read by ``flamegraph.pl``,
+  speedscope and most other flame graph tools. Its overhead doesn't depend on how busy the server is, so it's
+  the one to use on a server that's already struggling.
+* ``cprofile`` runs :py:mod:`cProfile` on the event loop's thread and writes :py:mod:`pstats` output. It
+  counts every call exactly, but slows handlers down considerably while it runs, and doesn't see handlers run
+  on the thread or process pools.
+
+``$/profile/stop`` writes the profile to :py:attr:`lsp.LanguageServer.profile_dir` and responds with
+``{"path": ...}``.
+"""
+from __future__ import annotations
+
+import cProfile
+import itertools
+import os
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+from pathlib import Path
+from types import FrameType
+from typing import ClassVar, Literal, NotRequired, TypedDict
+
+from lsp.protocol import JsonRpcException
+
+Mode = Literal['sampling', 'cprofile']
+
+_profiles = itertools.count(1)
+
+
+class ProfileParams(TypedDict):
+    mode: NotRequired[Mode]
+    #: seconds between samples, for the ``sampling`` mode
+    interval: NotRequired[float]
+
+
+class Profiler(ABC):
+    mode: ClassVar[Mode]
+    #: suffix of the files the profile is written to
+    suffix: ClassVar[str]
+
+    @abstractmethod
+    def start(self) -> None:
+        ...
+
+    @abstractmethod
+    def stop(self, path: Path) -> None:
+        """
+        Stop profiling and write the profile to ``path``.
+        """
+
+
+class CProfiler(Profiler):
+    mode = 'cprofile'
+    suffix = '.pstats'
+
+    def __init__(self) -> None:
+        self.profile = cProfile.Profile()
+
+    def start(self) -> None:
+        self.profile.enable()
+
+    def stop(self, path: Path) -> None:
+        self.profile.disable()
+        self.profile.dump_stats(path)
+
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    return f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})'.replace(';', ',')
+
+
+class SamplingProfiler(Profiler):
+    mode = 'sampling'
+    suffix = '.folded'
+
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='lsp-profiler', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def sample(self) -> None:
+        """
+        Record the current stack of every thread but the profiler's own.
+        """
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == self._thread.ident:
+                continue
+            stack = []
+            current: FrameType | None = frame
+            while current is not None:
+                stack.append(_frame_name(current))
+                current = current.f_back
+            stack.append(names.get(ident, str(ident)).replace(';', ','))
+            self.stacks[';'.join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+    def stop(self, path: Path) -> None:
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        with open(path, 'w') as f:
+            f.writelines(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def make_profiler(params: ProfileParams) -> Profiler:
+    match params.get('mode', 'sampling'):
+        case 'sampling':
+            if (interval := params.get('interval', 0.005)) <= 0:
+                raise JsonRpcException(-32602, "The sampling interval must be positive")
+            return SamplingProfiler(interval)
+        case 'cprofile':
+            return CProfiler()
+        case mode:
+            raise JsonRpcException(-32602, f"Unknown profiling mode {mode!r}")
+
+
+def profile_path(directory: str | Path | None, profiler: Profiler) -> Path:
+    """
+    A new file for ``profiler`` 's output in ``directory``, the system's temporary directory by default.
+    """
+    if directory is None:
+        import tempfile
+        directory = tempfile.gettempdir()
+    return Path(directory) / f'lsp-{os.getpid()}-{time.strftime("%Y%m%d-%H%M%S")}-{next(_profiles)}{profiler.suffix}'
@@ -2,18 +2,22 @@ from __future__ import annotations
 
 import asyncio
 import logging
-from contextlib import suppress
-from dataclasses import dataclass, field
-from email.message import Message as EmailMessage
-from typing import Any, Generic, Literal, NotRequired, Self, TypedDict, TypeVar
+import time
+from collections.abc import Container
+from dataclasses import dataclass, field, replace
+from typing import Any, Generic, Literal, NotRequired, Self, TypedDict, TypeVar, cast
 
 import ujson as json
 
+from lsp.compression import compress, decompress
 from lsp.lsp.common import T_Message
+from lsp.shared_memory import materialize, offload
 
 log = logging.getLogger(__name__)
 
 JSONRPC_VERSION: Literal["2.0"] = "2.0"
+#: the most content a message is read with, by default, once decompressed
+MAX_CONTENT_LENGTH = 1 << 26
 
 T_Content = TypeVar('T_Content', bound='JsonRpcContent')
 T = TypeVar('T')
@@ -46,49 +50,141 @@ class IncompleteError(Exception):
     pass
 
 
+class JsonRpcException(Exception):
+    """
+    Raise from a handler to answer the request with a specific jsonrpc error.
+    """
+
+    def __init__(self, code: int, message: str, data: Any = None) -> None:
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.data = data
+
+    @property
+    def error(self) -> JsonRpcError:
+        error = JsonRpcError(code=self.code, message=self.message)
+        if self.data is not None:
+            error['data'] = self.data
+        return error
+
+
+class InvalidMessageError(JsonRpcException):
+    """
+    A complete message that can't be read, which is skipped and answered with :py:attr:`error`.
+    """
+
+    def __init__(self, code: int, message: str, msg_id: int | None = None) -> None:
+        super().__init__(code, message)
+        self.msg_id = msg_id
+
+
 @dataclass
 class Message(Generic[T_Content]):
     content: T_Content
     encoding: str = field(init=False)
     content_type: str | None = None
+    #: how the content is (or was, when read) compressed, see :py:mod:`lsp.compression`
+    content_encoding: str | None = None
+    #: the shared memory segment holding the content's large strings, see :py:mod:`lsp.shared_memory`
+    shared_memory: str | None = None
     _content_bytes: bytes | None = None
     _content_len: int | None = None
+    #: ``time.perf_counter_ns()`` when the message was read, if it was
+    received: int = field(default=0, compare=False)
+    #: ``time.perf_counter_ns()`` when the message had been parsed
+    decoded: int = field(default=0, compare=False)
 
     def __post_init__(self) -> None:
         self.encoding = self.parse_encoding(self.content_type)
 
     def __bytes__(self) -> bytes:
         NL = '\r\n'
-        return (f'Content-Length: {self.content_len}{NL}'
-                f'{f"Content-Type: {self.content_type}{NL}" if self.content_type else ""}{NL}'
-                ).encode() + self.content_bytes
+        body, length = self.content_bytes, self.content_len
+        if self.content_encoding is not None:
+            body = compress(self.content_encoding, body)
+            length = len(body)
+        return (f'Content-Length: {length}{NL}'
+                f'{f"Content-Type: {self.content_type}{NL}" if self.content_type else ""}'
+                f'{f"Content-Encoding: {self.content_encoding}{NL}" if self.content_encoding else ""}'
+                f'{f"Shared-Memory: {self.shared_memory}{NL}" if self.shared_memory else ""}{NL}').encode() + body
 
     def __repr__(self) -> str:
         return f"Message(content={self.content!r})"
 
+    @staticmethod
+    def _parse_headers(headers: bytes) -> tuple[int | None, dict[str, str]]:
+        content_len: int | None = None
+        others: dict[str, str] = {}
+        for header in headers.split(b'\r\n'):
+            if header.startswith(b'Content-Length: '):
+                if (value := header[16:].strip()).isdigit():
+                    content_len = int(value)
+            elif b': ' in header:
+                name, _, value = header.partition(b': ')
+                others[name.decode(errors='replace')] = value.decode(errors='replace')
+        return content_len, others
+
     @classmethod
-    def parse(cls, data: bytes) -> tuple[int, Self]:
+    def frame_length(cls, data: bytes | bytearray, start: int = 0, end: int | None = None) -> int | None:
+        """
+        The length (headers and content) of the message at ``data[start:end]``, or ``None`` if its headers haven't
+        all arrived yet. Only the headers are copied, however much content follows them.
+        """
+        headers_end = data.find(b'\r\n\r\n', start, len(data) if end is None else end)
+        if headers_end == -1:
+            return None
+        content_len, _ = cls._parse_headers(bytes(data[start:headers_end]))
+        if content_len is None:
+            return None
+        return headers_end + 4 - start + content_len
+
+    @classmethod
+    def parse(cls,
+              data: bytes,
+              *,
+              encodings: Container[str] | None = None,
+              max_length: int = MAX_CONTENT_LENGTH,
+              segments: str | None = None) -> tuple[int, Self]:
+        """
+        The length of the message at the start of ``data``, and the message. Content compressed in one of
+        ``encodings`` (by default, any supported) is decompressed, up to ``max_length`` bytes, and strings moved to
+        shared memory are read back from segments named with the ``segments`` prefix. Content in any other encoding
+        or longer, or in any other segment (or any at all, without a prefix), raises
+        :py:class:`InvalidMessageError`.
+        """
         # FIXME: we're just kinda assuming that all invalid content is just incomplete
         headers, _, rest = data.partition(b'\r\n\r\n')
-        content_len: int | None = None
-        content_type: bytes | None = None
-        for header in headers.split(b'\r\n'):
-            if header.startswith(b'Content-Type: '):
-                content_type = header[14:]
-            elif header.startswith(b'Content-Length: '):
-                with suppress(ValueError):
-                    content_len = int(header[16:])
+        content_len, others = cls._parse_headers(headers)
         if content_len is None:
             raise IncompleteError
         if (actual := len(rest[:content_len])) < content_len:
             raise IncompleteError(f"Less than expected content (wanted {content_len}, got {actual})")
         header_len = len(headers)
-        content = json.loads(rest[:content_len] or b'{}')
-        con_type = None if content_type is None else content_type.decode()
+        body = rest[:content_len]
+        if (content_encoding := others.get('Content-Encoding')) is not None:
+            if encodings is not None and content_encoding not in encodings:
+                raise InvalidMessageError(-32600, f"Content-Encoding {content_encoding!r} wasn't agreed")
+            try:
+                body = decompress(content_encoding, body, max_length)
+            except ValueError as e:
+                raise InvalidMessageError(-32600, str(e)) from e
+        content = json.loads(body or b'{}')
+        if (shm := others.get('Shared-Memory')) is not None:
+            # a request can still be answered
+            msg_id = content.get('id') if isinstance(content, dict) and 'method' in content else None
+            if segments is None:
+                raise InvalidMessageError(-32600, "Shared memory wasn't agreed", msg_id)
+            try:
+                content = materialize(content, shm, segments)
+            except ValueError as e:
+                raise InvalidMessageError(-32600, str(e), msg_id) from e
         return header_len + content_len + 4, cls(content=content,
-                                                 content_type=con_type,
-                                                 _content_len=content_len,
-                                                 _content_bytes=rest[:content_len])
+                                                 content_type=others.get('Content-Type'),
+                                                 content_encoding=content_encoding,
+                                                 shared_memory=shm,
+                                                 _content_len=len(body),
+                                                 _content_bytes=body)
 
     @property
     def content_len(self) -> int:
@@ -106,6 +202,8 @@ class Message(Generic[T_Content]):
     def parse_encoding(cls, content_type: str | None) -> str:
         if content_type is None:
             return 'utf-8'
+        # rarely needed, and slow to import
+        from email.message import Message as EmailMessage
         msg = EmailMessage()
         msg['Content-Type'] = content_type
         encoding = msg.get_param('charset', 'utf-8')
@@ -122,10 +220,28 @@ class LspProtocol(asyncio.BufferedProtocol, Generic[T_Content]):
 
     def __init__(self) -> None:
         self.buf_size = 1024
-        self.buffer = memoryview(bytearray(b'*' * self.buf_size))
+        self._data = bytearray(b'*' * self.buf_size)
+        self.buffer = memoryview(self._data)
         self.cursor = 0
+        #: length of the message at the start of the buffer, once its headers have arrived
+        self._frame_len: int | None = None
         self.out_queue: asyncio.Queue[Message[T_Content]] = asyncio.Queue()
         self.transport: asyncio.WriteTransport
+        self.closed = asyncio.Event()
+        #: compress content written from now on, once the other side has agreed to it (see :py:mod:`lsp.compression`)
+        self.content_encoding: str | None = None
+        #: content shorter than this many bytes isn't worth compressing
+        self.compression_threshold = 4096
+        #: decompress content arriving in these encodings, the ones offered or agreed to; any other is rejected
+        self.accepted_encodings: frozenset[str] = frozenset()
+        #: reject compressed content that's any longer than this once decompressed
+        self.max_content_length = MAX_CONTENT_LENGTH
+        #: move strings at least this long to shared memory, once the other side has agreed to it (see
+        #: :py:mod:`lsp.shared_memory`)
+        self.shared_memory_threshold: int | None = None
+        #: the prefix of the connection's shared memory segment names, once offered or agreed to; segments are created
+        #: with it, and only those named with it are read
+        self.shared_memory_prefix: str | None = None
 
     def get_buffer(self, sizehint: int) -> memoryview:
         """
@@ -135,14 +251,18 @@ class LspProtocol(asyncio.BufferedProtocol, Generic[T_Content]):
         log.debug("get buffer, cursor: %s, buffer: %s", self.cursor, self.buf_size)
         if self.cursor >= self.buf_size - 1:
             self.double_buffer()
+        # make room for the whole of a large message up front, rather than doubling through every size below it
+        while self._frame_len is not None and self._frame_len > self.buf_size:
+            self.double_buffer()
         return self.buffer[self.cursor:]
 
     def double_buffer(self) -> None:
         log.debug("Doubling buffer size, %s to %s", self.buf_size, self.buf_size * 2)
-        new_buf = memoryview(bytearray(b'*' * self.buf_size * 2))
-        new_buf[:len(self.buffer)] = self.buffer
+        new_data = bytearray(b'*' * self.buf_size * 2)
+        new_data[:self.cursor] = self.buffer[:self.cursor]
         self.buf_size = self.buf_size * 2
-        self.buffer = new_buf
+        self._data = new_data
+        self.buffer = memoryview(new_data)
 
     def buffer_updated(self, nbytes: int) -> None:
         """
@@ -150,26 +270,95 @@ class LspProtocol(asyncio.BufferedProtocol, Generic[T_Content]):
         """
         self.cursor += nbytes
         tot_read = 0
-        with suppress(IncompleteError):
-            while self.cursor - tot_read:
-                msg: Message[T_Content]
-                read, msg = Message.parse(bytes(self.buffer[tot_read:self.cursor]))
-                tot_read += read
-                self.out_queue.put_nowait(msg)
+        received = time.perf_counter_ns()
+        while self.cursor > tot_read:
+            # the headers are only looked for once per message, and the message is only copied (and parsed)
+            # once it's complete, so a large message arriving in many small pieces costs no more than a small one
+            if self._frame_len is None:
+                self._frame_len = Message.frame_length(self._data, tot_read, self.cursor)
+                if self._frame_len is None:
+                    break
+            if tot_read + self._frame_len > self.cursor:
+                break
+            msg: Message[T_Content]
+            try:
+                read, msg = Message.parse(bytes(self.buffer[tot_read:tot_read + self._frame_len]),
+                                          encodings=self.accepted_encodings,
+                                          max_length=self.max_content_length,
+                                          segments=self.shared_memory_prefix)
+            except InvalidMessageError as e:
+                log.warning("Skipping invalid message: %s", e.message)
+                tot_read += self._frame_len
+                self._frame_len = None
+                self.reject(e)
+                continue
+            self._frame_len = None
+            tot_read += read
+            msg.received = received
+            received = msg.decoded = time.perf_counter_ns()
+            self.out_queue.put_nowait(msg)
         if tot_read:
             self.buffer[:self.cursor - tot_read] = self.buffer[tot_read:self.cursor]
             self.cursor = self.cursor - tot_read
 
+    def data_received(self, data: bytes) -> None:
+        """
+        Feed data from a transport that doesn't support buffered protocols (such as pipes).
+        """
+        view = memoryview(data)
+        while view:
+            buf = self.get_buffer(len(view))
+            write = min(len(buf), len(view))
+            buf[:write] = view[:write]
+            view = view[write:]
+            self.buffer_updated(write)
+
     def connection_made(self, transport: asyncio.BaseTransport) -> None:
-        assert isinstance(transport, asyncio.Transport)
-        self.transport = transport
+        # the read end of a pipe pair isn't writable, the write end is attached separately
+        if isinstance(transport, asyncio.WriteTransport):
+            self.transport = transport
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        self.closed.set()
+
+    def reject(self, error: InvalidMessageError) -> None:
+        """
+        Answer a message that couldn't be read with ``error``.
+        """
+        if not hasattr(self, 'transport'):
+            return
+        # json-rpc has the id be null when it couldn't be read
+        response: dict[str, Any] = {'jsonrpc': JSONRPC_VERSION, 'id': error.msg_id, 'error': error.error}
+        self.write_message(Message(content=cast(JsonRpcResponse[Any], response)))
 
-    def write_message(self, msg: Message[JsonRpcResponse[Any] | JsonRpcRequest[Any]]) -> None:
+    def write_message(self, msg: Message[JsonRpcResponse[Any] | JsonRpcRequest[Any]]) -> int:
         """
-        Write a jsonrpc :py:class:`Message`
+        Write a jsonrpc :py:class:`Message`, returning its content length
         """
         log.debug("Writing message %s", msg)
+        msg = self.prepare(msg)
+        encoding = self.content_encoding if msg.content_len >= self.compression_threshold else None
+        if msg.content_encoding != encoding:
+            # compressed as agreed for this connection, whatever the message was read or written with before
+            msg = replace(msg, content_encoding=encoding)
         self.transport.write(bytes(msg))
+        return msg.content_len
+
+    def prepare(
+        self, msg: Message[JsonRpcResponse[Any] | JsonRpcRequest[Any]]
+    ) -> Message[JsonRpcResponse[Any] | JsonRpcRequest[Any]]:
+        """
+        ``msg`` with its large strings moved to shared memory, if that's been agreed. Done by
+        :py:meth:`write_message`, but before ``msg`` is serialised, so anything that serialises it first (to time
+        it, say) should call this before.
+        """
+        if (self.shared_memory_threshold is None or self.shared_memory_prefix is None or msg.shared_memory is not None
+                or msg._content_bytes is not None):
+            return msg
+        content, shm = offload(msg.content, self.shared_memory_threshold, self.shared_memory_prefix)
+        if shm is None:
+            return msg
+        return Message(content=content, content_type=msg.content_type, shared_memory=shm)
 
     async def read_message(self) -> Message[T_Content]:
         """
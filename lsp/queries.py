@@ -0,0 +1,213 @@
+"""
+Incremental computation of facts derived from documents (parse trees, symbol tables, diagnostics, ...), so that
+handlers reuse whatever an edit didn't affect instead of recomputing everything per request.
+
+Queries are plain functions of a :py:class:`Database` and some hashable arguments, decorated with
+:py:func:`query`. Their results are memoized, along with the queries and :py:class:`Input`\\ s each one read.
+Setting an input starts a new revision, and a memoized result is only recomputed once something it read has
+changed since it was last checked. If the recomputed result is equal to the previous one, the queries that read it
+aren't recomputed either (early cutoff)::
+
+    @query
+    def tree(db: Database, uri: DocumentUri) -> Tree:
+        return parse(document(db, uri).text)
+
+    @query
+    def symbols(db: Database, uri: DocumentUri) -> list[Symbol]:
+        return collect_symbols(tree(db, uri))
+
+    class MyServer(LanguageServer):
+
+        async def text_document__document_symbol(self, params: DocumentSymbolParams) -> list[Symbol]:
+            return symbols(self.queries, params['textDocument']['uri'])
+
+Each :py:class:`lsp.session.Session` has its own database, with the :py:data:`document` input kept in step with
+``didOpen``, ``didChange`` and ``didClose``: an edit bumps the document's version, so queries that read it are
+checked again on their next use.
+
+Queries are synchronous, and can be called from handlers on the event loop or in threads. A result computed
+while an input was being set is kept, but checked again on its next use.
+"""
+from __future__ import annotations
+
+import threading
+from collections.abc import Callable, Hashable
+from dataclasses import dataclass, field
+from functools import update_wrapper
+from typing import TYPE_CHECKING, Any, Concatenate, Generic, ParamSpec, TypeAlias, TypeVar
+
+if TYPE_CHECKING:
+    from lsp.documents import TextDocument
+    from lsp.lsp.common import DocumentUri
+
+P = ParamSpec('P')
+T = TypeVar('T')
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+#: a query or input, and its arguments
+Key: TypeAlias = 'tuple[Query[..., Any] | Input[Any, Any], tuple[Any, ...]]'
+
+
+class CycleError(Exception):
+    """
+    A query (indirectly) depends on its own result.
+    """
+
+
+class Query(Generic[P, T]):
+    """
+    A memoized function of a :py:class:`Database`, see :py:func:`query`.
+    """
+
+    def __init__(self, fn: Callable[Concatenate[Database, P], T]) -> None:
+        self.fn = fn
+        update_wrapper(self, fn)
+
+    def __call__(self, db: Database, *args: P.args, **kwargs: P.kwargs) -> T:
+        if kwargs:
+            raise TypeError(f"{self!r} takes positional arguments only")
+        result: T = db.fetch(self, args)
+        return result
+
+    def __repr__(self) -> str:
+        return f"query {self.fn.__qualname__}"
+
+
+def query(fn: Callable[Concatenate[Database, P], T]) -> Query[P, T]:
+    """
+    Make ``fn`` a memoized query. Its arguments after the database are its key, and have to be hashable; its
+    result is compared with ``==`` for early cutoff.
+    """
+    return Query(fn)
+
+
+class Input(Generic[K, V]):
+    """
+    A value set from outside, per key, that queries read. Keys that were never set read as ``default``.
+    """
+
+    def __init__(self, name: str, default: V) -> None:
+        self.name = name
+        self.default = default
+
+    def __call__(self, db: Database, key: K) -> V:
+        result: V = db.fetch(self, (key, ))
+        return result
+
+    def set(self, db: Database, key: K, value: V) -> None:
+        """
+        Set the value for ``key``, starting a new revision unless it's equal to the current one.
+        """
+        db.set_input(self, (key, ), value)
+
+    def __repr__(self) -> str:
+        return f"input {self.name}"
+
+
+#: the text of an open document, ``None`` once it's closed
+document: Input[DocumentUri, TextDocument | None] = Input('document', None)
+
+
+@dataclass(eq=False)
+class _Memo:
+    value: Any
+    #: the revision the value last changed in
+    changed_at: int
+    #: the last revision the value was known to be current in
+    verified_at: int
+    #: what computing the value read
+    dependencies: tuple[Key, ...] = ()
+
+
+@dataclass(eq=False)
+class Database:
+    """
+    Memoized query results and the inputs they were computed from.
+    """
+    #: incremented every time an input changes
+    revision: int = 0
+    #: how many times each query has been computed
+    executions: dict[str, int] = field(default_factory=dict)
+    _memos: dict[Key, _Memo] = field(default_factory=dict)
+    _local: threading.local = field(default_factory=threading.local)
+
+    def _stack(self) -> list[tuple[Key, list[Key]]]:
+        # queries being computed on this thread, with what each has read so far
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        stack: list[tuple[Key, list[Key]]] = self._local.stack
+        return stack
+
+    def fetch(self, fn: Query[..., T] | Input[Any, T], args: tuple[Any, ...]) -> T:
+        """
+        The current result of ``fn`` for ``args``, recomputing it if needed. Prefer calling ``fn`` itself.
+        """
+        key: Key = (fn, args)
+        if stack := self._stack():
+            stack[-1][1].append(key)
+        if isinstance(fn, Input):
+            memo = self._memos.get(key)
+            value: T = fn.default if memo is None else memo.value
+            return value
+        value = self._validate(key).value
+        return value
+
+    def set_input(self, fn: Input[Any, V], args: tuple[Any, ...], value: V) -> None:
+        key: Key = (fn, args)
+        memo = self._memos.get(key)
+        if memo is not None and memo.value == value:
+            return
+        self.revision += 1
+        self._memos[key] = _Memo(value, changed_at=self.revision, verified_at=self.revision)
+
+    def __len__(self) -> int:
+        return len(self._memos)
+
+    def clear(self) -> None:
+        """
+        Forget every memoized result, keeping the inputs.
+        """
+        self._memos = {key: memo for key, memo in self._memos.items() if isinstance(key[0], Input)}
+
+    def _changed_at(self, key: Key) -> int:
+        if isinstance(key[0], Input):
+            memo = self._memos.get(key)
+            return 0 if memo is None else memo.changed_at
+        return self._validate(key).changed_at
+
+    def _validate(self, key: Key) -> _Memo:
+        revision = self.revision
+        memo = self._memos.get(key)
+        if memo is None:
+            return self._execute(key, None, revision)
+        if memo.verified_at == revision:
+            return memo
+        # the dependencies are checked in the order they were read, so the ones that are no longer read (because
+        # an earlier one changed) aren't computed for nothing
+        if all(self._changed_at(dependency) <= memo.verified_at for dependency in memo.dependencies):
+            memo.verified_at = revision
+            return memo
+        return self._execute(key, memo, revision)
+
+    def _execute(self, key: Key, old: _Memo | None, revision: int) -> _Memo:
+        fn, args = key
+        assert isinstance(fn, Query)
+        stack = self._stack()
+        if any(active == key for active, _ in stack):
+            raise CycleError(f"{fn!r} depends on itself for {args!r}: {' -> '.join(repr(k[0]) for k, _ in stack)}")
+        read: list[Key] = []
+        stack.append((key, read))
+        try:
+            value = fn.fn(self, *args)
+        finally:
+            stack.pop()
+        name = fn.fn.__qualname__
+        self.executions[name] = self.executions.get(name, 0) + 1
+        # if an input was set meanwhile (from another thread), the value is only known to be current as of the
+        # revision it was started in, and is checked again on its next use
+        changed_at = revision
+        if old is not None and old.value == value:
+            value, changed_at = old.value, old.changed_at
+        memo = self._memos[key] = _Memo(value, changed_at, revision, tuple(dict.fromkeys(read)))
+        return memo
@@ -0,0 +1,312 @@
+"""
+Record the messages between an editor and a language server, and replay them against a server later.
+
+The recorder sits between the editor and the server (configure the editor to start it instead of the server),
+forwarding everything unchanged while framing each message and appending it, with a monotonic timestamp, to a
+new trace file. Whatever can't be framed or parsed is still forwarded, just not recorded.
+
+.. code-block:: console
+
+    $ python -m lsp.recorder record session.lsptrace -- python -m my_server
+    $ python -m lsp.recorder stats session.lsptrace
+    $ python -m lsp.recorder replay session.lsptrace --fast -- python -m my_server
+
+A trace file is a header followed by one record per message: a ``<QBI`` struct (``time.monotonic_ns()``
+timestamp, direction, content length) then the message's json content.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import struct
+import sys
+import time
+from contextlib import suppress
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import IO, Any, Literal, cast
+
+from lsp.client import ExitedError, LspProtocolSubprocess
+from lsp.loadgen import Report
+from lsp.protocol import JsonRpcRequest, Message
+
+MAGIC = b'LSPTRACE\x00\x01'
+_RECORD = struct.Struct('<QBI')
+#: how far to look for the end of a message's headers before giving up on them
+_MAX_HEADERS = 1 << 16
+
+Direction = Literal[0, 1]
+FROM_CLIENT: Direction = 0
+FROM_SERVER: Direction = 1
+
+
+class TraceError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class TraceRecord:
+    #: ``time.monotonic_ns()`` when the message was received
+    timestamp: int
+    direction: Direction
+    #: the message's json content
+    content: bytes
+
+    @property
+    def message(self) -> dict[str, Any]:
+        message: dict[str, Any] = json.loads(self.content)
+        return message
+
+
+class TraceWriter:
+    """
+    Write records to a new trace file, replacing any already at ``path``: timestamps from separate runs don't
+    compare.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+
+    def write(self, direction: Direction, content: bytes, timestamp: int | None = None) -> None:
+        timestamp = time.monotonic_ns() if timestamp is None else timestamp
+        self.file.write(_RECORD.pack(timestamp, direction, len(content)))
+        self.file.write(content)
+
+    def flush(self) -> None:
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def read_trace(path: str | Path) -> Iterator[TraceRecord]:
+    """
+    Read every record of a trace file. A truncated final record (from a recorder that was killed mid write) is
+    ignored.
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise TraceError(f"{path} is not a trace file")
+        while len(header := f.read(_RECORD.size)) == _RECORD.size:
+            timestamp, direction, length = _RECORD.unpack(header)
+            if len(content := f.read(length)) < length:
+                return
+            yield TraceRecord(timestamp, direction, content)
+
+
+@dataclass
+class Framer:
+    """
+    Split a byte stream into message contents.
+    """
+    buffer: bytearray = field(default_factory=bytearray)
+
+    def feed(self, data: bytes) -> list[bytes]:
+        """
+        The contents of the messages ``data`` completes. Frames that can't be parsed are skipped, as are headers
+        without a ``Content-Length`` (or that never end), so nothing sent can stop the recording.
+        """
+        self.buffer += data
+        contents = []
+        start = 0
+        while start < len(self.buffer):
+            if (length := Message.frame_length(self.buffer, start)) is None:
+                if (headers_end := self.buffer.find(b'\r\n\r\n', start)) != -1:
+                    start = headers_end + 4
+                    continue
+                if len(self.buffer) - start > _MAX_HEADERS:
+                    # the rest of a line break could still be to come
+                    start = len(self.buffer) - 3
+                break
+            # only complete messages are copied out of the buffer
+            if start + length > len(self.buffer):
+                break
+            msg: Message[Any]
+            try:
+                _, msg = Message.parse(bytes(self.buffer[start:start + length]))
+            except Exception:
+                # not json, or in shared memory, which is only the receiver's to read (and unlink)
+                pass
+            else:
+                contents.append(msg.content_bytes)
+            start += length
+        del self.buffer[:start]
+        return contents
+
+
+async def _pump(source: asyncio.StreamReader, sink: asyncio.StreamWriter, trace: TraceWriter,
+                direction: Direction) -> None:
+    framer = Framer()
+    while data := await source.read(1 << 16):
+        # forward first, so recording never delays the conversation
+        sink.write(data)
+        timestamp = time.monotonic_ns()
+        for content in framer.feed(data):
+            trace.write(direction, content, timestamp)
+        trace.flush()
+        await sink.drain()
+    sink.close()
+
+
+async def record(command: list[str],
+                 path: str | Path,
+                 stdin: IO[bytes] | None = None,
+                 stdout: IO[bytes] | None = None) -> int:
+    """
+    Proxy between ``stdin`` / ``stdout`` (by default the process's own) and a server subprocess, recording
+    every message to ``path``. Returns the server's exit code.
+    """
+    loop = asyncio.get_running_loop()
+    client_reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(client_reader), stdin or sys.stdin.buffer)
+    transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, stdout or sys.stdout.buffer)
+    client_writer = asyncio.StreamWriter(transport, protocol, None, loop)
+    server = await asyncio.create_subprocess_exec(*command,
+                                                  stdin=asyncio.subprocess.PIPE,
+                                                  stdout=asyncio.subprocess.PIPE)
+    assert server.stdin is not None and server.stdout is not None
+    trace = TraceWriter(path)
+    try:
+        to_server = asyncio.create_task(_pump(client_reader, server.stdin, trace, FROM_CLIENT))
+        await _pump(server.stdout, client_writer, trace, FROM_SERVER)
+        to_server.cancel()
+        with suppress(asyncio.CancelledError):
+            await to_server
+        return await server.wait()
+    finally:
+        trace.close()
+
+
+def trace_stats(records: Iterable[TraceRecord]) -> Report:
+    """
+    Response latencies of the client's requests, as recorded.
+    """
+    report = Report()
+    pending: dict[Any, tuple[str, int]] = {}
+    first = last = None
+    for record in records:
+        first = record.timestamp if first is None else first
+        last = record.timestamp
+        message = record.message
+        if record.direction == FROM_CLIENT and 'method' in message:
+            if 'id' in message:
+                pending[message['id']] = (message['method'], record.timestamp)
+            else:
+                report.notifications += 1
+        elif (record.direction == FROM_SERVER and 'method' not in message
+              and (request := pending.pop(message.get('id'), None)) is not None):
+            stats = report.stats(request[0])
+            stats.latencies.append(record.timestamp - request[1])
+            stats.errors += 'error' in message
+    for method, _ in pending.values():
+        report.stats(method).timeouts += 1
+    report.elapsed = (last - first) / 1e9 if first is not None and last is not None else 0
+    return report
+
+
+async def replay(command: list[str],
+                 records: Iterable[TraceRecord],
+                 speed: float | None = 1.0,
+                 timeout: float = 5) -> Report:
+    """
+    Send the client's side of a trace to a server subprocess, measuring response latencies. With a ``speed``,
+    messages are sent with their recorded spacing (divided by ``speed``); without one they are sent as fast as
+    possible, only waiting for the server to answer ``initialize``.
+
+    Server to client requests are answered by the client's recorded responses, so the replayed server is
+    expected to behave much like the recorded one.
+    """
+    loop = asyncio.get_running_loop()
+    protocol: LspProtocolSubprocess[Any] = LspProtocolSubprocess()
+    transport, _ = await loop.subprocess_exec(lambda: protocol, *command, stderr=None)
+    report = Report()
+    pending: dict[Any, tuple[str, int, asyncio.Future[None]]] = {}
+
+    async def read() -> None:
+        try:
+            while True:
+                message: dict[str, Any] = dict((await protocol.read_message()).content)
+                if 'method' in message or (request := pending.pop(message.get('id'), None)) is None:
+                    continue
+                method, sent, future = request
+                stats = report.stats(method)
+                stats.latencies.append(time.monotonic_ns() - sent)
+                stats.errors += 'error' in message
+                future.set_result(None)
+        except ExitedError:
+            pass
+
+    reader = asyncio.create_task(read())
+    start = time.monotonic_ns()
+    first = None
+    try:
+        for record in records:
+            if record.direction != FROM_CLIENT:
+                continue
+            first = record.timestamp if first is None else first
+            if speed is not None and (delay := (record.timestamp - first) / speed - (time.monotonic_ns() - start)) > 0:
+                await asyncio.sleep(delay / 1e9)
+            if protocol.exited_event.is_set():
+                break
+            message = record.message
+            future = None
+            if 'method' not in message:
+                pass
+            elif 'id' in message:
+                future = loop.create_future()
+                pending[message['id']] = (message['method'], time.monotonic_ns(), future)
+            else:
+                report.notifications += 1
+            protocol.write_message(Message(content=cast(JsonRpcRequest[Any], message), _content_bytes=record.content))
+            if future is not None and speed is None and message['method'] == 'initialize':
+                await asyncio.wait_for(future, timeout)
+        if pending:
+            await asyncio.wait([request[2] for request in pending.values()], timeout=timeout)
+    finally:
+        report.elapsed = (time.monotonic_ns() - start) / 1e9
+        for method, _, _ in pending.values():
+            report.stats(method).timeouts += 1
+        reader.cancel()
+        if transport.get_returncode() is None:
+            transport.kill()
+        await protocol.exited_event.wait()
+        transport.close()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog='python -m lsp.recorder',
+                                     description="Record and replay language server traces")
+    commands = parser.add_subparsers(dest='action', required=True)
+    record_parser = commands.add_parser('record', help="proxy stdio to a server, recording every message")
+    record_parser.add_argument('trace', type=Path)
+    record_parser.add_argument('command', nargs=argparse.REMAINDER)
+    replay_parser = commands.add_parser('replay', help="replay the client's messages against a server")
+    replay_parser.add_argument('trace', type=Path)
+    replay_parser.add_argument('--speed', type=float, default=1.0, help="multiple of the recorded speed")
+    replay_parser.add_argument('--fast', action='store_true', help="send messages as fast as possible")
+    replay_parser.add_argument('--timeout', type=float, default=5)
+    replay_parser.add_argument('--json', action='store_true', help="print the report as json")
+    replay_parser.add_argument('command', nargs=argparse.REMAINDER)
+    stats_parser = commands.add_parser('stats', help="report the recorded latencies")
+    stats_parser.add_argument('trace', type=Path)
+    stats_parser.add_argument('--json', action='store_true', help="print the report as json")
+    args = parser.parse_args()
+
+    if args.action == 'stats':
+        report = trace_stats(read_trace(args.trace))
+    else:
+        command = args.command[1:] if args.command[:1] == ['--'] else args.command
+        if not command:
+            parser.error("a server command is required")
+        if args.action == 'record':
+            sys.exit(asyncio.run(record(command, args.trace)))
+        report = asyncio.run(replay(command, read_trace(args.trace), None if args.fast else args.speed, args.timeout))
+    print(json.dumps(report.as_dict(), indent=2) if args.json else report.format())
+
+
+if __name__ == '__main__':
+    main()
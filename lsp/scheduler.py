@@ -0,0 +1,175 @@
+"""
+Background work (indexing, workspace diagnostics, ...) that gives way to interactive requests.
+
+Jobs are coroutines scheduled with a priority on a :py:class:`Scheduler`, usually through
+:py:meth:`lsp.LanguageServer.schedule`. One job runs at a time, highest priority first, for a time slice at most:
+jobs call :py:func:`checkpoint` between units of work, which returns immediately until the job's slice is used
+up, and otherwise lets the loop handle whatever messages arrived. While any session has messages queued, background
+jobs stay paused, so indexing a large workspace doesn't delay the response to a keystroke by more than a slice::
+
+    class MyServer(LanguageServer):
+
+        async def initialized(self, params: InitializedParams) -> None:
+            self.schedule(self.index_workspace(), priority=-1)
+
+        async def index_workspace(self) -> None:
+            for path in workspace_files():
+                self.index.add(parse(path))
+                await checkpoint()
+
+An iterable can also be scheduled; the job then advances it one item per unit of work. Messages already being
+handled don't hold jobs back, so a handler can await a job it scheduled.
+
+A job holds its turn while it awaits anything other than :py:func:`checkpoint`, so long waits (subprocesses,
+threads) are better started from a job than awaited in it.
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+from collections.abc import Callable, Coroutine, Iterable, Iterator
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, TypeVar, overload
+
+T = TypeVar('T')
+
+
+@dataclass(eq=False)
+class _Job:
+    priority: int
+    #: set by the scheduler when it's the job's turn
+    resume: asyncio.Future[None] | None = None
+    #: loop time the current turn ends at
+    deadline: float = 0
+    #: the task running the job; tasks it starts inherit its context, but aren't the job
+    task: asyncio.Task[Any] | None = None
+
+
+_current_job: ContextVar[tuple[Scheduler, _Job]] = ContextVar('_current_job')
+
+
+async def checkpoint() -> None:
+    """
+    Let interactive requests and higher priority jobs in, if the current job's time slice is used up. Outside
+    of a job, this just yields to the loop.
+    """
+    current = _current_job.get(None)
+    if current is None or current[1].task is not asyncio.current_task():
+        await asyncio.sleep(0)
+        return
+    scheduler, job = current
+    if asyncio.get_running_loop().time() < job.deadline:
+        return
+    scheduler._release(job)
+    await scheduler._acquire(job)
+
+
+async def _steps(steps: Iterable[object]) -> None:
+    for _ in steps:
+        await checkpoint()
+
+
+def _never_busy() -> bool:
+    return False
+
+
+@dataclass(eq=False)
+class Scheduler:
+    """
+    Runs background jobs one at a time, by priority, whenever ``busy`` returns false.
+    """
+    #: whether interactive work is waiting; :py:meth:`lsp.LanguageServer.busy` for a server's scheduler
+    busy: Callable[[], bool] = _never_busy
+    #: seconds a job runs for before other work gets a chance
+    slice: float = 0.005
+    #: while busy, check again every this many seconds
+    idle_delay: float = 0.02
+    #: how many times a job was held back because interactive work was waiting
+    pauses: int = 0
+    #: how many turns jobs were given
+    turns: int = 0
+    jobs: set[asyncio.Task[Any]] = field(default_factory=set)
+    _waiting: list[tuple[int, int, _Job]] = field(default_factory=list)
+    _order: Iterator[int] = field(default_factory=itertools.count)
+    _running: _Job | None = None
+    _released: asyncio.Future[None] | None = None
+    _dispatcher: asyncio.Task[None] | None = None
+
+    @overload
+    def schedule(self, job: Coroutine[Any, Any, T], priority: int = 0, name: str | None = None) -> asyncio.Task[T]:
+        ...
+
+    @overload
+    def schedule(self, job: Iterable[object], priority: int = 0, name: str | None = None) -> asyncio.Task[None]:
+        ...
+
+    def schedule(self,
+                 job: Coroutine[Any, Any, Any] | Iterable[object],
+                 priority: int = 0,
+                 name: str | None = None) -> asyncio.Task[Any]:
+        """
+        Run ``job`` in the background; jobs with a higher ``priority`` go first. Cancel the returned task to stop
+        it.
+        """
+        coro = job if isinstance(job, Coroutine) else _steps(job)
+        task = asyncio.create_task(self._run(_Job(priority), coro), name=name)
+        self.jobs.add(task)
+        task.add_done_callback(self.jobs.discard)
+        # a job cancelled before it got a turn (or before the task even started) was never awaited
+        task.add_done_callback(lambda _: coro.close())
+        return task
+
+    def cancel(self) -> None:
+        """
+        Cancel every job.
+        """
+        for task in list(self.jobs):
+            task.cancel()
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+
+    async def _run(self, job: _Job, coro: Coroutine[Any, Any, T]) -> T:
+        job.task = asyncio.current_task()
+        _current_job.set((self, job))
+        try:
+            await self._acquire(job)
+            return await coro
+        finally:
+            self._release(job)
+
+    async def _acquire(self, job: _Job) -> None:
+        job.resume = asyncio.get_running_loop().create_future()
+        # the highest priority first, then the longest waiting
+        heapq.heappush(self._waiting, (-job.priority, next(self._order), job))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await job.resume
+
+    def _release(self, job: _Job) -> None:
+        if self._running is not job:
+            return
+        self._running = None
+        if self._released is not None and not self._released.done():
+            self._released.set_result(None)
+
+    async def _dispatch(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self._waiting:
+            # let whatever arrived during the last turn be read first
+            await asyncio.sleep(0)
+            if self.busy():
+                self.pauses += 1
+                while self.busy():
+                    await asyncio.sleep(self.idle_delay)
+            _, _, job = heapq.heappop(self._waiting)
+            if job.resume is None or job.resume.done():
+                # cancelled while waiting
+                continue
+            self.turns += 1
+            self._running = job
+            self._released = loop.create_future()
+            job.deadline = loop.time() + self.slice
+            job.resume.set_result(None)
+            await self._released
@@ -0,0 +1,413 @@
+"""
+Per-connection state for a :py:class:`lsp.LanguageServer`.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import inspect
+import logging
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import partial
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, cast
+
+from lsp import compression, shared_memory
+from lsp.documents import DocumentStore
+from lsp.executors import BoundProcessHandler, concurrency_limit, is_concurrent, runs_in_thread
+from lsp.globs import DocumentSelectorMatcher, FileOperationMatcher
+from lsp.protocol import (JSONRPC_VERSION, JsonRpcError, JsonRpcException, JsonRpcRequest, JsonRpcResponse, LspProtocol,
+                          Message)
+from lsp.queries import Database, document
+from lsp.tracing import Span, current_span
+
+if TYPE_CHECKING:
+    from lsp import LanguageServer
+    from lsp.lsp.client import ClientCapabilities
+    from lsp.lsp.common import MessageData
+    from lsp.lsp.messages import InitializeParams, InitializeResult
+    from lsp.lsp.server import FileOperationRegistrationOptions
+
+log = logging.getLogger(__name__)
+
+CANCEL_REQUEST = '$/cancelRequest'
+
+#: file operation methods, and the key their filters are registered under in
+#: :py:class:`lsp.lsp.server.ServerCapabilitiesWorkspaceFileOperations`
+FILE_OPERATIONS = {
+    'workspace/didCreateFiles': 'didCreate',
+    'workspace/willCreateFiles': 'willCreate',
+    'workspace/didRenameFiles': 'didRename',
+    'workspace/willRenameFiles': 'willRename',
+    'workspace/didDeleteFiles': 'didDelete',
+    'workspace/willDeleteFiles': 'willDelete',
+}
+
+#: text document requests, and the provider capability whose registration options can limit them to a
+#: :py:data:`lsp.lsp.server.DocumentSelector`
+DOCUMENT_PROVIDERS = {
+    'textDocument/declaration': 'declarationProvider',
+    'textDocument/typeDefinition': 'typeDefinitionProvider',
+    'textDocument/implementation': 'implementationProvider',
+    'textDocument/documentColor': 'colorProvider',
+    'textDocument/colorPresentation': 'colorProvider',
+    'textDocument/foldingRange': 'foldingRangeProvider',
+    'textDocument/selectionRange': 'selectionRangeProvider',
+    'textDocument/linkedEditingRange': 'linkedEditingRangeProvider',
+    'textDocument/prepareCallHierarchy': 'callHierarchyProvider',
+    'textDocument/semanticTokens/full': 'semanticTokensProvider',
+    'textDocument/semanticTokens/full/delta': 'semanticTokensProvider',
+    'textDocument/semanticTokens/range': 'semanticTokensProvider',
+    'textDocument/moniker': 'monikerProvider',
+    'textDocument/prepareTypeHierarchy': 'typeHierarchyProvider',
+    'textDocument/inlineValue': 'inlineValueProvider',
+    'textDocument/inlayHint': 'inlayHintProvider',
+    'textDocument/diagnostic': 'diagnosticProvider',
+}
+
+current_session: ContextVar[Session] = ContextVar('current_session')
+
+
+@dataclass(eq=False)
+class Session:
+    """
+    One client connection: its own :py:class:`lsp.protocol.LspProtocol`, message loop, open documents and
+    client capabilities. Everything else (caches, indexes, executor pools) lives on the shared
+    :py:class:`lsp.LanguageServer`, so one server process can serve many editors at once.
+
+    While a message is being handled, :py:attr:`lsp.LanguageServer.session` is the session it arrived on.
+    """
+    server: LanguageServer
+    protocol: LspProtocol[JsonRpcRequest[Any]] = field(default_factory=LspProtocol)
+    documents: DocumentStore = field(default_factory=DocumentStore)
+    #: results derived from :py:attr:`documents`, see :py:mod:`lsp.queries`
+    queries: Database = field(default_factory=Database)
+    initialize_params: InitializeParams | None = None
+    initialize_result: InitializeResult | None = None
+    shutdown_received: bool = False
+    _in_flight: dict[int, asyncio.Task[None]] = field(default_factory=dict)
+    _dispatching: bool = False
+    _background: set[asyncio.Task[None]] = field(default_factory=set)
+    _next_request_id: int = 0
+    _requests: dict[int, asyncio.Future[Any]] = field(default_factory=dict)
+    _file_operations: dict[str, FileOperationMatcher | None] = field(default_factory=dict)
+    _document_selectors: dict[str, DocumentSelectorMatcher | None] = field(default_factory=dict)
+
+    @property
+    def client_capabilities(self) -> ClientCapabilities | None:
+        if self.initialize_params is None:
+            return None
+        return self.initialize_params['capabilities']
+
+    @property
+    def busy(self) -> bool:
+        """
+        Whether messages from the client are waiting to be read. Not while one is being dispatched: those behind it
+        wait for it either way, and it may be waiting on a background job itself.
+        """
+        return not self._dispatching and not self.protocol.out_queue.empty()
+
+    async def run(self) -> None:
+        """
+        Handle messages until the connection is closed.
+        """
+        current_session.set(self)
+        self.server.sessions.add(self)
+        handle = asyncio.create_task(self._handle_messages())
+        try:
+            await self.protocol.closed.wait()
+        finally:
+            handle.cancel()
+            for task in list(self._background):
+                task.cancel()
+            self.server.sessions.discard(self)
+
+    async def request(self, method: str, params: Any) -> Any:
+        """
+        Send a request to the client and wait for its result. Error responses are raised as
+        :py:class:`lsp.protocol.JsonRpcException`.
+        """
+        self._next_request_id += 1
+        request_id = self._next_request_id
+        future = self._requests[request_id] = asyncio.get_running_loop().create_future()
+        self.protocol.write_message(
+            Message(content=JsonRpcRequest(jsonrpc=JSONRPC_VERSION, id=request_id, method=method, params=params)))
+        try:
+            return await future
+        finally:
+            self._requests.pop(request_id, None)
+
+    def notify(self, method: str, params: Any) -> None:
+        """
+        Send a notification to the client.
+        """
+        self.protocol.write_message(Message(content=JsonRpcRequest(jsonrpc=JSONRPC_VERSION, method=method,
+                                                                   params=params)))
+
+    def file_operation_matcher(self, method: str) -> FileOperationMatcher | None:
+        """
+        The filters the server registered for a ``workspace/*Files`` method in its ``initialize`` result, if any.
+        """
+        if method in self._file_operations:
+            return self._file_operations[method]
+        matcher = None
+        if self.initialize_result is not None:
+            workspace = self.initialize_result['capabilities'].get('workspace', {})
+            operations = cast('dict[str, FileOperationRegistrationOptions]', workspace.get('fileOperations', {}))
+            if (options := operations.get(FILE_OPERATIONS[method])) is not None:
+                matcher = FileOperationMatcher(options['filters'])
+        self._file_operations[method] = matcher
+        return matcher
+
+    def document_selector_matcher(self, method: str) -> DocumentSelectorMatcher | None:
+        """
+        The document selector the server registered for a text document request in its ``initialize`` result,
+        if any.
+        """
+        if method in self._document_selectors:
+            return self._document_selectors[method]
+        matcher = None
+        if self.initialize_result is not None:
+            options = self.initialize_result['capabilities'].get(DOCUMENT_PROVIDERS[method])
+            if isinstance(options, dict) and (selector := options.get('documentSelector')) is not None:
+                matcher = DocumentSelectorMatcher(selector)
+        self._document_selectors[method] = matcher
+        return matcher
+
+    def _negotiate(self, result: InitializeResult) -> tuple[InitializeResult, dict[str, Any]]:
+        """
+        Answer the client's offers of compressed content (see :py:mod:`lsp.compression`) and shared memory (see
+        :py:mod:`lsp.shared_memory`), adding what's agreed to the result's experimental capabilities.
+        """
+        capabilities = self.client_capabilities or {}
+        agreed: dict[str, Any] = {}
+        if (encoding := compression.negotiate(capabilities, self.server.content_encodings)) is not None:
+            agreed[compression.AGREED] = encoding
+        if (self.server.shared_memory_threshold is not None
+                and (prefix := shared_memory.accepts(capabilities)) is not None):
+            agreed[shared_memory.CAPABILITY] = prefix
+        if not agreed:
+            return result, agreed
+        experimental = result['capabilities'].get('experimental')
+        experimental = {**(experimental if isinstance(experimental, dict) else {}), **agreed}
+        result = result.copy()
+        result['capabilities'] = {**result['capabilities'], 'experimental': experimental}
+        return result, agreed
+
+    def _enable(self, agreed: dict[str, Any]) -> None:
+        if (encoding := agreed.get(compression.AGREED)) is not None:
+            self.protocol.content_encoding = encoding
+            self.protocol.accepted_encodings = frozenset({encoding})
+            self.protocol.compression_threshold = self.server.compression_threshold
+        if (prefix := agreed.get(shared_memory.CAPABILITY)) is not None:
+            self.protocol.shared_memory_prefix = prefix
+            self.protocol.shared_memory_threshold = self.server.shared_memory_threshold
+
+    def close(self) -> None:
+        if hasattr(self.protocol, 'transport'):
+            self.protocol.transport.close()
+
+    async def _handle_messages(self) -> None:
+        while True:
+            msg = await self.protocol.read_message()
+            self._dispatching = True
+            try:
+                await self._dispatch(msg)
+            finally:
+                self._dispatching = False
+
+    def _resolve(self, response: JsonRpcResponse[Any]) -> None:
+        future = self._requests.get(response.get('id', -1))
+        if future is None or future.done():
+            log.warning("Response to unknown request %s", response.get('id'))
+        elif 'error' in response:
+            future.set_exception(
+                JsonRpcException(response['error']['code'], response['error']['message'],
+                                 response['error'].get('data')))
+        else:
+            future.set_result(response.get('result'))
+
+    async def _dispatch(self, msg: Message[JsonRpcRequest[Any]]) -> None:
+        server = self.server
+        if 'method' not in msg.content:
+            # a response to one of our requests
+            self._resolve(cast(JsonRpcResponse[Any], msg.content))
+            return
+        method = msg.content['method']
+        msg_id = msg.content.get('id')
+        params = msg.content.get('params')
+        metrics = server.metrics.method(method)
+        metrics.count += 1
+        metrics.bytes_in += msg.content_len
+        if msg.received:
+            metrics.queue_wait.record(time.perf_counter_ns() - msg.received)
+        trace = None if server.tracer is None else server.tracer.message(msg, method)
+        try:
+            if method == CANCEL_REQUEST:
+                if params is not None and (task := self._in_flight.get(params['id'])) is not None:
+                    task.cancel()
+                if trace is not None:
+                    trace.finish()
+                return
+            if method == 'initialize':
+                self.initialize_params = params
+            if (uri := self.documents.update(method, params)) is not None:
+                document.set(self.queries, uri, self.documents.get(uri))
+            unwanted = False
+            if method in FILE_OPERATIONS and params is not None and (matcher :=
+                                                                     self.file_operation_matcher(method)) is not None:
+                # clients should only send the files a server registered for, but not all of them filter
+                params = {**params, 'files': matcher.filter(params['files'])}
+                unwanted = not params['files']
+            if method in DOCUMENT_PROVIDERS and params is not None and (
+                    selector := self.document_selector_matcher(method)) is not None:
+                # likewise for documents outside of a provider's selector
+                target = params['textDocument']['uri']
+                doc = self.documents.get(target)
+                unwanted = not selector.matches(target, None if doc is None else doc.language_id)
+        except (Exception, NotImplementedError, AssertionError) as e:
+            self._invalid_params(msg_id, method, e, trace)
+            return
+        if unwanted:
+            if msg_id is not None:
+                metrics.bytes_out += self._write(
+                    Message(content=JsonRpcResponse(jsonrpc=JSONRPC_VERSION, id=msg_id, result=None)), trace)
+            if trace is not None:
+                trace.finish()
+            return
+        cb: Callable[[MessageData | None], Awaitable[MessageData]] | None = server.find_handler(
+            method, notification=msg_id is None)
+        log.debug("Found cb %s for method %s", cb, method)
+        if cb is None:
+            metrics.errors += 1
+            error = JsonRpcError(code=-32601, message=f"Method {method!r} not found")
+            if msg_id is not None:
+                metrics.bytes_out += self._write(
+                    Message(content=JsonRpcResponse(jsonrpc=JSONRPC_VERSION, id=msg_id, error=error)), trace)
+            if trace is not None:
+                trace.args['error'] = error['message']
+                trace.finish()
+            return
+        if isinstance(cb, BoundProcessHandler):
+            self._start(msg_id, method, cb, partial(cb, params), trace)
+        elif is_concurrent(cb):
+            pending = cb(params)
+            self._start(msg_id, method, cb, lambda: pending, trace)
+        elif runs_in_thread(cb):
+            run = partial(self._run_in_thread, cb, params)
+            if msg_id is None:
+                # notifications (didChange, ...) are still handled one after the other
+                await self._respond(msg_id, method, self._limited(method, cb, run), trace)
+            else:
+                self._start(msg_id, method, cb, run, trace)
+        else:
+            await self._respond(msg_id, method, cb(params), trace)
+
+    def _invalid_params(self, msg_id: int | None, method: str, e: Exception, trace: Span | None) -> None:
+        """
+        Drop a notification, or answer a request, whose params couldn't be taken in.
+        """
+        log.exception("Invalid params for %s", method)
+        metrics = self.server.metrics.method(method)
+        metrics.errors += 1
+        error = JsonRpcError(code=-32602, message=f"Invalid params for {method!r}: {e!r}")
+        if msg_id is not None:
+            metrics.bytes_out += self._write(
+                Message(content=JsonRpcResponse(jsonrpc=JSONRPC_VERSION, id=msg_id, error=error)), trace)
+        if trace is not None:
+            trace.args['error'] = error['message']
+            trace.finish()
+
+    def _start(self, msg_id: int | None, method: str, cb: Callable[..., Any],
+               run: Callable[[], Awaitable[MessageData]], trace: Span | None) -> None:
+        """
+        Handle a message off the loop without holding up the messages behind it.
+        """
+        task = asyncio.create_task(self._respond(msg_id, method, self._limited(method, cb, run), trace))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        if msg_id is not None:
+            self._in_flight[msg_id] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(msg_id, None))
+
+    async def _limited(self, method: str, cb: Callable[..., Any],
+                       run: Callable[[], Awaitable[MessageData]]) -> MessageData:
+        if (limit := concurrency_limit(cb)) is None:
+            return await run()
+        # limits are shared by every session
+        if (semaphore := self.server._limits.get(method)) is None:
+            semaphore = self.server._limits[method] = asyncio.Semaphore(limit)
+        async with semaphore:
+            return await run()
+
+    async def _run_in_thread(self, cb: Callable[[Any], Any], params: Any) -> MessageData:
+        # carry the current session over to the worker thread
+        context = contextvars.copy_context()
+        result = await asyncio.get_running_loop().run_in_executor(self.server.thread_pool, context.run, cb, params)
+        if inspect.isawaitable(result):
+            # a plain function wrapping an async handler
+            result = await result
+        return cast('MessageData', result)
+
+    def _write(self, msg: Message[JsonRpcResponse[Any] | JsonRpcRequest[Any]], trace: Span | None) -> int:
+        if trace is None:
+            return self.protocol.write_message(msg)
+        encode = trace.child('encode')
+        # serialised here so writing it is timed separately
+        msg = self.protocol.prepare(msg)
+        msg.content_bytes
+        encode.finish()
+        write = trace.child('write')
+        written = self.protocol.write_message(msg)
+        write.finish()
+        return written
+
+    async def _respond(self,
+                       msg_id: int | None,
+                       method: str,
+                       pending: Awaitable[MessageData],
+                       trace: Span | None = None) -> None:
+        metrics = self.server.metrics.method(method)
+        start = time.perf_counter_ns()
+        response: JsonRpcResponse[Any] | None = None
+        agreed: dict[str, Any] = {}
+        handler = None if trace is None else trace.child('handler', start)
+        # handlers' own spans nest under this one
+        token = current_span.set(handler)
+        try:
+            result = await pending
+            if method == 'initialize':
+                self.initialize_result, agreed = self._negotiate(cast('InitializeResult', result))
+                result = self.initialize_result
+                self._file_operations.clear()
+                self._document_selectors.clear()
+            if msg_id is not None and result:
+                # otherwise, it's a notification and no response required
+                response = JsonRpcResponse(jsonrpc=JSONRPC_VERSION, id=msg_id, result=result)
+        except asyncio.CancelledError:
+            response = JsonRpcResponse(jsonrpc=JSONRPC_VERSION,
+                                       error=JsonRpcError(code=-32800, message="Request cancelled"))
+            raise
+        except JsonRpcException as e:
+            response = JsonRpcResponse(jsonrpc=JSONRPC_VERSION, error=e.error)
+        except (Exception, NotImplementedError, AssertionError) as e:
+            log.exception("Something happened in %s", method)
+            response = JsonRpcResponse(jsonrpc=JSONRPC_VERSION, error=JsonRpcError(code=-32603, message=str(e)))
+        finally:
+            current_span.reset(token)
+            end = time.perf_counter_ns()
+            metrics.handler.record(end - start)
+            if handler is not None:
+                handler.finish(end)
+            if response is not None:
+                metrics.errors += 'error' in response
+                if trace is not None and 'error' in response:
+                    trace.args['error'] = response['error']['message']
+                if msg_id is not None:
+                    response['id'] = msg_id
+                    metrics.bytes_out += self._write(Message(content=response), trace)
+            # the initialize response itself goes out as usual, the client doesn't know what was agreed yet
+            self._enable(agreed)
+            if trace is not None:
+                trace.finish()
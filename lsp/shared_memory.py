@@ -0,0 +1,162 @@
+"""
+Large strings sent through shared memory instead of the connection, for a client and server on the same host. A
+``didOpen`` of a huge generated file otherwise costs escaping the whole text into json, copying it through the
+pipe or socket, and unescaping it again.
+
+Like :py:mod:`lsp.compression`, it's negotiated through experimental capabilities: the client offers
+``sharedMemory`` with a random prefix for the connection's segment names, and the server agrees by answering with
+the same one. Both sides then move strings of at least their threshold (in utf-8 bytes, roughly) out of each
+message they send, into one shared memory segment per message, named with the prefix. Each string is replaced by
+``{"$shm": [offset, length]}`` and the segment named in a ``Shared-Memory`` header. The receiver reads the strings
+back when it parses the message, then unlinks the segment. It only opens segments named with the connection's
+prefix, so a peer can't have it read (and unlink) anyone else's. A segment is only left behind if its message is
+never read.
+"""
+from __future__ import annotations
+
+import re
+import secrets
+import sys
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from multiprocessing.shared_memory import SharedMemory
+
+#: client and server ``experimental`` capability
+CAPABILITY = 'sharedMemory'
+#: the key of the objects that stand in for strings moved to shared memory
+MARKER = '$shm'
+
+_PREFIX = re.compile(r'lsp_[0-9a-f]{16}_')
+_NAME = re.compile(r'lsp_[0-9a-f]{16}_[0-9a-f]{12}')
+
+
+def new_prefix() -> str:
+    """
+    A prefix for a new connection's segment names.
+    """
+    return f'lsp_{secrets.token_hex(8)}_'
+
+
+def accepts(capabilities: Any) -> str | None:
+    """
+    The segment name prefix in either side's ``capabilities``, if they include shared memory.
+    """
+    experimental = capabilities.get('experimental') if isinstance(capabilities, dict) else None
+    prefix = experimental.get(CAPABILITY) if isinstance(experimental, dict) else None
+    return prefix if isinstance(prefix, str) and _PREFIX.fullmatch(prefix) else None
+
+
+def offer(capabilities: Any, prefix: str) -> Any:
+    """
+    A copy of client ``capabilities`` offering shared memory, with segments named with ``prefix``.
+    """
+    experimental = capabilities.get('experimental')
+    return {
+        **capabilities, 'experimental': {
+            **(experimental if isinstance(experimental, dict) else {}), CAPABILITY: prefix
+        }
+    }
+
+
+def _create(size: int, prefix: str) -> SharedMemory:
+    # only needed once it's in use, and slow to import
+    from multiprocessing import resource_tracker
+    from multiprocessing.shared_memory import SharedMemory
+    while True:
+        name = f'{prefix}{secrets.token_hex(6)}'
+        try:
+            if sys.version_info >= (3, 13):
+                return SharedMemory(name, create=True, size=size, track=False)
+            shm = SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            continue
+        # the receiver unlinks it, so this process mustn't when it exits
+        resource_tracker.unregister(f'/{shm.name}', 'shared_memory')
+        return shm
+
+
+def offload(content: Any, threshold: int, prefix: str) -> tuple[Any, str | None]:
+    """
+    ``content`` with its strings of at least ``threshold`` characters replaced by references into a new shared
+    memory segment named with ``prefix``, and the segment's name. ``content`` itself isn't modified, and without
+    any such strings is returned as is, with no segment.
+    """
+    strings: list[bytes] = []
+    size = 0
+
+    def replace(value: Any) -> Any:
+        nonlocal size
+        if isinstance(value, str):
+            if len(value) < threshold:
+                return value
+            data = value.encode()
+            strings.append(data)
+            size += len(data)
+            return {MARKER: [size - len(data), len(data)]}
+        if isinstance(value, dict):
+            copied: dict[str, Any] | None = None
+            for key, item in value.items():
+                if (new := replace(item)) is not item:
+                    copied = dict(value) if copied is None else copied
+                    copied[key] = new
+            return value if copied is None else copied
+        if isinstance(value, list):
+            replaced = [replace(item) for item in value]
+            return value if all(new is old for new, old in zip(replaced, value)) else replaced
+        return value
+
+    content = replace(content)
+    if not size:
+        return content, None
+    shm = _create(size, prefix)
+    buf = shm.buf
+    assert buf is not None
+    offset = 0
+    for data in strings:
+        buf[offset:offset + len(data)] = data
+        offset += len(data)
+    shm.close()
+    return content, shm.name
+
+
+def materialize(content: Any, name: str, prefix: str) -> Any:
+    """
+    Put the strings from segment ``name`` back into ``content`` (in place), and unlink the segment. Raises
+    :py:class:`ValueError` if the segment isn't named with ``prefix``, can't be opened, or doesn't hold the strings
+    referenced.
+    """
+    from multiprocessing.shared_memory import SharedMemory
+    if not name.startswith(prefix) or _NAME.fullmatch(name) is None:
+        raise ValueError(f"Shared memory segment {name!r} isn't this connection's")
+    try:
+        shm = SharedMemory(name)
+    except OSError as e:
+        raise ValueError(f"Can't open shared memory segment {name!r}: {e}") from e
+    buf = shm.buf
+    assert buf is not None
+
+    def replace(value: Any) -> Any:
+        if isinstance(value, dict):
+            if len(value) == 1 and MARKER in value:
+                reference = value[MARKER]
+                if not (isinstance(reference, list) and len(reference) == 2 and all(type(i) is int for i in reference)
+                        and 0 <= reference[1] and 0 <= reference[0] <= len(buf) - reference[1]):
+                    raise ValueError(f"Invalid reference into shared memory segment {name!r}: {reference!r}")
+                offset, length = reference
+                with buf[offset:offset + length] as data:
+                    return str(data, 'utf-8')
+            for key, item in value.items():
+                if isinstance(item, (dict, list)):
+                    value[key] = replace(item)
+        elif isinstance(value, list):
+            for i, item in enumerate(value):
+                if isinstance(item, (dict, list)):
+                    value[i] = replace(item)
+        return value
+
+    try:
+        return replace(content)
+    finally:
+        shm.close()
+        shm.unlink()
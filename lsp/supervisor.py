@@ -0,0 +1,430 @@
+"""
+Supervisor mode: shard a multi-root workspace across one language server process per workspace folder.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import sys
+from collections.abc import Awaitable
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any, Callable
+
+from lsp import LanguageServer, compression
+from lsp.client import ExitedError, LspProtocolSubprocess
+from lsp.executors import concurrent
+from lsp.lsp.common import URI, DocumentUri, WorkspaceFolder
+from lsp.lsp.messages import InitializedParams, InitializeParams, InitializeResult
+from lsp.lsp.server import (DidChangeWorkspaceFoldersParams, ServerCapabilitiesWorkspace, SymbolInformation,
+                            WorkspaceFoldersServerCapabilities, WorkspaceSymbol, WorkspaceSymbolParams)
+from lsp.protocol import (JSONRPC_VERSION, JsonRpcError, JsonRpcException, JsonRpcRequest, JsonRpcResponse, Message)
+from lsp.session import CANCEL_REQUEST, Session
+
+log = logging.getLogger(__name__)
+
+#: requests whose results hold items the client can send back to be resolved
+RESOLVABLE = frozenset({
+    'textDocument/completion', 'textDocument/codeLens', 'textDocument/documentLink', 'textDocument/inlayHint',
+    'textDocument/codeAction', 'workspace/symbol'
+})
+#: requests resolving one of those items, which go back to the worker it came from
+RESOLVE = frozenset({
+    'completionItem/resolve', 'codeLens/resolve', 'documentLink/resolve', 'inlayHint/resolve', 'codeAction/resolve',
+    'workspaceSymbol/resolve'
+})
+#: the key, in the ``data`` of items from a worker, of the worker's folder
+ORIGIN = '$worker'
+
+
+def owns(folder: URI, uri: str) -> bool:
+    folder = URI(folder.rstrip('/'))
+    return uri == folder or uri.startswith(f'{folder}/')
+
+
+def message_uris(params: Any) -> list[str]:
+    """
+    The document or file uris a message is about, used to route it to a worker.
+    """
+    if not isinstance(params, dict):
+        return []
+    if isinstance(params.get('textDocument'), dict) and 'uri' in params['textDocument']:
+        return [params['textDocument']['uri']]
+    if isinstance(params.get('item'), dict) and 'uri' in params['item']:
+        # call and type hierarchy
+        return [params['item']['uri']]
+    if isinstance(params.get('files'), list):
+        return [f.get('uri', f.get('oldUri')) for f in params['files']]
+    if isinstance(params.get('changes'), list):
+        # workspace/didChangeWatchedFiles
+        return [c['uri'] for c in params['changes']]
+    return []
+
+
+def tag_items(result: Any, folder: URI | None) -> Any:
+    """
+    ``result`` with its items' ``data`` (in place) wrapped to record that they came from ``folder``'s worker.
+    """
+    if isinstance(result, dict) and isinstance(result.get('items'), list):
+        # a CompletionList
+        items = result['items']
+    elif isinstance(result, list):
+        items = result
+    else:
+        # a resolved item
+        items = [result]
+    for item in items:
+        # commands among code actions have no data
+        if isinstance(item, dict) and not isinstance(item.get('command'), str):
+            origin: dict[str, Any] = {ORIGIN: folder}
+            if 'data' in item:
+                origin['data'] = item['data']
+            item['data'] = origin
+    return result
+
+
+def untag_item(item: Any) -> tuple[bool, URI | None, Any]:
+    """
+    Whether ``item`` was tagged by :py:func:`tag_items`, the folder it came from, and a copy as its worker sent it.
+    """
+    origin = item.get('data') if isinstance(item, dict) else None
+    if not isinstance(origin, dict) or ORIGIN not in origin:
+        return False, None, item
+    item = {key: value for key, value in item.items() if key != 'data'}
+    if 'data' in origin:
+        item['data'] = origin['data']
+    return True, origin[ORIGIN], item
+
+
+@dataclass(eq=False)
+class Worker:
+    """
+    A language server subprocess that owns one workspace folder (or, without a folder, everything else).
+    """
+    folder: WorkspaceFolder | None
+    on_message: Callable[[Worker, Message[Any]], None]
+    protocol: LspProtocolSubprocess[Any] = field(default_factory=LspProtocolSubprocess)
+    initialize_result: InitializeResult | None = None
+    _transport: asyncio.SubprocessTransport | None = None
+    _reader: asyncio.Task[None] | None = None
+    _next_id: int = 0
+    _pending: dict[int, asyncio.Future[Any]] = field(default_factory=dict)
+
+    @property
+    def uri(self) -> URI | None:
+        """
+        The folder's uri, the worker's key in :py:attr:`Shards.workers`.
+        """
+        return None if self.folder is None else self.folder['uri']
+
+    async def start(self, command: list[str], params: InitializeParams) -> InitializeResult:
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await loop.subprocess_exec(lambda: self.protocol, *command, stderr=None)
+        self._reader = asyncio.create_task(self._read())
+        # workers are local, compressing what they send would only cost time
+        params = params.copy()
+        params['capabilities'] = compression.advertise(params['capabilities'], [])
+        if self.folder is not None:
+            params['rootUri'] = DocumentUri(self.folder['uri'])
+            params['workspaceFolders'] = [self.folder]
+        self.initialize_result = await self.request('initialize', params)
+        self.notify('initialized', InitializedParams())
+        return self.initialize_result
+
+    async def _read(self) -> None:
+        try:
+            while True:
+                msg = await self.protocol.read_message()
+                if 'method' in msg.content:
+                    self.on_message(self, msg)
+                    continue
+                future = self._pending.pop(msg.content.get('id'), None)
+                if future is None or future.done():
+                    continue
+                if 'error' in msg.content:
+                    error = msg.content['error']
+                    future.set_exception(JsonRpcException(error['code'], error['message'], error.get('data')))
+                else:
+                    future.set_result(msg.content.get('result'))
+        except ExitedError:
+            log.warning("Worker for %s exited", self.folder)
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(JsonRpcException(-32603, "Worker exited"))
+
+    def send(self, method: str, params: Any) -> Awaitable[Any]:
+        """
+        Write a request now, returning an awaitable for its result.
+        """
+        self._next_id += 1
+        request_id = self._next_id
+        future = self._pending[request_id] = asyncio.get_running_loop().create_future()
+        self.protocol.write_message(
+            Message(content=JsonRpcRequest(jsonrpc=JSONRPC_VERSION, id=request_id, method=method, params=params)))
+        return self._result(request_id, future)
+
+    async def _result(self, request_id: int, future: asyncio.Future[Any]) -> Any:
+        try:
+            return await future
+        except asyncio.CancelledError:
+            if self._pending.pop(request_id, None) is not None:
+                self.notify(CANCEL_REQUEST, {'id': request_id})
+            raise
+
+    async def request(self, method: str, params: Any) -> Any:
+        return await self.send(method, params)
+
+    def notify(self, method: str, params: Any) -> None:
+        self.protocol.write_message(
+            Message(content=JsonRpcRequest(jsonrpc=JSONRPC_VERSION, method=method, params=params)))
+
+    def respond(self, response: JsonRpcResponse[Any]) -> None:
+        self.protocol.write_message(Message(content=response))
+
+    async def stop(self, timeout: float = 5) -> None:
+        """
+        Shut the worker down, killing it if it doesn't within ``timeout`` seconds. Stopping it again does nothing.
+        """
+        if (transport := self._transport) is None:
+            return
+        self._transport = None
+        # a null shutdown result isn't answered, so exit follows straight after it (messages are handled in
+        # order) and the process is given time to end instead
+        self._next_id += 1
+        self.protocol.write_message(
+            Message(content=JsonRpcRequest(jsonrpc=JSONRPC_VERSION, id=self._next_id, method='shutdown', params=None)))
+        self.notify('exit', None)
+        try:
+            await asyncio.wait_for(self.protocol.exited_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            log.warning("Worker for %s didn't exit, killing it", self.folder)
+        finally:
+            transport.kill()
+            if self._reader is not None:
+                self._reader.cancel()
+
+
+@dataclass(eq=False)
+class Shards:
+    """
+    The workers for one client session, keyed by workspace folder uri (``None`` for documents outside of every
+    folder).
+    """
+    supervisor: Supervisor
+    session: Session
+    params: InitializeParams
+    folders: dict[URI, WorkspaceFolder] = field(default_factory=dict)
+    workers: dict[URI | None, asyncio.Task[Worker]] = field(default_factory=dict)
+
+    def folder_for(self, uri: str) -> URI | None:
+        owners = [folder for folder in self.folders if owns(folder, uri)]
+        return max(owners, key=len, default=None)
+
+    def worker(self, folder: URI | None) -> asyncio.Task[Worker]:
+        """
+        The worker for ``folder``, started on first use.
+        """
+        if (task := self.workers.get(folder)) is None:
+            worker = Worker(None if folder is None else self.folders[folder], self._forward_to_client)
+            task = self.workers[folder] = asyncio.create_task(self._start(worker))
+        return task
+
+    async def _start(self, worker: Worker) -> Worker:
+        await worker.start(self.supervisor.command, self.params)
+        return worker
+
+    async def running(self) -> list[Worker]:
+        return list(await asyncio.gather(*self.workers.values()))
+
+    async def all(self) -> list[Worker]:
+        """
+        Every folder's worker, starting any that haven't been yet.
+        """
+        for folder in self.folders or [None]:
+            self.worker(folder)
+        return await self.running()
+
+    async def for_params(self, params: Any) -> list[Worker]:
+        folders = {self.folder_for(uri) for uri in message_uris(params)}
+        if not folders:
+            return await self.running()
+        return [await self.worker(folder) for folder in folders]
+
+    def _forward_to_client(self, worker: Worker, msg: Message[Any]) -> None:
+        content: JsonRpcRequest[Any] = msg.content
+        if 'id' not in content:
+            self.session.notify(content['method'], content.get('params'))
+            return
+        task = asyncio.create_task(self._forward_request_to_client(worker, content))
+        self.session._background.add(task)
+        task.add_done_callback(self.session._background.discard)
+
+    async def _forward_request_to_client(self, worker: Worker, request: JsonRpcRequest[Any]) -> None:
+        assert 'id' in request
+        try:
+            result = await self.session.request(request['method'], request.get('params'))
+            worker.respond(JsonRpcResponse(jsonrpc=JSONRPC_VERSION, id=request['id'], result=result))
+        except JsonRpcException as e:
+            worker.respond(JsonRpcResponse(jsonrpc=JSONRPC_VERSION, id=request['id'], error=e.error))
+        except (Exception, NotImplementedError, AssertionError) as e:
+            log.exception("Forwarding %s to the client failed", request['method'])
+            worker.respond(
+                JsonRpcResponse(jsonrpc=JSONRPC_VERSION,
+                                id=request['id'],
+                                error=JsonRpcError(code=-32603, message=str(e))))
+
+    async def close(self) -> None:
+        """
+        Stop every running worker; workers already stopped (on ``shutdown``, say) are left alone.
+        """
+        await asyncio.gather(*(w.stop() for w in await self.running()), return_exceptions=True)
+
+
+@dataclass
+class Supervisor(LanguageServer):
+    """
+    A language server that doesn't handle anything itself, but starts one worker language server process
+    (``command``, speaking LSP over stdio) per workspace folder and routes messages to them by document uri.
+
+    Workers are started lazily, the first time a message is about a document in their folder; the first
+    folder's worker is started when the client initializes, and answers ``initialize`` on behalf of all of them.
+    Workspace wide requests (``workspace/symbol``) are sent to every folder's worker and the results merged, and
+    other messages that aren't about a particular document go to every worker that's running. Items the client
+    can resolve (completion items, code lenses, ...) have their ``data`` wrapped to record which worker they came
+    from, and resolve requests are sent back to it.
+
+    .. code-block:: python
+
+        async with Supervisor(command=[sys.executable, 'my_server.py']).serve(port=None) as server:
+            await server.wait()
+    """
+    command: list[str] = field(default_factory=list)
+    shards: dict[Session, Shards] = field(default_factory=dict)
+    _watchers: set[asyncio.Task[None]] = field(default_factory=set)
+
+    #: methods the supervisor handles itself rather than forwarding
+    local_methods = frozenset({
+        'initialize', 'initialized', 'shutdown', 'exit', 'workspace/symbol', 'workspace/didChangeWorkspaceFolders'
+    })
+
+    def find_handler(self, method: str, notification: bool = False) -> Callable[[Any], Any] | None:
+        if method in self.local_methods or method in self.extension_methods:
+            return super().find_handler(method, notification)
+        if notification:
+            return partial(self._forward_notification, method)
+        return concurrent(partial(self._forward_request, method))
+
+    @property
+    def current_shards(self) -> Shards:
+        return self.shards[self.session]
+
+    async def _forward_notification(self, method: str, params: Any) -> None:
+        for worker in await self.current_shards.for_params(params):
+            worker.notify(method, params)
+
+    def _forward_request(self, method: str, params: Any) -> Awaitable[Any]:
+        shards = self.current_shards
+        if method in RESOLVE:
+            return self._resolve(shards, method, params)
+        uris = message_uris(params)
+        if not uris:
+            return self._first(shards, method, params)
+        folder = shards.folder_for(uris[0])
+        task = shards.worker(folder)
+        if task.done() and not task.cancelled() and task.exception() is None:
+            # write it now, so it stays ordered with the notifications after it
+            pending = task.result().send(method, params)
+        else:
+            pending = self._request(task, method, params)
+        return self._tagged(pending, folder) if method in RESOLVABLE else pending
+
+    async def _tagged(self, pending: Awaitable[Any], folder: URI | None) -> Any:
+        return tag_items(await pending, folder)
+
+    async def _resolve(self, shards: Shards, method: str, params: Any) -> Any:
+        tagged, folder, params = untag_item(params)
+        if not tagged:
+            return await self._first(shards, method, params)
+        if (task := shards.workers.get(folder)) is None:
+            raise JsonRpcException(-32803, f"The worker for {folder or 'other documents'} has stopped")
+        return tag_items(await self._request(task, method, params), folder)
+
+    async def _first(self, shards: Shards, method: str, params: Any) -> Any:
+        workers = await shards.running() or await shards.all()
+        return await workers[0].request(method, params)
+
+    async def _request(self, worker_task: asyncio.Task[Worker], method: str, params: Any) -> Any:
+        worker = await worker_task
+        return await worker.request(method, params)
+
+    async def initialize(self, params: InitializeParams) -> InitializeResult:
+        session = self.session
+        shards = self.shards[session] = Shards(self, session, params)
+        for folder in params.get('workspaceFolders') or []:
+            shards.folders[folder['uri']] = folder
+        if not shards.folders and params.get('rootUri'):
+            root = URI(params['rootUri'] or '')
+            shards.folders[root] = WorkspaceFolder(uri=root, name=root.rstrip('/').rsplit('/', 1)[-1])
+        watcher = asyncio.create_task(self._close_with(session))
+        self._watchers.add(watcher)
+        watcher.add_done_callback(self._watchers.discard)
+        worker = await shards.worker(next(iter(shards.folders), None))
+        assert worker.initialize_result is not None
+        result = worker.initialize_result.copy()
+        capabilities = result['capabilities'] = result['capabilities'].copy()
+        workspace = capabilities['workspace'] = capabilities.get('workspace', ServerCapabilitiesWorkspace()).copy()
+        workspace['workspaceFolders'] = WorkspaceFoldersServerCapabilities(supported=True, changeNotifications=True)
+        return result
+
+    async def _close_with(self, session: Session) -> None:
+        await session.protocol.closed.wait()
+        if (shards := self.shards.pop(session, None)) is not None:
+            await shards.close()
+
+    async def initialized(self, params: InitializedParams) -> None:
+        pass
+
+    async def shutdown(self, params: None) -> None:
+        await super().shutdown(params)
+        await self.current_shards.close()
+
+    @concurrent
+    async def workspace__symbol(
+            self, params: WorkspaceSymbolParams) -> list[SymbolInformation] | list[WorkspaceSymbol] | None:
+        workers = await self.current_shards.all()
+        results = await asyncio.gather(*(w.request('workspace/symbol', params) for w in workers),
+                                       return_exceptions=True)
+        merged: list[Any] = []
+        for worker, result in zip(workers, results):
+            if isinstance(result, BaseException):
+                log.warning("workspace/symbol failed in a worker: %s", result)
+            elif result:
+                merged.extend(tag_items(result, worker.uri))
+        return merged
+
+    async def workspace__did_change_workspace_folders(self, params: DidChangeWorkspaceFoldersParams) -> Any:
+        shards = self.current_shards
+        for folder in params['event']['removed']:
+            shards.folders.pop(folder['uri'], None)
+            if (task := shards.workers.pop(folder['uri'], None)) is not None:
+                await (await task).stop()
+        for folder in params['event']['added']:
+            shards.folders[folder['uri']] = folder
+
+
+async def amain(command: list[str]) -> None:
+    async with Supervisor(command=command).serve(port=None) as server:
+        await server.wait()
+
+
+def main() -> None:
+    """
+    ``python -m lsp.supervisor <worker command...>`` serves a supervisor over stdio.
+    """
+    if len(sys.argv) < 2:
+        sys.exit(f"usage: {sys.argv[0]} <worker command...>")
+    asyncio.run(amain(sys.argv[1:]))
+
+
+if __name__ == '__main__':
+    main()
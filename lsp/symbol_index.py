@@ -0,0 +1,277 @@
+"""
+Compact on-disk workspace symbol index.
+
+The file is laid out as::
+
+    header | string table | symbol records | name index | key blob
+
+* the string table holds every distinct name, container name and uri as utf-8
+* each symbol record is a fixed width struct pointing into the string table
+* the name index is a list of ``(key offset, record number)`` pairs sorted by the lowercased symbol name
+* the key blob holds those lowercased names, in index order, each terminated by a ``NUL`` byte
+
+A :py:class:`SymbolIndex` ``mmap`` s the file and answers queries straight out of the mapping, only building
+:py:class:`lsp.lsp.server.WorkspaceSymbol` dicts for the symbols that actually match.
+"""
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+from bisect import bisect_left, bisect_right
+from collections.abc import Iterable, Iterator, Sequence
+from typing import Self, overload
+
+from lsp.lsp.common import DocumentUri, Location, Position, Range, SymbolKind
+from lsp.lsp.server import SymbolInformation, WorkspaceSymbol
+
+MAGIC = b'LSPSYM\x00\x01'
+
+# magic, record count, strings offset, records offset, index offset, keys offset
+_HEADER = struct.Struct('<8sIIIII')
+# name (offset, len), container (offset, len), uri (offset, len), kind, flags, padding,
+# range start line, start character, end line, end character
+_RECORD = struct.Struct('<IIIIIIBBxxIIII')
+# key offset, record number
+_INDEX = struct.Struct('<II')
+
+_NO_STRING = 0xFFFFFFFF
+_FLAG_DEPRECATED = 1
+_FLAG_HAS_RANGE = 2
+
+
+class SymbolIndexError(Exception):
+    pass
+
+
+class _StringTable:
+
+    def __init__(self) -> None:
+        self.offsets: dict[str, tuple[int, int]] = {}
+        self.data = bytearray()
+
+    def add(self, s: str | None) -> tuple[int, int]:
+        if s is None:
+            return _NO_STRING, 0
+        if (found := self.offsets.get(s)) is None:
+            encoded = s.encode()
+            found = self.offsets[s] = (len(self.data), len(encoded))
+            self.data += encoded
+        return found
+
+
+def write_symbol_index(path: str | os.PathLike[str], symbols: Iterable[WorkspaceSymbol | SymbolInformation]) -> int:
+    """
+    Write ``symbols`` to ``path`` in the format read by :py:class:`SymbolIndex`, returning the number written.
+
+    The file is written to a temporary sibling and renamed into place, so a concurrently opened index never
+    sees a partial write.
+    """
+    strings = _StringTable()
+    records = bytearray()
+    keys: list[tuple[bytes, int]] = []
+    for i, symbol in enumerate(symbols):
+        location = symbol['location']
+        flags = 0
+        if 1 in symbol.get('tags', []) or symbol.get('deprecated'):
+            flags |= _FLAG_DEPRECATED
+        start = end = Position(line=0, character=0)
+        if 'range' in location:
+            assert isinstance(location['range'], dict)
+            flags |= _FLAG_HAS_RANGE
+            start, end = location['range']['start'], location['range']['end']
+        records += _RECORD.pack(*strings.add(symbol['name']), *strings.add(symbol.get('containerName')),
+                                *strings.add(location['uri']), symbol['kind'], flags, start['line'],
+                                start['character'], end['line'], end['character'])
+        keys.append((symbol['name'].lower().encode(), i))
+    keys.sort()
+
+    index = bytearray()
+    key_blob = bytearray()
+    for key, record in keys:
+        index += _INDEX.pack(len(key_blob), record)
+        key_blob += key + b'\x00'
+
+    strings_offset = _HEADER.size
+    records_offset = strings_offset + len(strings.data)
+    index_offset = records_offset + len(records)
+    keys_offset = index_offset + len(index)
+    tmp = f'{os.fspath(path)}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, len(keys), strings_offset, records_offset, index_offset, keys_offset))
+        f.write(strings.data)
+        f.write(records)
+        f.write(index)
+        f.write(key_blob)
+    os.replace(tmp, path)
+    return len(keys)
+
+
+class _Keys(Sequence[bytes]):
+    """
+    Lazy view of the sorted lowercased names, for use with :py:mod:`bisect`.
+    """
+
+    def __init__(self, index: SymbolIndex) -> None:
+        self.symbols = index
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    @overload
+    def __getitem__(self, i: int) -> bytes:
+        ...
+
+    @overload
+    def __getitem__(self, i: slice) -> Sequence[bytes]:
+        ...
+
+    def __getitem__(self, i: int | slice) -> bytes | Sequence[bytes]:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self.symbols._key(i)
+
+
+class _KeyOffsets(Sequence[int]):
+
+    def __init__(self, index: SymbolIndex) -> None:
+        self.symbols = index
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    @overload
+    def __getitem__(self, i: int) -> int:
+        ...
+
+    @overload
+    def __getitem__(self, i: slice) -> Sequence[int]:
+        ...
+
+    def __getitem__(self, i: int | slice) -> int | Sequence[int]:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self.symbols._entry(i)[0]
+
+
+class SymbolIndex:
+    """
+    Read-only, memory mapped view of a file written by :py:func:`write_symbol_index`.
+
+    .. code-block:: python
+
+        class MyServer(LanguageServer):
+            index: SymbolIndex
+
+            async def workspace__symbol(self, params: WorkspaceSymbolParams) -> list[WorkspaceSymbol]:
+                return self.index.query(params['query'], limit=500)
+    """
+
+    def __init__(self, buffer: mmap.mmap) -> None:
+        """
+        Take ownership of ``buffer``; it's closed if it doesn't hold a valid index.
+        """
+        try:
+            if len(buffer) < _HEADER.size:
+                raise SymbolIndexError("Truncated symbol index")
+            magic, count, strings, records, index, keys = _HEADER.unpack_from(buffer)
+            if magic != MAGIC:
+                raise SymbolIndexError(f"Not a symbol index (magic {magic!r})")
+            # every section fits, and the last key is terminated
+            if not (_HEADER.size <= strings <= records and records + count * _RECORD.size <= index
+                    and index + count * _INDEX.size <= keys <= len(buffer)) or (count and buffer[-1] != 0):
+                raise SymbolIndexError("Truncated symbol index")
+        except BaseException:
+            buffer.close()
+            raise
+        self._mmap = buffer
+        self._view = memoryview(buffer)
+        self._count: int = count
+        self._strings, self._records, self._index, self._keys = strings, records, index, keys
+        self._key_list = _Keys(self)
+        self._key_offsets = _KeyOffsets(self)
+
+    @classmethod
+    def open(cls, path: str | os.PathLike[str]) -> Self:
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raise SymbolIndexError(f"Empty symbol index {os.fspath(path)!r}")
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def close(self) -> None:
+        self._view.release()
+        self._mmap.close()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[WorkspaceSymbol]:
+        return (self._symbol(i) for i in range(self._count))
+
+    def _entry(self, i: int) -> tuple[int, int]:
+        key_offset, record = _INDEX.unpack_from(self._mmap, self._index + i * _INDEX.size)
+        return key_offset, record
+
+    def _key(self, i: int) -> bytes:
+        start = self._keys + self._entry(i)[0]
+        return self._mmap[start:self._mmap.find(b'\x00', start)]
+
+    def _string(self, offset: int, length: int) -> str:
+        start = self._strings + offset
+        return str(self._view[start:start + length], 'utf-8')
+
+    def _symbol(self, record: int) -> WorkspaceSymbol:
+        (name_off, name_len, container_off, container_len, uri_off, uri_len, kind, flags, start_line, start_char,
+         end_line, end_char) = _RECORD.unpack_from(self._mmap, self._records + record * _RECORD.size)
+        uri = DocumentUri(self._string(uri_off, uri_len))
+        kind_: SymbolKind = kind
+        symbol = WorkspaceSymbol(name=self._string(name_off, name_len),
+                                 kind=kind_,
+                                 location={'uri': uri} if not flags & _FLAG_HAS_RANGE else Location(
+                                     uri=uri,
+                                     range=Range(start=Position(line=start_line, character=start_char),
+                                                 end=Position(line=end_line, character=end_char))))
+        if container_off != _NO_STRING:
+            symbol['containerName'] = self._string(container_off, container_len)
+        if flags & _FLAG_DEPRECATED:
+            symbol['tags'] = [1]
+        return symbol
+
+    def _prefix_matches(self, key: bytes) -> Iterator[int]:
+        for i in range(bisect_left(self._key_list, key), self._count):
+            if not self._key(i).startswith(key):
+                break
+            yield i
+
+    def _substring_matches(self, key: bytes) -> Iterator[int]:
+        end = len(self._mmap)
+        pos = self._mmap.find(key, self._keys, end)
+        while pos != -1:
+            i = bisect_right(self._key_offsets, pos - self._keys) - 1
+            yield i
+            next_key = self._keys + self._entry(i + 1)[0] if i + 1 < self._count else end
+            pos = self._mmap.find(key, next_key, end)
+
+    def query(self, query: str, limit: int | None = None) -> list[WorkspaceSymbol]:
+        """
+        Case-insensitively match ``query`` against the symbol names.
+        Symbols whose name starts with the query come first (in name order), followed by those that merely
+        contain it. An empty query matches every symbol.
+        """
+        key = query.lower().encode()
+        found: dict[int, None] = {}
+        matches = [self._prefix_matches(key)]
+        if key:
+            matches.append(self._substring_matches(key))
+        for it in matches:
+            for i in it:
+                if limit is not None and len(found) >= limit:
+                    break
+                found.setdefault(i)
+        return [self._symbol(self._entry(i)[1]) for i in found]
@@ -0,0 +1,178 @@
+"""
+Request tracing, exported to a local file.
+
+With :py:attr:`lsp.LanguageServer.tracer` set, every message a :py:class:`lsp.session.Session` reads gets a
+span named after its method, from when it was read until its response was written, with ``decode``, ``queue``,
+``handler``, ``encode`` and ``write`` children. Handlers add their own spans under ``handler`` with
+:py:func:`span`:
+
+.. code-block:: python
+
+    async def text_document__completion(self, params):
+        with span('resolve imports', uri=params['textDocument']['uri']):
+            ...
+
+Files ending in ``.json`` are written in the `Chrome trace event format`_, which https://ui.perfetto.dev and
+``chrome://tracing`` open directly; anything else gets one json object per span.
+
+.. _Chrome trace event format: https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU
+"""
+from __future__ import annotations
+
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Literal
+
+import ujson as json
+
+from lsp.protocol import Message
+
+Format = Literal['chrome', 'jsonl']
+
+current_span: ContextVar[Span | None] = ContextVar('current_span', default=None)
+
+
+@dataclass(eq=False)
+class Span:
+    tracer: Tracer
+    name: str
+    trace_id: int
+    span_id: int
+    parent_id: int | None
+    #: ``time.perf_counter_ns()`` at the start and end of the span
+    start: int
+    #: the track the trace is drawn on in the chrome format, shared with no other trace running at the same time
+    lane: int = 0
+    end: int = 0
+    args: dict[str, Any] = field(default_factory=dict)
+
+    def child(self, name: str, start: int | None = None, **args: Any) -> Span:
+        return Span(self.tracer,
+                    name,
+                    self.trace_id,
+                    self.tracer.next_id(),
+                    self.span_id,
+                    time.perf_counter_ns() if start is None else start,
+                    self.lane,
+                    args=args)
+
+    def finish(self, end: int | None = None) -> None:
+        self.end = time.perf_counter_ns() if end is None else end
+        self.tracer.export(self)
+
+
+class Tracer:
+    """
+    Write finished spans to ``path``, in ``format`` (by default chosen by the file's suffix).
+    """
+
+    def __init__(self, path: str | Path, format: Format | None = None) -> None:
+        path = Path(path)
+        self.format: Format = format or ('chrome' if path.suffix == '.json' else 'jsonl')
+        self.file = open(path, 'w')
+        self._ids = itertools.count(1)
+        self._lanes = itertools.count()
+        self._free_lanes: list[int] = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        # perf_counter_ns() is only meaningful relative to itself
+        self._epoch = time.time_ns() - time.perf_counter_ns()
+        self._separator = ''
+        if self.format == 'chrome':
+            # the closing bracket is optional, so a trace cut short by the server dying still loads
+            self.file.write('[\n')
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    def start(self, name: str, start: int | None = None, **args: Any) -> Span:
+        """
+        Start a new trace.
+        """
+        trace_id = self.next_id()
+        with self._lock:
+            lane = heapq.heappop(self._free_lanes) if self._free_lanes else next(self._lanes)
+        return Span(self,
+                    name,
+                    trace_id,
+                    trace_id,
+                    None,
+                    time.perf_counter_ns() if start is None else start,
+                    lane,
+                    args=args)
+
+    def message(self, msg: Message[Any], method: str) -> Span:
+        """
+        Start the trace of a message that's about to be dispatched, with its ``decode`` and ``queue`` spans.
+        """
+        args = {} if (msg_id := msg.content.get('id')) is None else {'id': msg_id}
+        if not msg.received:
+            return self.start(method, **args)
+        root = self.start(method, msg.received, **args)
+        root.child('decode', msg.received, bytes=msg.content_len).finish(msg.decoded)
+        root.child('queue', msg.decoded).finish()
+        return root
+
+    def export(self, span: Span) -> None:
+        if self.format == 'chrome':
+            line = json.dumps({
+                'name': span.name,
+                'cat': 'lsp',
+                'ph': 'X',
+                'ts': span.start / 1000,
+                'dur': (span.end - span.start) / 1000,
+                'pid': self._pid,
+                'tid': span.lane,
+                'args': span.args,
+            })
+        else:
+            line = json.dumps({
+                'traceId': span.trace_id,
+                'spanId': span.span_id,
+                'parentId': span.parent_id,
+                'name': span.name,
+                'start': self._epoch + span.start,
+                'duration': span.end - span.start,
+                'attributes': span.args,
+            })
+        with self._lock:
+            self.file.write(self._separator + line)
+            self._separator = ',\n' if self.format == 'chrome' else '\n'
+            if span.parent_id is None:
+                heapq.heappush(self._free_lanes, span.lane)
+                self.file.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            self.file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self.file.write('\n]\n' if self.format == 'chrome' else '\n')
+            self.file.close()
+
+
+@contextmanager
+def span(name: str, **args: Any) -> Iterator[Span | None]:
+    """
+    Record a span under the current one, if the message being handled is being traced.
+    """
+    parent = current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = parent.child(name, **args)
+    token = current_span.set(child)
+    try:
+        yield child
+    finally:
+        current_span.reset(token)
+        child.finish()
@@ -0,0 +1,51 @@
+"""
+Language server for the client tests: answers out of order, and sends the client notifications and requests.
+"""
+import asyncio
+from typing import Any
+
+from lsp import LanguageServer
+from lsp.executors import concurrent
+from lsp.lsp.messages import InitializeParams, InitializeResult
+from lsp.lsp.server import ServerCapabilities, WorkspaceEdit
+from lsp.protocol import JsonRpcException
+
+
+class ClientTestServer(LanguageServer):
+
+    async def initialize(self, params: InitializeParams) -> InitializeResult:
+        return InitializeResult(capabilities=ServerCapabilities(hoverProvider=True))
+
+    @concurrent
+    async def echo(self, params: dict[str, Any]) -> dict[str, Any]:
+        await asyncio.sleep(params.get('delay', 0))
+        return params
+
+    async def fail(self, params: None) -> None:
+        raise JsonRpcException(-32803, "failed")
+
+    async def chatty(self, params: int) -> int:
+        for i in range(params):
+            self.session.notify('test/progress', i)
+        return params
+
+    @concurrent
+    async def edit(self, params: WorkspaceEdit) -> dict[str, Any]:
+        result = await self.session.request('workspace/applyEdit', {'edit': params})
+        return {'result': result, 'documents': {uri: doc.text for uri, doc in self.documents.documents.items()}}
+
+    @concurrent
+    async def ask(self, params: str) -> dict[str, Any]:
+        try:
+            return {'answer': await self.session.request('test/question', params)}
+        except JsonRpcException as e:
+            return {'error': e.message}
+
+
+async def amain() -> None:
+    async with ClientTestServer(shared_memory_threshold=1024).serve(port=None) as server:
+        await server.wait()
+
+
+if __name__ == '__main__':
+    asyncio.run(amain())
@@ -0,0 +1,67 @@
+"""
+Worker language server for the supervisor tests, reports which folder and process it is.
+"""
+import asyncio
+import os
+from typing import Any
+
+from lsp import LanguageServer
+from lsp.executors import concurrent
+from lsp.lsp.common import DocumentUri, Location, Position, Range
+from lsp.lsp.messages import InitializeParams, InitializeResult
+from lsp.lsp.server import (CompletionItem, CompletionList, CompletionParams, Hover, HoverParams, ServerCapabilities,
+                            SymbolInformation, WorkspaceSymbol, WorkspaceSymbolParams)
+from lsp.protocol import JsonRpcException
+
+
+class ShardWorker(LanguageServer):
+    root: str = ''
+
+    async def initialize(self, params: InitializeParams) -> InitializeResult:
+        self.root = params['rootUri'] or ''
+        return InitializeResult(capabilities=ServerCapabilities(hoverProvider=True))
+
+    async def text_document__hover(self, params: HoverParams) -> Hover | None:
+        text = self.documents[params['textDocument']['uri']].text
+        return Hover(contents=f'{self.root} {os.getpid()} {text}')
+
+    async def open_documents(self, params: None) -> list[DocumentUri]:
+        return sorted(self.documents)
+
+    async def text_document__completion(self, params: CompletionParams) -> CompletionList:
+        return CompletionList(isIncomplete=False,
+                              items=[CompletionItem(label='x', data={'pid': os.getpid()}),
+                                     CompletionItem(label='y')])
+
+    async def completion_item__resolve(self, params: CompletionItem) -> CompletionItem:
+        # only this process knows what its items' data means
+        mine = 'data' not in params or params['data'] == {'pid': os.getpid()}
+        resolved = params.copy()
+        resolved['detail'] = f'{self.root} {mine}'
+        return resolved
+
+    @concurrent
+    async def ask(self, params: str) -> dict[str, Any]:
+        try:
+            return {'answer': await self.session.request('test/question', params)}
+        except JsonRpcException as e:
+            return {'code': e.code}
+
+    async def workspace__symbol(
+            self, params: WorkspaceSymbolParams) -> list[SymbolInformation] | list[WorkspaceSymbol] | None:
+        return [
+            WorkspaceSymbol(name=self.root,
+                            kind=2,
+                            location=Location(uri=DocumentUri(self.root),
+                                              range=Range(start=Position(line=0, character=0),
+                                                          end=Position(line=0, character=0))))
+        ]
+
+
+async def amain() -> None:
+    async with ShardWorker().serve(port=None) as server:
+        await server.wait()
+
+
+if __name__ == '__main__':
+    asyncio.run(amain())
@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+from collections.abc import AsyncIterable
+from typing import Any
+
+import pytest
+
+from lsp.client import Client, ClientPool, ExitedError, LspProtocolSubprocess
+from lsp.lsp.common import DocumentUri, Position, Range
+from lsp.lsp.server import DidOpenTextDocumentParams, TextDocumentItem, TextEdit, WorkspaceEdit
+from lsp.protocol import JsonRpcException, JsonRpcResponse, Message
+
+SERVER = [sys.executable, '-m', 'tests.client_server']
+
+
+@pytest.fixture
+async def client() -> AsyncIterable[Client]:
+    async with Client().run(SERVER, timeout=10) as client:
+        yield client
+
+
+async def test_initialize(client: Client) -> None:
+    assert client.initialize_result is not None
+    assert client.initialize_result['capabilities'] == {'hoverProvider': True}
+
+
+async def test_pipelined(client: Client) -> None:
+    # answered in the reverse order they were sent
+    results = await asyncio.gather(*(client.request('echo', {'i': i, 'delay': (10 - i) / 100}) for i in range(10)))
+    assert [result['i'] for result in results] == list(range(10))
+    assert not client._pending
+
+
+async def test_error(client: Client) -> None:
+    with pytest.raises(JsonRpcException) as e:
+        await client.request('fail', None)
+    assert e.value.code == -32803
+
+
+async def test_timeout(client: Client) -> None:
+    with pytest.raises(TimeoutError):
+        await client.request('echo', {'delay': 1}, timeout=0.05)
+    assert not client._pending
+    # the cancelled request is answered with an error, which is ignored
+    assert await client.request('echo', {'ok': True}) == {'ok': True}
+
+
+async def test_subscribe(client: Client) -> None:
+    received: list[int] = []
+    unsubscribe = client.subscribe('test/progress', received.append)
+    assert await client.request('chatty', 3) == 3
+    assert received == [0, 1, 2]
+    unsubscribe()
+    await client.request('chatty', 2)
+    assert received == [0, 1, 2]
+
+
+async def test_server_requests(client: Client) -> None:
+    # unhandled requests are answered with null, which the server sees as no answer
+    assert await client.request('ask', 'anyone?') == {'answer': None}
+
+    async def answer(params: str) -> str:
+        return params.upper()
+
+    client.on_request('test/question', answer)
+    assert await client.request('ask', 'hello') == {'answer': 'HELLO'}
+
+    def refuse(params: str) -> Any:
+        raise JsonRpcException(-32803, f"won't answer {params}")
+
+    client.on_request('test/question', refuse)
+    assert await client.request('ask', 'why') == {'error': "won't answer why"}
+
+
+async def test_apply_edit(client: Client) -> None:
+    uri = DocumentUri('file:///a.txt')
+    client.notify(
+        'textDocument/didOpen',
+        DidOpenTextDocumentParams(textDocument=TextDocumentItem(uri=uri, languageId='text', version=1, text='hello')))
+    edit = WorkspaceEdit(changes={
+        uri:
+        [TextEdit(range=Range(start=Position(line=0, character=0), end=Position(line=0, character=1)), newText='J')]
+    })
+    assert await client.request('edit', edit) == {'result': {'applied': True}, 'documents': {uri: 'Jello'}}
+    assert client.documents[uri].text == 'Jello' and client.documents[uri].version == 2
+    # not applied to documents the client doesn't have open
+    result = await client.request('edit', WorkspaceEdit(changes={DocumentUri('file:///b.txt'): []}))
+    assert result['result'] == {'applied': False, 'failureReason': "file:///b.txt isn't open"}
+
+
+async def test_exited(client: Client) -> None:
+    pending = asyncio.create_task(client.request('echo', {'delay': 5}))
+    await asyncio.sleep(0.05)
+    client.protocol.proctransport.kill()
+    with pytest.raises(ExitedError):
+        await pending
+    assert client.exited
+    with pytest.raises(ExitedError):
+        await client.request('echo', {})
+
+
+async def test_read_after_exit() -> None:
+    protocol: LspProtocolSubprocess[Any] = LspProtocolSubprocess()
+    protocol.pipe_data_received(1, bytes(Message(content=JsonRpcResponse(jsonrpc='2.0', id=1, result=1))))
+    protocol.process_exited()
+    # output can still arrive after the process has exited
+    protocol.pipe_data_received(1, bytes(Message(content=JsonRpcResponse(jsonrpc='2.0', id=2, result=2))))
+    protocol.connection_lost(None)
+    # what the server sent before exiting is still read
+    assert (await protocol.read_message()).content['id'] == 1
+    assert (await protocol.read_message()).content['id'] == 2
+    for _ in range(2):
+        with pytest.raises(ExitedError):
+            await protocol.read_message()
+    assert len(asyncio.all_tasks()) == 1
+
+
+async def test_pool() -> None:
+    async with ClientPool(size=2, timeout=10) as pool:
+        await pool.warm(SERVER)
+        used: set[int] = set()
+        for _ in range(4):
+            async with pool.acquire(SERVER) as client:
+                assert await client.request('echo', {'ok': True}) == {'ok': True}
+                used.add(client.pid)
+        assert len(used) <= 2
+
+        # both are handed out at once, and a third job waits for one of them
+        async with pool.acquire(SERVER) as first, pool.acquire(SERVER) as second:
+            assert {first.pid, second.pid} == used
+            third = pool.acquire(SERVER)
+            waiting = asyncio.create_task(third.__aenter__())
+            await asyncio.sleep(0.1)
+            assert not waiting.done()
+        assert (await waiting).pid in used
+        await third.__aexit__(None, None, None)
+
+        # other roots get their own servers
+        async with pool.acquire(SERVER, DocumentUri('file:///other')) as client:
+            assert client.pid not in used
+
+
+async def test_pool_recycles() -> None:
+    async with ClientPool(size=1, timeout=10, max_uses=2) as pool:
+        pids = []
+        for _ in range(4):
+            async with pool.acquire(SERVER) as client:
+                pids.append(client.pid)
+        assert pids[0] == pids[1] != pids[2] == pids[3]
+
+        async with pool.acquire(SERVER) as client:
+            client.protocol.proctransport.kill()
+            await client.protocol.exited_event.wait()
+        async with pool.acquire(SERVER) as client:
+            assert await client.request('echo', {'ok': True}) == {'ok': True}
+
+    async with ClientPool(size=1, timeout=10, max_rss=1) as pool:
+        pids = []
+        for _ in range(2):
+            async with pool.acquire(SERVER) as client:
+                pids.append(client.pid)
+        assert pids[0] != pids[1]
+
+
+async def test_pool_close() -> None:
+    pool = ClientPool(size=1, timeout=10)
+    async with pool.acquire(SERVER) as client:
+        waiting = asyncio.create_task(pool.acquire(SERVER).__aenter__())
+        await asyncio.sleep(0.05)
+        await pool.close()
+        with pytest.raises(RuntimeError):
+            await waiting
+    assert client.protocol.exited_event.is_set()
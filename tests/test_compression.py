@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+from typing import TYPE_CHECKING, Any, Type
+
+import pytest
+
+from lsp import LanguageServer
+from lsp.client import Client
+from lsp.compression import advertise, codecs, compress, decompress, negotiate
+from lsp.lsp.messages import InitializeParams, InitializeResult
+from lsp.protocol import InvalidMessageError, JsonRpcRequest, JsonRpcResponse, LspProtocol, Message
+
+if TYPE_CHECKING:
+    from tests.conftest import RequstFn
+
+BIG = {'text': 'some very compressible text ' * 1000}
+
+
+def test_message_round_trip() -> None:
+    msg = Message(content=JsonRpcResponse(jsonrpc='2.0', id=1, result=BIG), content_encoding='zlib')
+    data = bytes(msg)
+    assert b'Content-Encoding: zlib\r\n' in data
+    assert len(data) < msg.content_len / 10
+    assert Message.frame_length(data + b'Content-Length: 2') == len(data)
+    parsed: Message[Any]
+    read, parsed = Message.parse(data)
+    assert read == len(data)
+    assert parsed.content == msg.content
+    assert parsed.content_encoding == 'zlib'
+    assert parsed.content_len == msg.content_len
+
+
+@pytest.mark.parametrize('encoding', codecs())
+def test_decompress_limit(encoding: str) -> None:
+    bomb = compress(encoding, b' ' * 1_000_000)
+    assert decompress(encoding, bomb, 1_000_000) == b' ' * 1_000_000
+    with pytest.raises(ValueError, match='exceeds'):
+        decompress(encoding, bomb, 999_999)
+    with pytest.raises(ValueError):
+        decompress(encoding, bomb[:len(bomb) // 2], 1_000_000)
+
+
+def test_message_rejected() -> None:
+    data = bytes(Message(content=JsonRpcResponse(jsonrpc='2.0', id=1, result=BIG), content_encoding='zlib'))
+    with pytest.raises(InvalidMessageError, match="wasn't agreed"):
+        Message.parse(data, encodings=())
+    with pytest.raises(InvalidMessageError, match='exceeds'):
+        Message.parse(data, encodings={'zlib'}, max_length=1000)
+
+
+def test_negotiate() -> None:
+    assert negotiate({}, codecs()) is None
+    capabilities = advertise({'experimental': {'other': 1}}, ['brotli', 'zlib'])
+    assert capabilities == {'experimental': {'other': 1, 'contentEncodings': ['zlib']}}
+    assert negotiate(capabilities, ['zlib']) == 'zlib'
+    assert negotiate(capabilities, []) is None
+    assert advertise(capabilities, []) == {'experimental': {'other': 1}}
+
+
+class EchoLanguageServer(LanguageServer):
+
+    async def initialize(self, params: InitializeParams) -> InitializeResult:
+        return InitializeResult(capabilities={'experimental': {'mine': True}})
+
+    async def echo(self, params: Any) -> Any:
+        return params
+
+
+@pytest.fixture
+def lsp_class() -> Type[LanguageServer]:
+    return EchoLanguageServer
+
+
+async def test_server(lsp_server_port: int, make_request: RequstFn[Any]) -> None:
+    protocol: LspProtocol[Any] = LspProtocol()
+    transport, _ = await asyncio.get_running_loop().create_connection(lambda: protocol, port=lsp_server_port)
+    protocol.write_message(
+        make_request('initialize',
+                     InitializeParams(rootUri=None, processId=os.getpid(), capabilities=advertise({}, ['zlib']))))
+    result = (await protocol.read_message()).content['result']
+    assert result['capabilities']['experimental'] == {'mine': True, 'contentEncoding': 'zlib'}
+    protocol.content_encoding = 'zlib'
+    protocol.accepted_encodings = frozenset({'zlib'})
+
+    request = Message(content=make_request('echo', BIG).content)
+    protocol.write_message(request)
+    # compressed on the way out, not in place
+    assert request.content_encoding is None
+    response = await protocol.read_message()
+    assert response.content['result'] == BIG
+    assert response.content_encoding == 'zlib'
+    # small messages aren't worth it
+    protocol.write_message(make_request('echo', {'small': True}))
+    assert (await protocol.read_message()).content_encoding is None
+    transport.close()
+
+
+async def test_server_not_agreed(lsp_server_port: int, make_request: RequstFn[Any]) -> None:
+    protocol: LspProtocol[Any] = LspProtocol()
+    transport, _ = await asyncio.get_running_loop().create_connection(lambda: protocol, port=lsp_server_port)
+    protocol.write_message(
+        make_request('initialize', InitializeParams(rootUri=None, processId=os.getpid(), capabilities={})))
+    assert 'contentEncoding' not in (await protocol.read_message()).content['result']['capabilities']['experimental']
+
+    request = JsonRpcRequest(jsonrpc='2.0', id=10, method='echo', params=BIG)
+    transport.write(bytes(Message(content=request, content_encoding='zlib')))
+    response = await protocol.read_message()
+    assert response.content['id'] is None
+    assert response.content['error']['code'] == -32600
+    # nor compressed when writing a message that was, without agreeing to it
+    protocol.write_message(Message(content=request, content_encoding='zlib'))
+    response = await protocol.read_message()
+    assert response.content['result'] == BIG
+    transport.close()
+
+
+async def test_client() -> None:
+    async with Client(content_encodings=['zlib']).run([sys.executable, '-m', 'tests.client_server'],
+                                                      timeout=10) as client:
+        assert client.protocol.content_encoding == 'zlib'
+        assert await client.request('echo', BIG) == BIG
+    async with Client().run([sys.executable, '-m', 'tests.client_server'], timeout=10) as client:
+        assert client.protocol.content_encoding is None
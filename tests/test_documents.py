@@ -0,0 +1,82 @@
+import random
+from dataclasses import replace
+
+from lsp.documents import DocumentStore, TextDocument, utf16_to_index
+from lsp.lsp.common import DocumentUri, Position, Range
+from lsp.lsp.server import (DidChangeTextDocumentParams, DidCloseTextDocumentParams, DidOpenTextDocumentParams,
+                            TextDocumentContentChangeEvent, TextDocumentContentChangeEventRange,
+                            TextDocumentContentChangeEventSimple, TextDocumentIdentifier, TextDocumentItem,
+                            VersionedTextDocumentIdentifier)
+
+URI = DocumentUri('file:///doc.txt')
+
+
+def change(start: tuple[int, int], end: tuple[int, int], text: str) -> TextDocumentContentChangeEventRange:
+    return TextDocumentContentChangeEventRange(range=Range(start=Position(line=start[0], character=start[1]),
+                                                           end=Position(line=end[0], character=end[1])),
+                                               text=text)
+
+
+def test_utf16_to_index() -> None:
+    assert utf16_to_index('abc', 2) == 2
+    assert utf16_to_index('abc', 10) == 3
+    # the emoji is two utf-16 code units
+    assert utf16_to_index('a😀b', 3) == 2
+    assert utf16_to_index('a😀b', 4) == 3
+
+
+def test_offset_at() -> None:
+    doc = TextDocument(uri=URI, language_id='text', version=1, text='one\r\ntwo\nthree')
+    assert doc.offset_at(Position(line=1, character=1)) == 6
+    assert doc.offset_at(Position(line=1, character=99)) == 8
+    assert doc.offset_at(Position(line=5, character=0)) == len(doc.text)
+
+
+def test_store_lifecycle() -> None:
+    store = DocumentStore()
+    store.update(
+        'textDocument/didOpen',
+        DidOpenTextDocumentParams(
+            textDocument=TextDocumentItem(uri=URI, languageId='text', version=1, text='hello\nworld')))
+    opened = store[URI]
+    store.update(
+        'textDocument/didChange',
+        DidChangeTextDocumentParams(textDocument=VersionedTextDocumentIdentifier(uri=URI, version=2),
+                                    contentChanges=[change((1, 0), (1, 5), 'there'),
+                                                    change((0, 5), (0, 5), ',')]))
+    assert store[URI].text == 'hello,\nthere'
+    assert store[URI].version == 2
+    assert opened.text == 'hello\nworld'
+    store.update(
+        'textDocument/didChange',
+        DidChangeTextDocumentParams(textDocument=VersionedTextDocumentIdentifier(uri=URI, version=3),
+                                    contentChanges=[TextDocumentContentChangeEventSimple(text='replaced')]))
+    assert store[URI].text == 'replaced'
+    store.update('textDocument/didClose', DidCloseTextDocumentParams(textDocument=TextDocumentIdentifier(uri=URI)))
+    assert URI not in store
+
+
+def test_apply_changes() -> None:
+    rng = random.Random(0)
+    doc = TextDocument(uri=URI, language_id='text', version=1, text='one\ntwo 😀\r\nthree\n' * 5)
+    for _ in range(200):
+        changes: list[TextDocumentContentChangeEvent] = []
+        expected = doc
+        start = end = (0, 0)
+        for _ in range(rng.randrange(1, 6)):
+            lines = expected.text.splitlines() or ['']
+            # multi-cursor edits come from the bottom up, and inserts at the same position are common
+            if not changes or rng.random() < .5:
+                line = rng.randrange(len(lines))
+                start = (line, rng.randrange(len(lines[line]) + 1))
+                end = (line, rng.randrange(start[1], len(lines[line]) + 1)) if rng.random() < .7 else (line + 1, 0)
+            else:
+                end = start
+            new = change(start, end, rng.choice(['', 'x', 'ab\n', '😀']))
+            changes.append(new)
+            # one at a time
+            start_offset, end_offset = expected.offset_at(new['range']['start']), expected.offset_at(
+                new['range']['end'])
+            expected = replace(expected, text=expected.text[:start_offset] + new['text'] + expected.text[end_offset:])
+        doc = doc.apply_changes(changes, doc.version + 1)
+        assert doc.text == expected.text
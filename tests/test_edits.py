@@ -0,0 +1,155 @@
+import random
+
+import pytest
+
+from lsp import edits
+from lsp.documents import TextDocument
+from lsp.edits import EditError, apply_text_edits, apply_workspace_edit, diff, diff_edits
+from lsp.lsp.common import DocumentUri, Position, Range
+from lsp.lsp.server import (AnnotatedTextEdit, CreateFile, DeleteFile, OptionalVersionedTextDocumentIdentifier,
+                            RenameFile, TextDocumentEdit, TextEdit, WorkspaceEdit)
+
+URI = DocumentUri('file:///doc.txt')
+OTHER = DocumentUri('file:///other.txt')
+
+
+def edit(start: tuple[int, int], end: tuple[int, int], text: str) -> TextEdit:
+    return TextEdit(range=Range(start=Position(line=start[0], character=start[1]),
+                                end=Position(line=end[0], character=end[1])),
+                    newText=text)
+
+
+def document(text: str, uri: DocumentUri = URI, version: int = 1) -> TextDocument:
+    return TextDocument(uri=uri, language_id='text', version=version, text=text)
+
+
+def test_apply_text_edits() -> None:
+    doc = document('hello\nworld\n')
+    # all relative to the original text, in any order
+    assert apply_text_edits(doc, [edit((1, 0), (1, 5), 'there'), edit((0, 0), (0, 1), 'J')]) == 'Jello\nthere\n'
+    assert apply_text_edits(doc, []) == doc.text
+    # inserts at the same position stay in order, and can be followed by a replacement starting there
+    assert apply_text_edits(doc, [edit(
+        (0, 5), (0, 5), ','), edit(
+            (0, 5), (0, 5), ' '), edit((0, 5), (1, 0), '!')]) == 'hello, !world\n'
+    annotated = AnnotatedTextEdit(range=Range(start=Position(line=0, character=0), end=Position(line=0, character=5)),
+                                  newText='bye',
+                                  annotationId='rename')
+    assert apply_text_edits(doc, [annotated]) == 'bye\nworld\n'
+    # utf-16 positions
+    assert apply_text_edits(document('a😀b'), [edit((0, 3), (0, 4), 'c')]) == 'a😀c'
+
+
+def test_invalid_text_edits() -> None:
+    doc = document('hello\nworld\n')
+    with pytest.raises(EditError, match='overlaps'):
+        apply_text_edits(doc, [edit((0, 0), (0, 3), 'x'), edit((0, 2), (0, 4), 'y')])
+    with pytest.raises(EditError, match='overlaps'):
+        # a replacement followed by an insert at its start
+        apply_text_edits(doc, [edit((0, 0), (0, 3), 'x'), edit((0, 0), (0, 0), 'y')])
+    with pytest.raises(EditError, match='before it starts'):
+        apply_text_edits(doc, [edit((1, 0), (0, 3), 'x')])
+
+
+def test_apply_workspace_edit() -> None:
+    documents = {URI: document('one\ntwo\n', version=3), OTHER: document('other', OTHER)}
+    edited = apply_workspace_edit(documents, WorkspaceEdit(changes={URI: [edit((0, 0), (0, 3), '1')]}))
+    assert edited == {URI: document('1\ntwo\n', version=4)}
+    # ignored for documentChanges
+    changes = {URI: [edit((0, 0), (0, 3), 'ignored')]}
+    edited = apply_workspace_edit(
+        documents,
+        WorkspaceEdit(
+            changes=changes,
+            documentChanges=[
+                TextDocumentEdit(textDocument=OptionalVersionedTextDocumentIdentifier(uri=URI, version=3),
+                                 edits=[edit((1, 0), (1, 3), '2')]),
+                TextDocumentEdit(textDocument=OptionalVersionedTextDocumentIdentifier(uri=OTHER, version=None),
+                                 edits=[edit((0, 0), (0, 0), 'an')]),
+                # applied after the first edit to the same document
+                TextDocumentEdit(textDocument=OptionalVersionedTextDocumentIdentifier(uri=URI, version=3),
+                                 edits=[edit((1, 1), (1, 1), 'nd')]),
+            ]))
+    assert edited == {URI: document('one\n2nd\n', version=4), OTHER: document('another', OTHER, version=2)}
+    assert documents[URI].text == 'one\ntwo\n' and documents[URI].version == 3
+
+
+def test_invalid_workspace_edit() -> None:
+    documents = {URI: document('one\ntwo\n', version=3)}
+    with pytest.raises(EditError, match='version 3, not 2'):
+        apply_workspace_edit(
+            documents,
+            WorkspaceEdit(documentChanges=[
+                TextDocumentEdit(textDocument=OptionalVersionedTextDocumentIdentifier(uri=URI, version=2),
+                                 edits=[edit((0, 0), (0, 3), '1')])
+            ]))
+    with pytest.raises(EditError, match="isn't open"):
+        apply_workspace_edit(
+            documents, WorkspaceEdit(changes={
+                URI: [edit((0, 0), (0, 3), '1')],
+                OTHER: [edit((0, 0), (0, 0), 'x')]
+            }))
+    operations: list[TextDocumentEdit | CreateFile | RenameFile | DeleteFile] = [CreateFile(kind='create', uri=OTHER)]
+    with pytest.raises(EditError, match="create"):
+        apply_workspace_edit(documents, WorkspaceEdit(documentChanges=operations))
+
+
+def test_diff() -> None:
+    # the example from Myers' paper: 5 insertions and deletions at least
+    hunks = diff('abcabba', 'cbabac')
+    assert sum(a_end - a_start + b_end - b_start for a_start, a_end, b_start, b_end in hunks) == 5
+    assert diff('same', 'same') == []
+    assert diff([], ['x']) == [(0, 0, 0, 1)]
+
+
+@pytest.mark.parametrize('max_work', [edits._MAX_LINE_WORK, 1])
+def test_diff_reordered(max_work: int) -> None:
+    old = [f'line {i}\n' for i in range(2000)]
+    new = old.copy()
+    random.Random(0).shuffle(new)
+    hunks = diff(old, new, max_work=max_work)
+    patched: list[str] = []
+    position = 0
+    for a_start, a_end, b_start, b_end in hunks:
+        assert a_start >= position
+        patched += old[position:a_start] + new[b_start:b_end]
+        position = a_end
+    assert patched + old[position:] == new
+    if max_work == 1:
+        # past the budget, what's left is replaced in one piece
+        assert len(hunks) < len(diff(old, new))
+
+
+def test_diff_edits() -> None:
+    doc = document('def f(x,y):\n  return x\n\n\nprint(f(1,2))\n')
+    new = 'def f(x, y):\n    return x\n\nprint(f(1, 2))\n'
+    assert diff_edits(doc, new) == [
+        edit((0, 8), (0, 8), ' '),
+        edit((1, 2), (1, 2), '  '),
+        edit((3, 0), (4, 0), ''),
+        edit((4, 10), (4, 10), ' '),
+    ]
+    assert diff_edits(doc, doc.text) == []
+    # only the range is replaced
+    assert diff_edits(doc, 'print(f(1, 2))',
+                      Range(start=Position(line=4, character=0),
+                            end=Position(line=4, character=13))) == [edit((4, 10), (4, 10), ' ')]
+
+
+@pytest.mark.parametrize('char_work', [edits._MAX_CHAR_WORK, 1], ids=['characters', 'lines'])
+def test_diff_edits_random(monkeypatch: pytest.MonkeyPatch, char_work: int) -> None:
+    # past the budget for diffing characters, whole lines are replaced
+    monkeypatch.setattr(edits, '_MAX_CHAR_WORK', char_work)
+    rng = random.Random(0)
+    alphabet = ['a', 'b', ' ', '\n', '\r\n', '\r', '😀']
+    for _ in range(2000):
+        old = ''.join(rng.choice(alphabet) for _ in range(rng.randrange(20)))
+        new = ''.join(rng.choice(alphabet) for _ in range(rng.randrange(20)))
+        doc = document(old)
+        text_edits = diff_edits(doc, new)
+        assert apply_text_edits(doc, text_edits) == new
+        for text_edit in text_edits:
+            for position in (text_edit['range']['start'], text_edit['range']['end']):
+                # never between the \r and \n of a line break
+                offset = doc.offset_at(position)
+                assert old[offset - 1:offset + 1] != '\r\n'
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import threading
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Type
+
+import pytest
+
+from lsp import LanguageServer
+from lsp.documents import TextDocument
+from lsp.executors import in_process, max_concurrency
+from lsp.lsp.common import DocumentUri, MessageData, Position
+from lsp.lsp.messages import InitializeParams, InitializeResult
+from lsp.lsp.server import (DidOpenTextDocumentParams, Hover, HoverParams, TextDocumentIdentifier, TextDocumentItem)
+from lsp.protocol import JsonRpcRequest, LspProtocol, Message
+
+if TYPE_CHECKING:
+    from tests.conftest import RequstFn
+
+URI = DocumentUri('file:///doc.txt')
+
+running = 0
+running_lock = threading.Lock()
+
+
+def count_running(seconds: float) -> int:
+    global running
+    with running_lock:
+        running += 1
+    time.sleep(seconds)
+    with running_lock:
+        now = running
+        running -= 1
+    return now
+
+
+def logged(handler: Callable[[Any, Any], Awaitable[Any]]) -> Callable[[Any, Any], Awaitable[Any]]:
+
+    @functools.wraps(handler)
+    def wrapper(self: Any, params: Any) -> Awaitable[Any]:
+        return handler(self, params)
+
+    return wrapper
+
+
+def unwrapped(handler: Callable[[Any, Any], Awaitable[Any]]) -> Callable[[Any, Any], Awaitable[Any]]:
+
+    def wrapper(self: Any, params: Any) -> Awaitable[Any]:
+        return handler(self, params)
+
+    return wrapper
+
+
+@dataclass
+class OffloadingLanguageServer(LanguageServer):
+    notified: list[int] = field(default_factory=list)
+
+    async def initialize(self, params: InitializeParams) -> InitializeResult:
+        return InitializeResult(capabilities={})
+
+    @in_process
+    def slow(params: dict[str, Any], document: TextDocument | None) -> str:
+        time.sleep(params['seconds'])
+        return 'slow'
+
+    @in_process
+    def text_document__hover(params: HoverParams, document: TextDocument | None) -> Hover | None:
+        assert document is not None
+        return Hover(contents=f'{document.version}: {document.text}')
+
+    async def fast(self, params: None) -> str:
+        return 'fast'
+
+    def blocking(self, params: dict[str, Any]) -> str:
+        time.sleep(params['seconds'])
+        return threading.current_thread().name
+
+    def parallel(self, params: None) -> int:
+        return count_running(0.2)
+
+    @max_concurrency(1)
+    def serial(self, params: None) -> int:
+        return count_running(0.2)
+
+    @logged
+    async def wrapped(self, params: None) -> str:
+        return threading.current_thread().name
+
+    @unwrapped
+    async def returns_coroutine(self, params: None) -> str:
+        return 'awaited'
+
+    def note(self, params: dict[str, Any]) -> None:
+        time.sleep(params['seconds'])
+        self.notified.append(params['n'])
+
+    async def notified_so_far(self, params: None) -> list[int]:
+        return self.notified
+
+
+@pytest.fixture
+async def lsp_class() -> Type[OffloadingLanguageServer]:
+    return OffloadingLanguageServer
+
+
+async def test_offloaded_request_does_not_block(lsp_client: LspProtocol[Any], make_request: RequstFn[Any]) -> None:
+    lsp_client.write_message(make_request('slow', {'seconds': 2}))
+    lsp_client.write_message(make_request('fast', None))
+    first = await lsp_client.read_message()
+    assert first.content['result'] == 'fast'
+    second = await lsp_client.read_message()
+    assert second.content['result'] == 'slow'
+
+
+async def test_document_snapshot(lsp_client: LspProtocol[Any], make_request: RequstFn[MessageData]) -> None:
+    lsp_client.write_message(
+        make_request('textDocument/didOpen',
+                     DidOpenTextDocumentParams(
+                         textDocument=TextDocumentItem(uri=URI, languageId='text', version=3, text='hello'))))
+    lsp_client.write_message(
+        make_request('textDocument/hover',
+                     HoverParams(textDocument=TextDocumentIdentifier(uri=URI), position=Position(line=0,
+                                                                                                 character=0))))
+    resp = await lsp_client.read_message()
+    assert resp.content['result'] == {'contents': '3: hello'}
+
+
+async def test_cancel(lsp_client: LspProtocol[Any], make_request: RequstFn[Any]) -> None:
+    request = make_request('slow', {'seconds': 5})
+    lsp_client.write_message(request)
+    await asyncio.sleep(0.1)
+    lsp_client.write_message(make_request('$/cancelRequest', {'id': request.content['id']}))
+    resp = await asyncio.wait_for(lsp_client.read_message(), 1)
+    assert resp.content['id'] == request.content['id']
+    assert resp.content['error']['code'] == -32800
+
+
+async def test_sync_handler_runs_in_thread(lsp_client: LspProtocol[Any], make_request: RequstFn[Any]) -> None:
+    lsp_client.write_message(make_request('blocking', {'seconds': 1}))
+    lsp_client.write_message(make_request('fast', None))
+    first = await lsp_client.read_message()
+    assert first.content['result'] == 'fast'
+    second = await lsp_client.read_message()
+    assert second.content['result'].startswith('lsp-handler')
+
+
+@pytest.mark.parametrize('method,expected', [('parallel', 3), ('serial', 1)])
+async def test_max_concurrency(lsp_client: LspProtocol[Any], make_request: RequstFn[Any], method: str,
+                               expected: int) -> None:
+    for _ in range(3):
+        lsp_client.write_message(make_request(method, None))
+    results = [(await lsp_client.read_message()).content['result'] for _ in range(3)]
+    assert max(results) == expected
+
+
+@pytest.mark.parametrize('method,expected', [('wrapped', 'MainThread'), ('returns_coroutine', 'awaited')])
+async def test_wrapped_async_handler(lsp_client: LspProtocol[Any], make_request: RequstFn[Any], method: str,
+                                     expected: str) -> None:
+    lsp_client.write_message(make_request(method, None))
+    assert (await lsp_client.read_message()).content['result'] == expected
+
+
+async def test_sync_notifications_in_order(lsp_client: LspProtocol[Any], make_request: RequstFn[Any]) -> None:
+    for n, seconds in enumerate([0.2, 0, 0.1]):
+        params = {'n': n, 'seconds': seconds}
+        lsp_client.write_message(Message(content=JsonRpcRequest(jsonrpc='2.0', method='note', params=params)))
+    lsp_client.write_message(make_request('notified_so_far', None))
+    assert (await lsp_client.read_message()).content['result'] == [0, 1, 2]
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Type
+
+import pytest
+
+from lsp import LanguageServer
+from lsp.globs import DocumentSelectorMatcher, FileOperationMatcher, GlobSet, extensions
+from lsp.lsp.messages import InitializeParams, InitializeResult
+from lsp.lsp.common import DocumentUri
+from lsp.lsp.server import (DidOpenTextDocumentParams, DocumentFilter, DocumentSelector, FileOperationFilter,
+                            FileOperationPattern, FileOperationPatternOptions, FileOperationRegistrationOptions,
+                            FileRename, FoldingRange, FoldingRangeParams, FoldingRangeRegistrationOptions,
+                            RenameFilesParams, TextDocumentIdentifier, TextDocumentItem, WorkspaceEdit)
+from lsp.protocol import LspProtocol
+
+if TYPE_CHECKING:
+    from tests.conftest import RequstFn
+
+
+def matches(pattern: str, path: str) -> bool:
+    globs = GlobSet()
+    globs.add(pattern)
+    return globs.match(path)
+
+
+@pytest.mark.parametrize('pattern, path, expected', [
+    ('*.py', '/src/a.py', True),
+    ('*.py', '/src/a.pyi', False),
+    ('**/*.py', '/a.py', True),
+    ('**/*.py', '/src/pkg/a.py', True),
+    ('/src/**', '/src/pkg/a.py', True),
+    ('/src/**', '/other/a.py', False),
+    ('/src/**/test_*.py', '/src/test_a.py', True),
+    ('/src/**/test_*.py', '/src/pkg/test_a.py', True),
+    ('src/*.py', '/root/src/a.py', True),
+    ('src/*.py', '/root/src/pkg/a.py', False),
+    ('**/*.{ts,js}', '/a.js', True),
+    ('**/*.{ts,js}', '/a.jsx', False),
+    ('**/{src,lib/{a,b}}/*.c', '/x/lib/b/m.c', True),
+    ('example.[0-9]', '/example.1', True),
+    ('example.[!0-9]', '/example.1', False),
+    ('example.[!0-9]', '/example.a', True),
+    ('a?c', '/abc', True),
+    ('a?c', '/a/c', False),
+    ('a+b(c).txt', '/a+b(c).txt', True),
+])
+def test_glob(pattern: str, path: str, expected: bool) -> None:
+    assert matches(pattern, path) is expected
+
+
+def test_extensions() -> None:
+    assert extensions('**/*.PY') == {'py'}
+    assert extensions('*.{ts,js}') == {'ts', 'js'}
+    assert extensions('**/Makefile') is None
+    assert extensions('*.[ch]') is None
+
+
+def test_glob_set() -> None:
+    globs = GlobSet()
+    globs.add('**/*.py')
+    globs.add('**/Makefile')
+    globs.add('**/*.PY', ignore_case=True)
+    assert globs.matching('/a/b.py') == [0, 2]
+    assert globs.matching('/a/Makefile') == [1]
+    assert globs.match('/a/B.Py')
+    assert not globs.match('/a/b.txt')
+    assert not GlobSet().match('/a/b.py')
+    assert globs.first('/a/b.py') == 0
+    assert globs.first('/a/B.PY') == 2
+    assert globs.first('/a/b.txt') is None
+
+
+def test_file_operation_matcher() -> None:
+    matcher = FileOperationMatcher([
+        FileOperationFilter(scheme='file',
+                            pattern=FileOperationPattern(glob='**/*.py',
+                                                         options=FileOperationPatternOptions(ignoreCase=True))),
+        FileOperationFilter(pattern=FileOperationPattern(glob='**/build', matches='folder')),
+    ])
+    assert matcher.matches('file:///src/My%20Module.PY')
+    assert not matcher.matches('untitled:///src/a.py')
+    assert matcher.matches('file:///src/build')
+    assert matcher.matches('file:///src/build', kind='folder')
+    assert not matcher.matches('file:///src/build', kind='file')
+    assert matcher.filter([
+        FileRename(oldUri='file:///a.txt', newUri='file:///a.py'),
+        FileRename(oldUri='file:///a.txt', newUri='file:///b.txt')
+    ]) == [FileRename(oldUri='file:///a.txt', newUri='file:///a.py')]
+    # the first filter matching the path is for another scheme
+    matcher = FileOperationMatcher([
+        FileOperationFilter(scheme='untitled', pattern=FileOperationPattern(glob='**/*.py')),
+        FileOperationFilter(scheme='file', pattern=FileOperationPattern(glob='**/src/*')),
+    ])
+    assert matcher.matches('file:///src/a.py')
+    assert not matcher.matches('file:///lib/a.py')
+
+
+def test_document_selector_matcher() -> None:
+    matcher = DocumentSelectorMatcher([{'language': 'python', 'pattern': '**/test_*.py'}, {'scheme': 'untitled'}])
+    assert matcher.matches('file:///tests/test_a.py', 'python')
+    assert not matcher.matches('file:///tests/test_a.py', 'cython')
+    assert not matcher.matches('file:///tests/a.py', 'python')
+    assert matcher.matches('untitled:Untitled-1', 'plaintext')
+    # a document whose language isn't known
+    assert matcher.matches('file:///tests/test_a.py')
+    matcher = DocumentSelectorMatcher([{'pattern': '**/*.py', 'scheme': 'untitled'}, {'pattern': '/src/**'}])
+    assert matcher.matches('file:///src/a.py')
+    assert not matcher.matches('file:///lib/a.py')
+
+
+class FileOperationLanguageServer(LanguageServer):
+    renamed: list[list[FileRename]] = []
+
+    async def initialize(self, params: InitializeParams) -> InitializeResult:
+        filters = [FileOperationFilter(pattern=FileOperationPattern(glob='**/*.py'))]
+        selector: DocumentSelector = [DocumentFilter(language='python'), DocumentFilter(pattern='**/*.pyi')]
+        return InitializeResult(
+            capabilities={
+                'workspace': {
+                    'fileOperations': {
+                        'willRename': FileOperationRegistrationOptions(filters=filters)
+                    }
+                },
+                'foldingRangeProvider': FoldingRangeRegistrationOptions(documentSelector=selector)
+            })
+
+    async def workspace__will_rename_files(self, params: RenameFilesParams) -> WorkspaceEdit | None:
+        self.renamed.append(params['files'])
+        return WorkspaceEdit(changes={})
+
+    async def text_document__folding_range(self, params: FoldingRangeParams) -> list[FoldingRange] | None:
+        return [FoldingRange(startLine=0, endLine=1)]
+
+
+@pytest.fixture
+async def lsp_class() -> Type[FileOperationLanguageServer]:
+    return FileOperationLanguageServer
+
+
+async def test_file_operations_are_filtered(lsp_client: LspProtocol[Any], make_request: RequstFn[Any]) -> None:
+    py = FileRename(oldUri='file:///a.py', newUri='file:///b.py')
+    txt = FileRename(oldUri='file:///a.txt', newUri='file:///b.txt')
+    lsp_client.write_message(make_request('workspace/willRenameFiles', RenameFilesParams(files=[py, txt])))
+    assert (await lsp_client.read_message()).content['result'] == {'changes': {}}
+    # nothing the server registered for: answered without calling the handler
+    lsp_client.write_message(make_request('workspace/willRenameFiles', RenameFilesParams(files=[txt])))
+    assert (await lsp_client.read_message()).content['result'] is None
+    assert FileOperationLanguageServer.renamed == [[py]]
+
+
+async def test_bad_file_operation_params(lsp_client: LspProtocol[Any], make_request: RequstFn[Any]) -> None:
+    lsp_client.write_message(make_request('workspace/willRenameFiles', {}))
+    assert (await lsp_client.read_message()).content['error']['code'] == -32602
+
+
+async def test_document_selector(lsp_client: LspProtocol[Any], make_request: RequstFn[Any]) -> None:
+    for uri, language in [('file:///a.txt', 'python'), ('file:///b.txt', 'plaintext')]:
+        item = TextDocumentItem(uri=DocumentUri(uri), languageId=language, version=1, text='')
+        lsp_client.write_message(make_request('textDocument/didOpen', DidOpenTextDocumentParams(textDocument=item)))
+    # answered without calling the handler for documents outside of the registered selector
+    for uri, expected in [('file:///a.txt', True), ('file:///b.txt', False), ('file:///b.pyi', True)]:
+        params = FoldingRangeParams(textDocument=TextDocumentIdentifier(uri=DocumentUri(uri)))
+        lsp_client.write_message(make_request('textDocument/foldingRange', params))
+        assert ((await lsp_client.read_message()).content['result'] is not None) is expected
@@ -0,0 +1,41 @@
+import subprocess
+import sys
+import typing
+
+import pytest
+
+import lsp.lsp
+
+
+def test_import_is_lazy() -> None:
+    # run in a fresh interpreter, since the tests themselves import everything
+    loaded = subprocess.run([sys.executable, '-c', 'import sys, lsp; print(" ".join(sys.modules))'],
+                            capture_output=True,
+                            text=True,
+                            check=True).stdout.split()
+    assert 'lsp' in loaded
+    for module in ['lsp.lsp.server', 'lsp.lsp.client', 'lsp.lsp.messages', 'email.message', 'multiprocessing']:
+        assert module not in loaded
+
+
+def test_submodules() -> None:
+    assert lsp.lsp.server.Hover.__name__ == 'Hover'
+    with pytest.raises(AttributeError):
+        lsp.lsp.nothing
+
+
+def test_reexports() -> None:
+    # as imported before the protocol types were imported lazily, which doesn't re-export them for mypy
+    from lsp import Hover, InitializeParams, LocationResponse  # type: ignore[attr-defined]
+    from lsp.lsp.common import Location
+    assert Hover is lsp.lsp.server.Hover
+    assert InitializeParams is lsp.lsp.messages.InitializeParams
+    assert Location in typing.get_args(LocationResponse)
+    with pytest.raises(ImportError):
+        from lsp import Nothing  # noqa: F401
+
+
+def test_required_keys() -> None:
+    from lsp.lsp.messages import InitializeParams
+    assert InitializeParams.__required_keys__ == {'processId', 'capabilities', 'rootUri'}
+    assert typing.get_type_hints(InitializeParams)['capabilities'] is lsp.lsp.client.ClientCapabilities
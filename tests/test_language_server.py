@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import asyncio
+import os
+from pathlib import Path
 from typing import TYPE_CHECKING, Any, Type
 
 import pytest
@@ -62,3 +65,24 @@ async def test_request(lsp_client: LspProtocol[Any], make_request: RequstFn[Mess
     res = message.content.get('result')
     assert res is not None
     assert res['data'] == [12, 3]
+
+
+async def test_unix_socket(tmp_path: Path, make_request: RequstFn[Any]) -> None:
+    path = str(tmp_path / 'lsp.sock')
+    async with ExampleLanguageServer().serve(std=False, port=None, path=path) as server:
+        clients = []
+        for _ in range(2):
+            protocol: LspProtocol[Any] = LspProtocol()
+            transport, _ = await asyncio.get_running_loop().create_unix_connection(lambda: protocol, path)
+            clients.append((transport, protocol))
+            protocol.write_message(
+                make_request('initialize', InitializeParams(rootUri=None, processId=os.getpid(), capabilities={})))
+            assert 'result' in (await protocol.read_message()).content
+        # each connection is a session of its own
+        assert len(server.sessions) == 2
+        for i, (_, protocol) in enumerate(clients):
+            protocol.write_message(make_request('add', {'a': i, 'b': 10}))
+            assert (await protocol.read_message()).content['result'] == i + 10
+        for transport, _ in clients:
+            transport.close()
+    assert not os.path.exists(path)
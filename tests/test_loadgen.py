@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+import math
+import sys
+
+from lsp.loadgen import HOVER, LoadProfile, MethodStats, run_load
+
+
+def test_percentiles() -> None:
+    stats = MethodStats(latencies=[i * 1_000_000 for i in range(100, 0, -1)])
+    assert stats.percentile(50) == 50
+    assert stats.percentile(99) == 99
+    assert stats.percentile(100) == 100
+    assert math.isnan(MethodStats().percentile(50))
+
+
+async def test_run_load() -> None:
+    profile = LoadProfile(concurrency=3,
+                          processes=2,
+                          duration=0.5,
+                          burst=4,
+                          keystroke_interval=0,
+                          think_time=0.01,
+                          timeout=2)
+    report = await run_load([sys.executable, '-m', 'tests.shard_worker'], profile)
+    # the worker only advertises hover
+    assert list(report.methods) == [HOVER]
+    hover = report.methods[HOVER]
+    assert hover.count >= 3
+    assert hover.errors == hover.timeouts == 0
+    assert report.notifications >= 3 * (1 + 4 + 1)
+    assert report.throughput() > 0
+    assert HOVER in report.format()
+    assert report.as_dict()['methods'][HOVER]['count'] == hover.count
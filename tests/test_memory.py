@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import logging
+import sys
+import tracemalloc
+from collections.abc import AsyncIterable
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
+
+import pytest
+
+from lsp import LanguageServer
+from lsp.lsp.common import DocumentUri
+from lsp.lsp.messages import InitializeParams, InitializeResult
+from lsp.lsp.server import DidOpenTextDocumentParams, TextDocumentItem
+from lsp.memory import deep_sizeof
+from lsp.protocol import JsonRpcRequest, LspProtocol, Message
+
+if TYPE_CHECKING:
+    from tests.conftest import RequstFn
+
+TEXT = 'a' * 5000
+
+
+@dataclass(slots=True)
+class Entry:
+    key: str
+    value: bytes
+
+
+def test_deep_sizeof() -> None:
+    value = b'x' * 1000
+    # shared objects are only counted once
+    assert deep_sizeof([value, value]) == sys.getsizeof([value, value]) + sys.getsizeof(value)
+    entries = {'a': Entry('a', value)}
+    assert deep_sizeof(entries) > 1000
+    assert deep_sizeof(entries) - deep_sizeof({'a': None}) >= sys.getsizeof(value)
+
+
+@dataclass
+class LeakyLanguageServer(LanguageServer):
+    leaked: list[bytes] = field(default_factory=list)
+
+    def __post_init__(self) -> None:
+        self.memory.register('leaked', self.leaked)
+
+    async def initialize(self, params: InitializeParams) -> InitializeResult:
+        return InitializeResult(capabilities={})
+
+    async def leak(self, params: int) -> int:
+        self.leaked.extend(bytes(1000) + bytes([i % 256]) for i in range(params))
+        return len(self.leaked)
+
+
+@pytest.fixture
+async def lsp_server() -> AsyncIterable[LanguageServer]:
+    async with LeakyLanguageServer(memory_log_interval=0.01).serve(std=False) as server:
+        yield server
+
+
+async def test_memory_report(lsp_server: LanguageServer, lsp_client: LspProtocol[Any], make_request: RequstFn[Any],
+                             caplog: pytest.LogCaptureFixture) -> None:
+
+    async def request(method: str, params: Any) -> Any:
+        lsp_client.write_message(make_request(method, params))
+        return (await lsp_client.read_message()).content['result']
+
+    lsp_client.write_message(
+        Message(
+            content=JsonRpcRequest(jsonrpc='2.0',
+                                   method='textDocument/didOpen',
+                                   params=DidOpenTextDocumentParams(textDocument=TextDocumentItem(
+                                       uri=DocumentUri('file:///a.txt'), languageId='text', version=1, text=TEXT)))))
+    report = await request('$/memory', None)
+    assert 'tracemalloc' not in report
+    [session] = report['sessions']
+    assert session['documents'] == 1 and session['documentBytes'] >= 5000
+    assert session['readBuffer'] >= session['buffered']
+    assert report['caches']['leaked'] < 1000
+
+    try:
+        first = (await request('$/memory', {'trace': True}))['tracemalloc']
+        assert 'growth' not in first
+        await request('leak', 500)
+        report = await request('$/memory', {'top': 5})
+        assert report['caches']['leaked'] > 500_000
+        growth = report['tracemalloc']['growth']
+        assert len(growth) <= 5
+        assert growth[0]['site'].startswith(__file__)
+        assert growth[0]['sizeDiff'] > 500_000
+        with caplog.at_level(logging.INFO, logger='lsp'):
+            while not any(record.message.startswith('memory: ') for record in caplog.records):
+                await request('$/memory', {'top': 1})
+        summary = next(record.message for record in caplog.records if record.message.startswith('memory: '))
+        assert 'documents=1/' in summary and 'leaked=' in summary and 'traced=' in summary
+        assert 'tracemalloc' not in await request('$/memory', {'trace': False})
+    finally:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import asyncio
+import random
+from collections.abc import AsyncIterable
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+import pytest
+
+from lsp import LanguageServer
+from lsp.lsp.messages import InitializeParams, InitializeResult
+from lsp.metrics import Histogram, Metrics
+from lsp.protocol import JsonRpcException, LspProtocol
+
+if TYPE_CHECKING:
+    from tests.conftest import RequstFn
+
+
+def test_histogram_quantiles() -> None:
+    histogram = Histogram()
+    values = list(range(1, 100_001))
+    random.shuffle(values)
+    for value in values:
+        histogram.record(value * 1000)
+    assert histogram.count == 100_000
+    assert histogram.max == 100_000_000
+    for q in [0.5, 0.9, 0.99]:
+        exact = q * 100_000_000
+        assert exact <= histogram.quantile(q) <= exact * 1.07
+    assert histogram.quantile(1) == histogram.max
+    # a few hundred buckets cover the whole range
+    assert len(histogram.counts) < 300
+    assert Histogram().quantile(0.5) == 0
+
+
+def test_prometheus() -> None:
+    metrics = Metrics()
+    hover = metrics.method('textDocument/hover')
+    hover.count = 2
+    hover.handler.record(1_000_000)
+    text = metrics.prometheus()
+    assert '# TYPE lsp_requests_total counter' in text
+    assert 'lsp_requests_total{method="textDocument/hover"} 2' in text
+    assert 'lsp_handler_seconds_count{method="textDocument/hover"} 1' in text
+    assert 'lsp_handler_seconds{method="textDocument/hover",quantile="0.5"} 0.001' in text
+
+
+class MetricsLanguageServer(LanguageServer):
+
+    async def initialize(self, params: InitializeParams) -> InitializeResult:
+        return InitializeResult(capabilities={})
+
+    async def echo(self, params: str) -> str:
+        return params
+
+    async def fail(self, params: None) -> None:
+        raise JsonRpcException(1, 'failed')
+
+
+@pytest.fixture
+async def lsp_server(tmp_path: Path) -> AsyncIterable[LanguageServer]:
+    server = MetricsLanguageServer(metrics_file=str(tmp_path / 'lsp.prom'), metrics_interval=0.05)
+    async with server.serve(std=False):
+        yield server
+
+
+async def test_metrics_request(lsp_server: LanguageServer, lsp_client: LspProtocol[Any],
+                               make_request: RequstFn[Any]) -> None:
+    for _ in range(3):
+        lsp_client.write_message(make_request('echo', 'hello'))
+        await lsp_client.read_message()
+    lsp_client.write_message(make_request('fail', None))
+    await lsp_client.read_message()
+    lsp_client.write_message(make_request('$/metrics', None))
+    methods = (await lsp_client.read_message()).content['result']['methods']
+    assert methods['echo']['count'] == 3
+    assert methods['echo']['errors'] == 0
+    assert methods['echo']['bytesIn'] > 0 and methods['echo']['bytesOut'] > 0
+    assert methods['echo']['handler']['p50'] >= 0
+    assert methods['fail']['errors'] == 1
+    assert methods['initialize']['count'] == 1
+
+    assert lsp_server.metrics_file is not None
+    path = Path(lsp_server.metrics_file)
+    for _ in range(50):
+        if path.exists():
+            break
+        await asyncio.sleep(0.02)
+    assert 'lsp_requests_total{method="echo"} 3' in path.read_text()
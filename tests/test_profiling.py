@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import asyncio
+import pstats
+from collections.abc import AsyncIterable
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+import pytest
+
+from lsp import LanguageServer
+from lsp.lsp.messages import InitializeParams, InitializeResult
+from lsp.profiling import SamplingProfiler
+from lsp.protocol import LspProtocol
+
+if TYPE_CHECKING:
+    from tests.conftest import RequstFn
+
+
+def busy_loop(seconds: float) -> int:
+    total = 0
+    start = asyncio.get_event_loop().time()
+    while asyncio.get_event_loop().time() - start < seconds:
+        total += sum(range(100))
+    return total
+
+
+class ProfiledLanguageServer(LanguageServer):
+
+    async def initialize(self, params: InitializeParams) -> InitializeResult:
+        return InitializeResult(capabilities={})
+
+    async def spin(self, params: float) -> int:
+        return busy_loop(params)
+
+
+@pytest.fixture
+async def lsp_server(tmp_path: Path) -> AsyncIterable[LanguageServer]:
+    async with ProfiledLanguageServer(profile_dir=str(tmp_path)).serve(std=False) as server:
+        yield server
+
+
+async def request(client: LspProtocol[Any], make_request: RequstFn[Any], method: str, params: Any) -> Any:
+    client.write_message(make_request(method, params))
+    return (await client.read_message()).content
+
+
+def test_sampling_profiler(tmp_path: Path) -> None:
+    profiler = SamplingProfiler()
+    profiler.sample()
+    profiler.sample()
+    profiler.stop(tmp_path / 'profile.folded')
+    assert profiler.samples == 2
+    # other tests may have left idle threads behind
+    lines = [line for line in (tmp_path / 'profile.folded').read_text().splitlines() if line.startswith('MainThread;')]
+    stack, count = lines[0].rsplit(' ', 1)
+    assert 'test_sampling_profiler' in stack
+    assert int(count) == 2
+
+
+async def test_sampling(lsp_server: LanguageServer, lsp_client: LspProtocol[Any], make_request: RequstFn[Any]) -> None:
+    assert (await request(lsp_client, make_request, '$/profile/start', {'interval': 0.001}))['result'] == {
+        'mode': 'sampling'
+    }
+    error = (await request(lsp_client, make_request, '$/profile/start', None))['error']
+    assert error['code'] == -32803
+    await request(lsp_client, make_request, 'spin', 0.2)
+    path = Path((await request(lsp_client, make_request, '$/profile/stop', None))['result']['path'])
+    assert path.parent == Path(lsp_server.profile_dir or '') and path.suffix == '.folded'
+    assert 'busy_loop' in path.read_text()
+    assert (await request(lsp_client, make_request, '$/profile/stop', None))['error']['code'] == -32803
+
+
+async def test_cprofile(lsp_server: LanguageServer, lsp_client: LspProtocol[Any], make_request: RequstFn[Any]) -> None:
+    assert (await request(lsp_client, make_request, '$/profile/start', {'mode': 'cprofile'}))['result'] == {
+        'mode': 'cprofile'
+    }
+    await request(lsp_client, make_request, 'spin', 0.05)
+    path = (await request(lsp_client, make_request, '$/profile/stop', None))['result']['path']
+    stats = pstats.Stats(path)
+    assert any(name == 'busy_loop' for _, _, name in stats.stats)  # type: ignore[attr-defined]
+
+
+async def test_unknown_mode(lsp_server: LanguageServer, lsp_client: LspProtocol[Any],
+                            make_request: RequstFn[Any]) -> None:
+    assert (await request(lsp_client, make_request, '$/profile/start', {'mode': 'perf'}))['error']['code'] == -32602
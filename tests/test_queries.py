@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+from collections.abc import AsyncIterable
+from typing import TYPE_CHECKING, Any
+
+import pytest
+
+from lsp import LanguageServer
+from lsp.documents import TextDocument
+from lsp.lsp.common import DocumentUri, Position, Range
+from lsp.lsp.messages import InitializeParams, InitializeResult
+from lsp.lsp.server import (DidChangeTextDocumentParams, DidOpenTextDocumentParams, Hover, HoverParams,
+                            TextDocumentContentChangeEventRange, TextDocumentIdentifier, TextDocumentItem,
+                            VersionedTextDocumentIdentifier)
+from lsp.protocol import JsonRpcRequest, LspProtocol, Message
+from lsp.queries import CycleError, Database, Input, document, query
+
+if TYPE_CHECKING:
+    from tests.conftest import RequstFn
+
+URI = DocumentUri('file:///a.txt')
+values: Input[str, int] = Input('values', 0)
+
+
+@query
+def lines(db: Database, uri: DocumentUri) -> list[str]:
+    doc = document(db, uri)
+    return [] if doc is None else doc.text.splitlines()
+
+
+@query
+def line_count(db: Database, uri: DocumentUri) -> int:
+    return len(lines(db, uri))
+
+
+@query
+def summary(db: Database, uri: DocumentUri) -> str:
+    return f"{line_count(db, uri)} lines"
+
+
+@query
+def pick(db: Database, flag: str, a: str, b: str) -> int:
+    return values(db, a) if values(db, flag) else values(db, b)
+
+
+@query
+def loop(db: Database, n: int) -> int:
+    return loop(db, (n + 1) % 3)
+
+
+def test_memoized() -> None:
+    db = Database()
+    values.set(db, 'a', 1)
+    assert pick(db, 'flag', 'a', 'b') == 0
+    assert pick(db, 'flag', 'a', 'b') == 0
+    assert db.executions == {'pick': 1}
+    # unread inputs don't invalidate it
+    values.set(db, 'a', 2)
+    assert pick(db, 'flag', 'a', 'b') == 0
+    assert db.executions == {'pick': 1}
+    values.set(db, 'flag', 1)
+    assert pick(db, 'flag', 'a', 'b') == 2
+    assert db.executions == {'pick': 2}
+    # what it reads depends on the last computation
+    values.set(db, 'b', 5)
+    assert pick(db, 'flag', 'a', 'b') == 2
+    assert db.executions == {'pick': 2}
+    # setting an input to the value it has is no change
+    revision = db.revision
+    values.set(db, 'flag', 1)
+    assert db.revision == revision
+
+
+def test_early_cutoff() -> None:
+    db = Database()
+    document.set(db, URI, None)
+    assert summary(db, URI) == "0 lines"
+    document.set(db, URI, TextDocument(uri=URI, language_id='text', version=1, text='a\nb\n'))
+    assert summary(db, URI) == "2 lines"
+    assert db.executions == {'lines': 2, 'line_count': 2, 'summary': 2}
+    # same number of lines: everything up to line_count is computed again, but summary isn't
+    document.set(db, URI, TextDocument(uri=URI, language_id='text', version=2, text='c\nd\n'))
+    assert summary(db, URI) == "2 lines"
+    assert db.executions == {'lines': 3, 'line_count': 3, 'summary': 2}
+
+
+def test_set_while_computing() -> None:
+    db = Database()
+
+    @query
+    def racy(db: Database) -> int:
+        value = values(db, 'a')
+        # as if another thread set it meanwhile
+        values.set(db, 'a', value + 1)
+        return value
+
+    assert racy(db) == 0
+    assert racy(db) == 1
+
+
+def test_cycle() -> None:
+    with pytest.raises(CycleError):
+        loop(Database(), 0)
+
+
+class QueryLanguageServer(LanguageServer):
+
+    async def initialize(self, params: InitializeParams) -> InitializeResult:
+        return InitializeResult(capabilities={})
+
+    async def text_document__hover(self, params: HoverParams) -> Hover:
+        return Hover(contents=summary(self.queries, params['textDocument']['uri']))
+
+
+@pytest.fixture
+async def lsp_server() -> AsyncIterable[LanguageServer]:
+    async with QueryLanguageServer().serve(std=False) as server:
+        yield server
+
+
+async def test_document_versions(lsp_server: LanguageServer, lsp_client: LspProtocol[Any],
+                                 make_request: RequstFn[Any]) -> None:
+
+    async def hover() -> Any:
+        lsp_client.write_message(
+            make_request(
+                'textDocument/hover',
+                HoverParams(textDocument=TextDocumentIdentifier(uri=URI), position=Position(line=0, character=0))))
+        return (await lsp_client.read_message()).content['result']['contents']
+
+    def change(version: int, text: str) -> None:
+        start, end = Position(line=0, character=0), Position(line=0, character=1)
+        params = DidChangeTextDocumentParams(
+            textDocument=VersionedTextDocumentIdentifier(uri=URI, version=version),
+            contentChanges=[TextDocumentContentChangeEventRange(range=Range(start=start, end=end), text=text)])
+        lsp_client.write_message(
+            Message(content=JsonRpcRequest(jsonrpc='2.0', method='textDocument/didChange', params=params)))
+
+    lsp_client.write_message(
+        Message(content=JsonRpcRequest(jsonrpc='2.0',
+                                       method='textDocument/didOpen',
+                                       params=DidOpenTextDocumentParams(textDocument=TextDocumentItem(
+                                           uri=URI, languageId='text', version=1, text='a\nb\nc\n')))))
+    assert await hover() == "3 lines"
+    assert await hover() == "3 lines"
+    [session] = lsp_server.sessions
+    assert session.queries.executions == {'lines': 1, 'line_count': 1, 'summary': 1}
+    change(2, 'x')
+    assert await hover() == "3 lines"
+    assert session.queries.executions == {'lines': 2, 'line_count': 2, 'summary': 1}
+    change(3, 'x\ny')
+    assert await hover() == "4 lines"
+    assert session.queries.executions == {'lines': 3, 'line_count': 3, 'summary': 2}
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from lsp.lsp.common import DocumentUri, Position
+from lsp.lsp.messages import InitializeParams
+from lsp.lsp.server import (DidOpenTextDocumentParams, HoverParams, TextDocumentIdentifier, TextDocumentItem)
+from lsp.protocol import JsonRpcRequest, LspProtocol, Message
+from lsp.recorder import FROM_CLIENT, FROM_SERVER, Framer, TraceWriter, read_trace, record, replay, trace_stats
+
+if TYPE_CHECKING:
+    from tests.conftest import RequstFn
+
+WORKER = [sys.executable, '-m', 'tests.shard_worker']
+URI = DocumentUri('file:///doc.txt')
+
+
+def test_framer() -> None:
+    data = b''.join(
+        bytes(Message(content=JsonRpcRequest(jsonrpc='2.0', id=i, method='m', params={'i': i}))) for i in range(3))
+    framer = Framer()
+    contents = [content for i in range(0, len(data), 7) for content in framer.feed(data[i:i + 7])]
+    assert contents == [b'{"jsonrpc":"2.0","id":%d,"method":"m","params":{"i":%d}}' % (i, i) for i in range(3)]
+    assert not framer.buffer
+
+
+def test_framer_garbage() -> None:
+    valid = bytes(Message(content=JsonRpcRequest(jsonrpc='2.0', id=1, method='m')))
+    framer = Framer()
+    for garbage in [
+            b'Content-Length: 5\r\n\r\nnot j',  # not json
+            b'Content-Length: x\r\n\r\n',  # no length
+            b'Content-Length: -5\r\n\r\n',
+            b'Content-Type: \xff\r\n\r\n',  # no length, and not utf-8
+            b'Content-Length: 5\r\nShared-Memory: psm_1\r\n\r\n{"a":',
+    ]:
+        assert framer.feed(garbage + valid) == [valid.partition(b'\r\n\r\n')[2]]
+        assert not framer.buffer
+    # headers that never end are given up on
+    framer.feed(b'x' * 100_000)
+    assert len(framer.buffer) < 100
+    assert len(framer.feed(b'\r\n\r\n' + valid)) == 1
+
+
+def test_trace_round_trip(tmp_path: Path) -> None:
+    path = tmp_path / 'trace'
+    writer = TraceWriter(path)
+    writer.write(FROM_CLIENT, b'{"jsonrpc":"2.0","id":1,"method":"m"}', 100)
+    writer.write(FROM_SERVER, b'{"jsonrpc":"2.0","id":1,"result":1}', 250)
+    writer.close()
+    with open(path, 'ab') as f:
+        # a record cut short
+        f.write(b'\x01' * 20)
+    records = list(read_trace(path))
+    assert [(r.timestamp, r.direction) for r in records] == [(100, FROM_CLIENT), (250, FROM_SERVER)]
+    report = trace_stats(records)
+    assert report.methods['m'].latencies == [150]
+    # a new recording starts a new trace
+    TraceWriter(path).close()
+    assert not list(read_trace(path))
+
+
+async def test_record_garbage(tmp_path: Path) -> None:
+    path = tmp_path / 'trace'
+    client_read, recorder_write = os.pipe()
+    recorder_read, client_write = os.pipe()
+    # the "server" sends everything back, so the garbage goes both ways
+    echo = [sys.executable, '-c', 'import os\nwhile data := os.read(0, 1 << 16):\n    os.write(1, data)']
+    recording = asyncio.create_task(
+        record(echo, path, stdin=os.fdopen(recorder_read, 'rb'), stdout=os.fdopen(recorder_write, 'wb')))
+    valid = bytes(Message(content=JsonRpcRequest(jsonrpc='2.0', id=1, method='m')))
+    sent = b'Content-Length: 5\r\n\r\nnot j' + b'Content-Type: text\r\n\r\n' + valid
+    os.write(client_write, sent)
+    os.close(client_write)
+    assert await asyncio.wait_for(recording, 10) == 0
+    with os.fdopen(client_read, 'rb') as f:
+        # forwarded unchanged
+        assert f.read() == sent
+    content = valid.partition(b'\r\n\r\n')[2]
+    assert [(r.direction, r.content) for r in read_trace(path)] == [(FROM_CLIENT, content), (FROM_SERVER, content)]
+
+
+async def test_record_and_replay(tmp_path: Path, event_loop: asyncio.AbstractEventLoop,
+                                 make_request: RequstFn[Any]) -> None:
+    path = tmp_path / 'trace'
+    client_read, recorder_write = os.pipe()
+    recorder_read, client_write = os.pipe()
+    recording = asyncio.create_task(
+        record(WORKER, path, stdin=os.fdopen(recorder_read, 'rb'), stdout=os.fdopen(recorder_write, 'wb')))
+    client: LspProtocol[Any] = LspProtocol()
+    await event_loop.connect_read_pipe(lambda: client, os.fdopen(client_read, 'rb'))
+    client.transport, _ = await event_loop.connect_write_pipe(asyncio.Protocol, os.fdopen(client_write, 'wb'))
+
+    client.write_message(make_request('initialize', InitializeParams(processId=None, rootUri=None, capabilities={})))
+    await client.read_message()
+    client.write_message(
+        Message(content=JsonRpcRequest(jsonrpc='2.0',
+                                       method='textDocument/didOpen',
+                                       params=DidOpenTextDocumentParams(textDocument=TextDocumentItem(
+                                           uri=URI, languageId='text', version=1, text='recorded')))))
+    client.write_message(
+        make_request('textDocument/hover',
+                     HoverParams(textDocument=TextDocumentIdentifier(uri=URI), position=Position(line=0, character=0))))
+    assert (await client.read_message()).content['result']['contents'].endswith('recorded')
+    # shutdown returns nothing, so goes unanswered
+    client.write_message(make_request('shutdown', None))
+    client.write_message(Message(content=JsonRpcRequest(jsonrpc='2.0', method='exit')))
+    assert await asyncio.wait_for(recording, 10) == 0
+    client.transport.close()
+
+    records = list(read_trace(path))
+    assert [r.direction for r in records
+            ] == [FROM_CLIENT, FROM_SERVER, FROM_CLIENT, FROM_CLIENT, FROM_SERVER, FROM_CLIENT, FROM_CLIENT]
+    recorded = trace_stats(records)
+    assert recorded.notifications == 2
+    assert recorded.methods['shutdown'].timeouts == 1
+
+    replayed = await replay(WORKER, records, speed=None, timeout=0.5)
+    assert replayed.methods.keys() == recorded.methods.keys() == {'initialize', 'textDocument/hover', 'shutdown'}
+    for method in ['initialize', 'textDocument/hover']:
+        assert len(replayed.methods[method].latencies) == 1
+        assert not replayed.methods[method].errors
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import asyncio
+import inspect
+import time
+from collections.abc import AsyncIterable, Iterator
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+import pytest
+
+from lsp import LanguageServer
+from lsp.lsp.common import DocumentUri, Position
+from lsp.lsp.messages import InitializedParams, InitializeParams, InitializeResult
+from lsp.lsp.server import Hover, HoverParams, TextDocumentIdentifier
+from lsp.protocol import JsonRpcRequest, LspProtocol, Message
+from lsp.scheduler import Scheduler, checkpoint
+
+if TYPE_CHECKING:
+    from tests.conftest import RequstFn
+
+
+def steps(log: list[str], name: str, n: int) -> Iterator[None]:
+    for i in range(n):
+        log.append(f"{name}{i}")
+        yield
+
+
+async def test_priorities() -> None:
+    scheduler = Scheduler(slice=0)
+    log: list[str] = []
+    jobs = [
+        scheduler.schedule(steps(log, 'a', 2)),
+        scheduler.schedule(steps(log, 'b', 2), priority=1),
+        scheduler.schedule(steps(log, 'c', 2)),
+    ]
+    await asyncio.gather(*jobs)
+    # higher priority first, taking turns otherwise
+    assert log == ['b0', 'b1', 'a0', 'c0', 'a1', 'c1']
+    assert scheduler.turns == 9
+
+
+async def test_slice() -> None:
+    scheduler = Scheduler(slice=60)
+    log: list[str] = []
+
+    async def job(name: str) -> str:
+        for _ in steps(log, name, 3):
+            await checkpoint()
+        return name
+
+    assert list(await asyncio.gather(scheduler.schedule(job('a')), scheduler.schedule(job('b')))) == ['a', 'b']
+    assert log == ['a0', 'a1', 'a2', 'b0', 'b1', 'b2']
+    assert scheduler.turns == 2
+
+
+async def test_busy() -> None:
+    busy = True
+    scheduler = Scheduler(lambda: busy, slice=0, idle_delay=0.001)
+    log: list[str] = []
+    job = scheduler.schedule(steps(log, 'a', 2))
+    await asyncio.sleep(0.01)
+    assert not log and scheduler.pauses == 1
+    busy = False
+    await job
+    assert log == ['a0', 'a1']
+
+
+async def test_cancel() -> None:
+    scheduler = Scheduler(slice=0)
+    log: list[str] = []
+    first = scheduler.schedule(steps(log, 'a', 1000))
+    second = scheduler.schedule(steps(log, 'b', 2))
+    waiting = scheduler.schedule(steps(log, 'c', 2))
+    waiting.cancel()
+    await asyncio.sleep(0.01)
+    first.cancel()
+    await second
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    assert 'c0' not in log
+    assert not scheduler.jobs
+
+
+async def test_cancel_before_start() -> None:
+    scheduler = Scheduler()
+    job = asyncio.sleep(1)
+    task = scheduler.schedule(job)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    # closed, rather than never awaited
+    assert inspect.getcoroutinestate(job) == inspect.CORO_CLOSED
+
+
+async def test_checkpoint_in_child_task() -> None:
+    scheduler = Scheduler(slice=0)
+    log: list[str] = []
+
+    async def child() -> None:
+        # not a job itself, so this doesn't give up the parent's turn
+        await checkpoint()
+        log.append('child')
+
+    async def parent() -> None:
+        await asyncio.create_task(child())
+        log.append('parent')
+
+    await asyncio.gather(scheduler.schedule(parent()), scheduler.schedule(steps(log, 'b', 1)))
+    assert log == ['child', 'parent', 'b0']
+    assert scheduler.turns == 3
+
+
+@dataclass
+class BackgroundLanguageServer(LanguageServer):
+    indexed: int = 0
+
+    async def initialize(self, params: InitializeParams) -> InitializeResult:
+        return InitializeResult(capabilities={})
+
+    async def initialized(self, params: InitializedParams) -> None:
+        self.schedule(self.index(), priority=-1, name='index')
+
+    async def index(self) -> None:
+        while self.indexed < 100:
+            time.sleep(0.002)
+            self.indexed += 1
+            await checkpoint()
+
+    async def text_document__hover(self, params: HoverParams) -> Hover:
+        return Hover(contents=str(self.indexed))
+
+    async def reindex(self, params: None) -> int:
+        self.indexed = 0
+        await self.schedule(self.index())
+        return self.indexed
+
+
+@pytest.fixture
+async def lsp_server() -> AsyncIterable[BackgroundLanguageServer]:
+    async with BackgroundLanguageServer().serve(std=False) as server:
+        yield server
+
+
+async def test_yields_to_requests(lsp_server: BackgroundLanguageServer, lsp_client: LspProtocol[Any],
+                                  make_request: RequstFn[Any]) -> None:
+    lsp_client.write_message(Message(content=JsonRpcRequest(jsonrpc='2.0', method='initialized', params={})))
+    await asyncio.sleep(0.02)
+    [job] = lsp_server.scheduler.jobs
+    latencies = []
+    for _ in range(10):
+        start = time.perf_counter()
+        lsp_client.write_message(
+            make_request(
+                'textDocument/hover',
+                HoverParams(textDocument=TextDocumentIdentifier(uri=DocumentUri('file:///a.txt')),
+                            position=Position(line=0, character=0))))
+        await lsp_client.read_message()
+        latencies.append(time.perf_counter() - start)
+    # held up by one step and one slice at most, not the whole job
+    assert max(latencies) < 0.1
+    assert 0 < lsp_server.indexed < 100
+    assert lsp_server.scheduler.pauses > 0
+    await job
+    assert lsp_server.indexed == 100
+
+
+async def test_handler_awaits_job(lsp_server: BackgroundLanguageServer, lsp_client: LspProtocol[Any],
+                                  make_request: RequstFn[Any]) -> None:
+    lsp_server.scheduler.slice = 0
+    lsp_client.write_message(make_request('reindex', None))
+    # queued behind it, while it waits on the job
+    lsp_client.write_message(
+        make_request(
+            'textDocument/hover',
+            HoverParams(textDocument=TextDocumentIdentifier(uri=DocumentUri('file:///a.txt')),
+                        position=Position(line=0, character=0))))
+    reindexed = await asyncio.wait_for(lsp_client.read_message(), 5)
+    assert reindexed.content['result'] == 100
+    hover = await asyncio.wait_for(lsp_client.read_message(), 5)
+    assert hover.content['result']['contents'] == '100'
+
+
+async def test_cancelled_with_session(lsp_server: BackgroundLanguageServer, lsp_client: LspProtocol[Any]) -> None:
+    lsp_client.write_message(Message(content=JsonRpcRequest(jsonrpc='2.0', method='initialized', params={})))
+    await asyncio.sleep(0.02)
+    [job] = lsp_server.scheduler.jobs
+    lsp_client.transport.close()
+    with pytest.raises(asyncio.CancelledError):
+        await job
+    assert lsp_server.indexed < 100
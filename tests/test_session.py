@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import asyncio
+import os
+from collections.abc import AsyncIterator
+from typing import TYPE_CHECKING, Any, Type
+
+import pytest
+
+import lsp
+from lsp import LanguageServer
+from lsp.lsp.common import DocumentUri, MessageData, Position
+from lsp.lsp.messages import InitializeParams, InitializeResult
+from lsp.lsp.server import (DidOpenTextDocumentParams, Hover, HoverParams, TextDocumentIdentifier, TextDocumentItem)
+from lsp.protocol import JsonRpcRequest, LspProtocol, Message
+
+if TYPE_CHECKING:
+    from tests.conftest import RequstFn
+
+URI = DocumentUri('file:///doc.txt')
+
+
+class SessionLanguageServer(LanguageServer):
+    hovers: int = 0
+
+    async def initialize(self, params: InitializeParams) -> InitializeResult:
+        return InitializeResult(capabilities={})
+
+    async def text_document__hover(self, params: HoverParams) -> Hover | None:
+        # server wide state is shared, documents are per session
+        self.hovers += 1
+        client = self.session.initialize_params
+        assert client is not None
+        return Hover(contents=f"{client['processId']} {self.documents[URI].text} {self.hovers}")
+
+
+@pytest.fixture
+async def lsp_class() -> Type[SessionLanguageServer]:
+    return SessionLanguageServer
+
+
+@pytest.fixture
+async def second_client(event_loop: asyncio.AbstractEventLoop, lsp_server_port: int,
+                        make_request: RequstFn[Any]) -> AsyncIterator[LspProtocol[Any]]:
+    protocol: LspProtocol[Any] = LspProtocol()
+    transport, _ = await event_loop.create_connection(lambda: protocol, port=lsp_server_port)
+    protocol.write_message(make_request('initialize', InitializeParams(rootUri=None, processId=1, capabilities={})))
+    await protocol.read_message()
+    yield protocol
+    transport.close()
+
+
+def open_document(client: LspProtocol[Any], make_request: RequstFn[MessageData], text: str) -> None:
+    client.write_message(
+        make_request('textDocument/didOpen',
+                     DidOpenTextDocumentParams(
+                         textDocument=TextDocumentItem(uri=URI, languageId='text', version=1, text=text))))
+
+
+async def test_sessions_are_isolated(lsp_server: LanguageServer, lsp_client: LspProtocol[Any],
+                                     second_client: LspProtocol[Any], make_request: RequstFn[MessageData]) -> None:
+    assert len(lsp_server.sessions) == 2
+    open_document(lsp_client, make_request, 'first')
+    open_document(second_client, make_request, 'second')
+    hover = HoverParams(textDocument=TextDocumentIdentifier(uri=URI), position=Position(line=0, character=0))
+    lsp_client.write_message(make_request('textDocument/hover', hover))
+    assert (await lsp_client.read_message()).content['result']['contents'] == f'{os.getpid()} first 1'
+    second_client.write_message(make_request('textDocument/hover', hover))
+    assert (await second_client.read_message()).content['result']['contents'] == '1 second 2'
+
+
+async def test_session_ends_with_connection(lsp_server: LanguageServer, second_client: LspProtocol[Any]) -> None:
+    assert len(lsp_server.sessions) == 1
+    second_client.transport.close()
+    for _ in range(100):
+        if not lsp_server.sessions:
+            break
+        await asyncio.sleep(0.01)
+    assert not lsp_server.sessions
+
+
+async def test_bad_notification_is_dropped(lsp_client: LspProtocol[Any], make_request: RequstFn[MessageData]) -> None:
+    open_document(lsp_client, make_request, 'text')
+    bad: list[tuple[str, dict[str, Any]]] = [('textDocument/didChange', {'contentChanges': []}),
+                                             ('$/cancelRequest', {})]
+    for method, params in bad:
+        lsp_client.write_message(Message(content=JsonRpcRequest(jsonrpc='2.0', method=method, params=params)))
+    hover = HoverParams(textDocument=TextDocumentIdentifier(uri=URI), position=Position(line=0, character=0))
+    lsp_client.write_message(make_request('textDocument/hover', hover))
+    assert (await lsp_client.read_message()).content['result']['contents'] == f'{os.getpid()} text 1'
+
+
+async def test_session_outside_handler(lsp_server: LanguageServer, lsp_client: LspProtocol[Any],
+                                       make_request: RequstFn[MessageData]) -> None:
+    open_document(lsp_client, make_request, 'text')
+    lsp_client.write_message(
+        make_request('textDocument/hover',
+                     HoverParams(textDocument=TextDocumentIdentifier(uri=URI), position=Position(line=0, character=0))))
+    await lsp_client.read_message()
+    # the only client
+    assert lsp_server.documents[URI].text == 'text'
+    assert lsp_server.protocol is lsp_server.session.protocol
+
+
+async def test_no_session_outside_handler(lsp_server: LanguageServer, lsp_client: LspProtocol[Any],
+                                          second_client: LspProtocol[Any]) -> None:
+    with pytest.raises(RuntimeError):
+        lsp_server.documents
+
+
+@pytest.mark.parametrize('clients,exit_code', [(1, None), (0, 1)])
+async def test_exit(lsp_server: LanguageServer, lsp_client: LspProtocol[Any], event_loop: asyncio.AbstractEventLoop,
+                    lsp_server_port: int, monkeypatch: pytest.MonkeyPatch, clients: int, exit_code: int | None) -> None:
+    exits: list[int] = []
+    monkeypatch.setattr(lsp, 'exit', exits.append, raising=False)
+    others = [(await event_loop.create_connection(LspProtocol, port=lsp_server_port))[0] for _ in range(clients)]
+    await asyncio.sleep(0.05)
+    lsp_client.write_message(Message(content=JsonRpcRequest(jsonrpc='2.0', method='exit')))
+    await asyncio.wait_for(lsp_client.closed.wait(), 1)
+    assert exits == ([] if exit_code is None else [exit_code])
+    assert len(lsp_server.sessions) == clients
+    for transport in others:
+        transport.close()
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import os
+import sys
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Type
+
+import pytest
+
+from lsp import LanguageServer
+from lsp.client import Client
+from lsp.protocol import InvalidMessageError, JsonRpcRequest, LspProtocol, Message
+from lsp.shared_memory import MARKER, materialize, new_prefix, offload
+from tests.client_server import ClientTestServer
+
+TEXT = 'ünïcode text\n' * 10_000
+
+
+def segments() -> set[str]:
+    return set(os.listdir('/dev/shm'))
+
+
+@pytest.fixture
+def lsp_class() -> Type[LanguageServer]:
+    return ClientTestServer
+
+
+def test_offload() -> None:
+    content: dict[str, Any] = {'textDocument': {'uri': 'file:///a.txt', 'text': TEXT}, 'items': ['small', TEXT]}
+    prefix = new_prefix()
+    before = segments()
+    replaced, name = offload(content, 1024, prefix)
+    assert name is not None and name.startswith(prefix) and segments() - before
+    # the original is left alone
+    assert content['textDocument']['text'] == TEXT
+    assert replaced['textDocument']['uri'] == 'file:///a.txt'
+    assert MARKER in replaced['textDocument']['text'] and MARKER in replaced['items'][1]
+    assert replaced['items'][0] == 'small'
+    assert materialize(replaced, name, prefix) == content
+    assert segments() == before
+
+    assert offload(content, len(TEXT) + 1, prefix) == (content, None)
+
+
+def test_materialize_rejected() -> None:
+    prefix = new_prefix()
+    before = segments()
+    other = SharedMemory(create=True, size=16)
+    try:
+        with pytest.raises(ValueError, match="isn't this connection's"):
+            materialize({}, other.name, prefix)
+    finally:
+        other.close()
+        other.unlink()
+    with pytest.raises(ValueError, match="Can't open"):
+        materialize({}, f'{prefix}{"0" * 12}', prefix)
+
+    replaced, name = offload({'text': TEXT}, 1024, prefix)
+    assert name is not None
+    # nor another connection's
+    with pytest.raises(ValueError, match="isn't this connection's"):
+        materialize(replaced, name, new_prefix())
+    replaced['text'][MARKER][1] += 1
+    with pytest.raises(ValueError, match='Invalid reference'):
+        materialize(replaced, name, prefix)
+    assert segments() == before
+
+
+def test_message() -> None:
+    prefix = new_prefix()
+    content, name = offload({'text': TEXT}, 1024, prefix)
+    msg = Message(content=JsonRpcRequest(jsonrpc='2.0', id=1, method='test', params=content), shared_memory=name)
+    data = bytes(msg)
+    assert len(data) < 200
+    with pytest.raises(InvalidMessageError) as e:
+        Message.parse(data)
+    assert e.value.msg_id == 1
+    parsed: Message[Any]
+    _, parsed = Message.parse(data, segments=prefix)
+    assert parsed.content['params'] == {'text': TEXT}
+    assert parsed.shared_memory == name
+
+
+async def test_not_agreed(lsp_client: LspProtocol[Any]) -> None:
+    prefix = new_prefix()
+    content, name = offload({'text': TEXT}, 1024, prefix)
+    assert name is not None
+    msg = Message(content=JsonRpcRequest(jsonrpc='2.0', id=10, method='echo', params=content), shared_memory=name)
+    lsp_client.transport.write(bytes(msg))
+    response = await lsp_client.read_message()
+    assert response.content['id'] == 10
+    assert response.content['error']['code'] == -32600
+    # left alone
+    assert name in segments()
+    materialize(content, name, prefix)
+
+
+async def test_client() -> None:
+    before = segments()
+    async with Client(shared_memory_threshold=1024).run([sys.executable, '-m', 'tests.client_server'],
+                                                        timeout=10) as client:
+        assert client.protocol.shared_memory_threshold == 1024
+        assert client.protocol.shared_memory_prefix is not None
+        # there and back again
+        assert await client.request('echo', {'text': TEXT}) == {'text': TEXT}
+    assert segments() == before
+    async with Client().run([sys.executable, '-m', 'tests.client_server'], timeout=10) as client:
+        assert client.protocol.shared_memory_threshold is None
+        assert client.protocol.shared_memory_prefix is None
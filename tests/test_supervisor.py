@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+import time
+from collections.abc import AsyncIterator
+from typing import TYPE_CHECKING, Any
+
+import pytest
+
+from lsp.lsp.common import URI, DocumentUri, MessageData, Position, WorkspaceFolder
+from lsp.lsp.messages import InitializeParams
+from lsp.lsp.server import (CompletionParams, DidOpenTextDocumentParams, HoverParams, TextDocumentIdentifier,
+                            TextDocumentItem, WorkspaceSymbolParams)
+from lsp.protocol import JsonRpcRequest, LspProtocol, Message
+from lsp.session import Session
+from lsp.supervisor import Supervisor, message_uris, owns, tag_items, untag_item
+
+if TYPE_CHECKING:
+    from tests.conftest import RequstFn
+
+FOLDERS = [WorkspaceFolder(uri=URI('file:///repo/a'), name='a'), WorkspaceFolder(uri=URI('file:///repo/ab'), name='ab')]
+
+
+@pytest.fixture
+async def supervisor() -> AsyncIterator[Supervisor]:
+    async with Supervisor(command=[sys.executable, '-m', 'tests.shard_worker']).serve(std=False) as server:
+        yield server
+
+
+@pytest.fixture
+async def client(event_loop: asyncio.AbstractEventLoop, supervisor: Supervisor,
+                 make_request: RequstFn[Any]) -> AsyncIterator[LspProtocol[Any]]:
+    assert supervisor._listening_on is not None
+    protocol: LspProtocol[Any] = LspProtocol()
+    transport, _ = await event_loop.create_connection(lambda: protocol, port=supervisor._listening_on)
+    protocol.write_message(
+        make_request('initialize',
+                     InitializeParams(rootUri=None, processId=os.getpid(), capabilities={},
+                                      workspaceFolders=FOLDERS)))
+    result = (await protocol.read_message()).content['result']
+    assert result['capabilities']['hoverProvider']
+    assert result['capabilities']['workspace']['workspaceFolders']['supported']
+    yield protocol
+    transport.close()
+
+
+def test_routing_helpers() -> None:
+    assert owns(URI('file:///repo/a/'), 'file:///repo/a/x.py')
+    assert not owns(URI('file:///repo/a'), 'file:///repo/ab/x.py')
+    assert message_uris({'textDocument': {'uri': 'file:///x'}}) == ['file:///x']
+    assert message_uris({'files': [{'oldUri': 'file:///x', 'newUri': 'file:///y'}]}) == ['file:///x']
+    assert message_uris({'query': ''}) == []
+    items = tag_items({'isIncomplete': False, 'items': [{'label': 'x', 'data': 1}, {'label': 'y'}]}, URI('file:///a'))
+    assert [untag_item(item) for item in items['items']] == [(True, 'file:///a', {
+        'label': 'x',
+        'data': 1
+    }), (True, 'file:///a', {
+        'label': 'y'
+    })]
+    assert untag_item({'label': 'z'}) == (False, None, {'label': 'z'})
+
+
+async def hover(client: LspProtocol[Any], make_request: RequstFn[MessageData], uri: DocumentUri) -> str:
+    client.write_message(
+        make_request('textDocument/hover',
+                     HoverParams(textDocument=TextDocumentIdentifier(uri=uri), position=Position(line=0,
+                                                                                                 character=0))))
+    contents: str = (await client.read_message()).content['result']['contents']
+    return contents
+
+
+async def test_one_worker_per_folder(supervisor: Supervisor, client: LspProtocol[Any],
+                                     make_request: RequstFn[MessageData]) -> None:
+    shards, = supervisor.shards.values()
+    assert list(shards.workers) == ['file:///repo/a']
+    for folder, text in [('a', 'in a'), ('ab', 'in ab')]:
+        params = DidOpenTextDocumentParams(textDocument=TextDocumentItem(
+            uri=DocumentUri(f'file:///repo/{folder}/x.py'), languageId='python', version=1, text=text))
+        client.write_message(
+            Message(content=JsonRpcRequest(jsonrpc='2.0', method='textDocument/didOpen', params=params)))
+    a_root, a_pid, a_text = (await hover(client, make_request, DocumentUri('file:///repo/a/x.py'))).split(' ', 2)
+    ab_root, ab_pid, ab_text = (await hover(client, make_request, DocumentUri('file:///repo/ab/x.py'))).split(' ', 2)
+    assert (a_root, a_text) == ('file:///repo/a', 'in a')
+    assert (ab_root, ab_text) == ('file:///repo/ab', 'in ab')
+    assert a_pid != ab_pid
+    assert set(shards.workers) == {'file:///repo/a', 'file:///repo/ab'}
+    # each document went to its own folder's worker only
+    for folder in ['a', 'ab']:
+        worker = await shards.workers[URI(f'file:///repo/{folder}')]
+        assert await worker.request('open_documents', None) == [f'file:///repo/{folder}/x.py']
+
+
+async def test_workspace_symbol_is_merged(client: LspProtocol[Any], make_request: RequstFn[MessageData]) -> None:
+    client.write_message(make_request('workspace/symbol', WorkspaceSymbolParams(query='')))
+    result = (await client.read_message()).content['result']
+    assert sorted(s['name'] for s in result) == ['file:///repo/a', 'file:///repo/ab']
+
+
+async def test_resolve_in_origin_worker(client: LspProtocol[Any], make_request: RequstFn[Any]) -> None:
+    items: list[tuple[str, Any]] = []
+    for folder in ['ab', 'a']:
+        client.write_message(
+            make_request(
+                'textDocument/completion',
+                CompletionParams(textDocument=TextDocumentIdentifier(uri=DocumentUri(f'file:///repo/{folder}/x.py')),
+                                 position=Position(line=0, character=0))))
+        items.extend((folder, item) for item in (await client.read_message()).content['result']['items'])
+    client.write_message(make_request('workspace/symbol', WorkspaceSymbolParams(query='')))
+    assert all('$worker' in symbol['data'] for symbol in (await client.read_message()).content['result'])
+    for folder, item in items:
+        client.write_message(make_request('completionItem/resolve', item))
+        resolved = (await client.read_message()).content['result']
+        # resolved by the worker that made it, with its own data
+        assert resolved['detail'] == f'file:///repo/{folder} True'
+        assert resolved['data'] == item['data']
+
+
+async def test_client_request_fails(monkeypatch: pytest.MonkeyPatch, client: LspProtocol[Any],
+                                    make_request: RequstFn[Any]) -> None:
+
+    async def fail(self: Session, method: str, params: Any) -> Any:
+        raise RuntimeError("no")
+
+    monkeypatch.setattr(Session, 'request', fail)
+    client.write_message(make_request('ask', 'anyone?'))
+    # the worker's request is answered with an error, rather than left waiting
+    assert (await asyncio.wait_for(client.read_message(), 5)).content['result'] == {'code': -32603}
+
+
+async def test_shutdown(supervisor: Supervisor, client: LspProtocol[Any], make_request: RequstFn[Any]) -> None:
+    shards, = supervisor.shards.values()
+    worker = await shards.workers[URI('file:///repo/a')]
+    start = time.perf_counter()
+    client.write_message(make_request('shutdown', None))
+    await asyncio.wait_for(worker.protocol.exited_event.wait(), 2)
+    # closing the connection afterwards doesn't wait on the workers again
+    client.transport.close()
+    for _ in range(100):
+        if not supervisor.shards:
+            break
+        await asyncio.sleep(0.01)
+    await asyncio.gather(*supervisor._watchers)
+    assert not supervisor.shards
+    assert time.perf_counter() - start < 2
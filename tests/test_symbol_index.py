@@ -0,0 +1,94 @@
+import mmap
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from lsp.lsp.common import DocumentUri, Location, Position, Range
+from lsp.lsp.server import SymbolInformation, WorkspaceSymbol
+from lsp.symbol_index import SymbolIndex, SymbolIndexError, write_symbol_index
+
+URI = DocumentUri('file:///src/thing.py')
+
+
+def make_symbol(name: str, line: int = 0, container: str | None = None) -> WorkspaceSymbol:
+    symbol = WorkspaceSymbol(name=name,
+                             kind=12,
+                             location=Location(uri=URI,
+                                               range=Range(start=Position(line=line, character=4),
+                                                           end=Position(line=line, character=4 + len(name)))))
+    if container is not None:
+        symbol['containerName'] = container
+    return symbol
+
+
+@pytest.fixture
+def index(tmp_path: Path) -> Iterator[SymbolIndex]:
+    symbols = [
+        make_symbol('parse_message', 1, 'Message'),
+        make_symbol('Parser', 2),
+        make_symbol('write_message', 3, 'LspProtocol'),
+        make_symbol('read_message', 4, 'LspProtocol'),
+        make_symbol('παράδειγμα', 5),
+    ]
+    write_symbol_index(tmp_path / 'symbols.idx', symbols)
+    with SymbolIndex.open(tmp_path / 'symbols.idx') as index:
+        yield index
+
+
+def test_roundtrip(index: SymbolIndex) -> None:
+    assert len(index) == 5
+    assert make_symbol('write_message', 3, 'LspProtocol') in list(index)
+
+
+def test_prefix_before_substring(index: SymbolIndex) -> None:
+    assert [s['name'] for s in index.query('pars')] == ['parse_message', 'Parser']
+    assert [s['name'] for s in index.query('MESSAGE')] == ['parse_message', 'read_message', 'write_message']
+    assert [s['name'] for s in index.query('e_mess')] == ['parse_message', 'write_message']
+
+
+def test_empty_query_and_limit(index: SymbolIndex) -> None:
+    assert len(index.query('')) == 5
+    assert len(index.query('', limit=2)) == 2
+    assert len(index.query('message', limit=1)) == 1
+    assert index.query('nope') == []
+
+
+def test_non_ascii(index: SymbolIndex) -> None:
+    assert [s['name'] for s in index.query('ΠΑΡ')] == ['παράδειγμα']
+
+
+def test_symbol_information_and_missing_range(tmp_path: Path) -> None:
+    info = SymbolInformation(name='old',
+                             kind=5,
+                             deprecated=True,
+                             location=Location(uri=URI, range=Range(start=Position(line=0, character=0),
+                                                                    end=Position(line=0, character=3))))
+    bare = WorkspaceSymbol(name='bare', kind=13, location={'uri': URI})
+    write_symbol_index(tmp_path / 'symbols.idx', [info, bare])
+    with SymbolIndex.open(tmp_path / 'symbols.idx') as index:
+        old, = index.query('old')
+        assert old['tags'] == [1]
+        assert 'range' in old['location']
+        assert index.query('bare') == [bare]
+
+
+@pytest.mark.parametrize('content', [b'', b'x' * 64, b'LSPSYM\x00\x01', 'truncated'])
+def test_bad_file(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, content: bytes | str) -> None:
+    if content == 'truncated':
+        write_symbol_index(tmp_path / 'full.idx', [make_symbol('thing')])
+        content = (tmp_path / 'full.idx').read_bytes()[:-4]
+    assert isinstance(content, bytes)
+    (tmp_path / 'bad.idx').write_bytes(content)
+    buffers = []
+    mmap_ = mmap.mmap
+
+    def track(*args: Any, **kwargs: Any) -> mmap.mmap:
+        buffers.append(mmap_(*args, **kwargs))
+        return buffers[-1]
+
+    monkeypatch.setattr(mmap, 'mmap', track)
+    with pytest.raises(SymbolIndexError):
+        SymbolIndex.open(tmp_path / 'bad.idx')
+    assert all(buffer.closed for buffer in buffers)
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import json
+from collections.abc import AsyncIterable
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+import pytest
+
+from lsp import LanguageServer
+from lsp.lsp.messages import InitializeParams, InitializeResult
+from lsp.protocol import LspProtocol
+from lsp.tracing import Tracer, span
+
+if TYPE_CHECKING:
+    from tests.conftest import RequstFn
+
+
+class TracedLanguageServer(LanguageServer):
+
+    async def initialize(self, params: InitializeParams) -> InitializeResult:
+        return InitializeResult(capabilities={})
+
+    async def echo(self, params: str) -> str:
+        with span('inner', length=len(params)):
+            with span('innermost'):
+                pass
+        return params
+
+    def blocking_echo(self, params: str) -> str:
+        with span('in thread'):
+            return params
+
+
+@pytest.fixture
+async def lsp_server(tmp_path: Path) -> AsyncIterable[LanguageServer]:
+    server = TracedLanguageServer(tracer=Tracer(tmp_path / 'trace.jsonl'))
+    async with server.serve(std=False):
+        yield server
+
+
+def test_span_untraced() -> None:
+    with span('nothing') as untraced:
+        assert untraced is None
+
+
+async def test_jsonl(lsp_server: LanguageServer, lsp_client: LspProtocol[Any], make_request: RequstFn[Any],
+                     tmp_path: Path) -> None:
+    lsp_client.write_message(make_request('echo', 'hello'))
+    await lsp_client.read_message()
+    lsp_client.write_message(make_request('blocking_echo', 'hello'))
+    await lsp_client.read_message()
+    lsp_client.write_message(make_request('missing', None))
+    await lsp_client.read_message()
+    assert lsp_server.tracer is not None
+    lsp_server.tracer.flush()
+
+    spans = [json.loads(line) for line in (tmp_path / 'trace.jsonl').read_text().splitlines()]
+    by_id = {s['spanId']: s for s in spans}
+    roots = {s['name']: s for s in spans if s['parentId'] is None}
+    assert roots.keys() == {'initialize', 'echo', 'blocking_echo', 'missing'}
+
+    def children(parent: dict[str, Any]) -> list[str]:
+        return [s['name'] for s in spans if s['parentId'] == parent['spanId']]
+
+    echo = roots['echo']
+    assert echo['attributes'] == {'id': 2}
+    assert children(echo) == ['decode', 'queue', 'handler', 'encode', 'write']
+    inner = next(s for s in spans if s['name'] == 'inner')
+    assert inner['attributes'] == {'length': 5}
+    assert by_id[inner['parentId']]['name'] == 'handler'
+    assert by_id[inner['parentId']]['traceId'] == echo['traceId']
+    assert children(inner) == ['innermost']
+    for child in spans:
+        if child['parentId'] is not None:
+            parent = by_id[child['parentId']]
+            assert parent['start'] <= child['start']
+            assert child['start'] + child['duration'] <= parent['start'] + parent['duration']
+
+    in_thread = next(s for s in spans if s['name'] == 'in thread')
+    assert by_id[in_thread['parentId']]['traceId'] == roots['blocking_echo']['traceId']
+    assert children(roots['missing']) == ['decode', 'queue', 'encode', 'write']
+    assert roots['missing']['attributes'] == {'id': 4, 'error': "Method 'missing' not found"}
+
+
+def test_chrome(tmp_path: Path) -> None:
+    tracer = Tracer(tmp_path / 'trace.json')
+    first = tracer.start('first')
+    second = tracer.start('second')
+    child = first.child('child')
+    child.finish()
+    first.finish()
+    third = tracer.start('third')
+    third.finish()
+    second.finish()
+    tracer.flush()
+    # loads even if the server died before closing it
+    events = json.loads((tmp_path / 'trace.json').read_text() + ']')
+    tracer.close()
+    assert json.loads((tmp_path / 'trace.json').read_text()) == events
+    assert [(e['name'], e['ph'], e['tid']) for e in events] == [('child', 'X', 0), ('first', 'X', 0), ('third', 'X', 0),
+                                                                ('second', 'X', 1)]
+    assert all(e['dur'] >= 0 for e in events)